@@ -0,0 +1,322 @@
+"""Production server: preload models once, then fork uvicorn workers
+
+The parent process loads every registered model (sentiment, catalog) with a
+single CPU thread, binds the listening socket and forks ``--workers`` children
+that share the weights copy-on-write. Each worker gets its slice of the cores
+for torch's intra-op pool; the inter-op thread count can only be set before
+torch does any work, so the parent sets it before loading and the workers
+inherit it. Signals:
+
+* SIGTERM / SIGINT: graceful shutdown, in-flight requests get GRACEFUL_TIMEOUT
+* SIGHUP: rolling restart; models are reloaded in the parent, then workers are
+  replaced one at a time, each old one retiring only once its successor is ready
+
+The parent never imports ``backend.app.main``: the app opens SQLite
+connections at import time, and those must not cross a fork.
+Use ``run.py`` for development (single process, auto-reload).
+"""
+import argparse
+import logging
+import os
+import select
+import signal
+import socket
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from backend.app.models.registry import registry
+from backend.app.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+APP = "backend.app.main:app"
+
+
+def available_cores() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def thread_plan(workers: int, intra_op: int = 0, inter_op: int = 1):
+    """(workers, intra-op threads, inter-op threads) so workers x threads fits the cores"""
+    cores = available_cores()
+    workers = workers or cores
+    intra_op = intra_op or max(1, cores // workers)
+    return workers, intra_op, max(1, inter_op)
+
+
+def _set_torch_threads(intra_op: int, inter_op: Optional[int] = None) -> bool:
+    """Returns whether ``inter_op`` was applied (torch refuses it once it has done parallel work)"""
+    # Only touch torch if the sentiment backend already imported it
+    torch = sys.modules.get("torch")
+    if torch is None:
+        return False
+    torch.set_num_threads(intra_op)
+    if inter_op is None:
+        return False
+    try:
+        torch.set_num_interop_threads(inter_op)
+    except RuntimeError as e:
+        logger.warning(f"Could not set torch inter-op threads: {e}")
+        return False
+    return True
+
+
+class Launcher:
+    def __init__(self, host: str, port: int, workers: int, intra_op: int, inter_op: int,
+                 graceful_timeout: float, ready_timeout: float, log_level: str = "info"):
+        self.host = host
+        self.port = port
+        self.num_workers = workers
+        self.intra_op = intra_op
+        self.inter_op = inter_op
+        self.graceful_timeout = graceful_timeout
+        self.ready_timeout = ready_timeout
+        self.log_level = log_level
+        self.socket: Optional[socket.socket] = None
+        self.workers: Dict[int, float] = {}  # pid -> start time
+        self._exited: Dict[int, int] = {}
+        self._stopping = False
+        self._restart_requested = False
+        self.inter_op_applied: Optional[bool] = None  # settled by the first preload
+
+    # Parent
+
+    def preload(self):
+        """Load models in the parent with one thread, so no thread pool exists at fork time"""
+        if settings.SENTIMENT_BACKEND == "torch":
+            try:
+                import torch  # noqa: F401  (imported up front so the thread limit applies to the load)
+            except ImportError:
+                pass
+        if self.inter_op_applied is None:
+            # Process-wide and only settable before any torch work, so before the first load;
+            # forked workers inherit it
+            self.inter_op_applied = _set_torch_threads(1, self.inter_op)
+        else:
+            _set_torch_threads(1)
+        # ONNX Runtime thread pools don't survive fork: onnx sessions are built in the workers
+        skip = {"sentiment"} if settings.SENTIMENT_BACKEND == "onnx" else set()
+        for name in registry.names():
+            if name not in skip:
+                registry.get(name)
+
+    def bind(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET6 if ":" in self.host else socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(2048)
+        sock.set_inheritable(True)
+        return sock
+
+    def run(self) -> int:
+        # Fork-unsafe library state must be settled before the first fork
+        os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+        logger.info(f"Preloading models: {', '.join(registry.names())}")
+        self.preload()
+        self.socket = self.bind()
+        inter_op = f"{self.inter_op} inter-op" if self.inter_op_applied else "default inter-op"
+        logger.info(
+            f"Listening on {self.host}:{self.port} with {self.num_workers} workers "
+            f"({self.intra_op} intra-op / {inter_op} threads each)"
+        )
+
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_hup)
+
+        pending = [self.spawn() for _ in range(self.num_workers)]
+        for pid, ready_fd in pending:
+            if not self.wait_ready(pid, ready_fd):
+                logger.error(f"Worker {pid} failed to start")
+
+        while not self._stopping:
+            if self._restart_requested:
+                self._restart_requested = False
+                self.rolling_restart()
+            self._respawn_dead()
+            time.sleep(0.5)
+
+        self.shutdown()
+        return 0
+
+    def _on_stop(self, signum, frame):
+        self._stopping = True
+
+    def _on_hup(self, signum, frame):
+        self._restart_requested = True
+
+    def spawn(self):
+        """Fork one worker; returns (pid, fd that becomes readable once it serves)"""
+        ready_r, ready_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_r)
+            code = 1
+            try:
+                self._worker(ready_w)
+                code = 0
+            except Exception:
+                logger.exception("Worker crashed")
+            finally:
+                os._exit(code)
+        os.close(ready_w)
+        self.workers[pid] = time.monotonic()
+        return pid, ready_r
+
+    def wait_ready(self, pid: int, ready_fd: int) -> bool:
+        try:
+            readable, _, _ = select.select([ready_fd], [], [], self.ready_timeout)
+            # EOF without the byte means the worker died during startup
+            return bool(readable) and os.read(ready_fd, 1) == b"1"
+        finally:
+            os.close(ready_fd)
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            self._exited[pid] = status
+            self.workers.pop(pid, None)
+
+    def _respawn_dead(self):
+        self._reap()
+        for pid, status in list(self._exited.items()):
+            del self._exited[pid]
+            logger.warning(f"Worker {pid} exited unexpectedly (status {status}), starting a replacement")
+            new_pid, ready_fd = self.spawn()
+            if not self.wait_ready(new_pid, ready_fd):
+                logger.error(f"Replacement worker {new_pid} failed to start")
+                time.sleep(1)
+
+    def stop_worker(self, pid: int, timeout: float):
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        deadline = time.monotonic() + timeout
+        while pid in self.workers and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.05)
+        if pid in self.workers:
+            logger.warning(f"Worker {pid} did not stop within {timeout}s, killing it")
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            os.waitpid(pid, 0)
+            self.workers.pop(pid, None)
+        self._exited.pop(pid, None)
+
+    def rolling_restart(self):
+        logger.info("Rolling restart: reloading models")
+        try:
+            registry.unload()
+            self.preload()
+        except Exception as e:
+            logger.error(f"Model reload failed, keeping current workers: {e}")
+            return
+
+        for old_pid in list(self.workers):
+            if self._stopping:
+                return
+            new_pid, ready_fd = self.spawn()
+            if not self.wait_ready(new_pid, ready_fd):
+                logger.error(f"New worker {new_pid} failed to start, aborting rolling restart")
+                self.stop_worker(new_pid, self.graceful_timeout)
+                return
+            self.stop_worker(old_pid, self.graceful_timeout)
+            logger.info(f"Replaced worker {old_pid} with {new_pid}")
+        logger.info("Rolling restart complete")
+
+    def shutdown(self):
+        logger.info("Shutting down workers...")
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + self.graceful_timeout
+        while self.workers and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.05)
+        for pid in list(self.workers):
+            self.stop_worker(pid, 0)
+        self.socket.close()
+
+    # Worker
+
+    def _worker(self, ready_fd: int):
+        import uvicorn
+
+        # The parent's handlers only make sense in the parent; uvicorn installs its own
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+        os.environ["OMP_NUM_THREADS"] = str(self.intra_op)
+        _set_torch_threads(self.intra_op)
+        settings.ONNX_THREADS = settings.ONNX_THREADS or self.intra_op
+        # The Spotify quota is per app, so each worker gets its share
+        settings.SPOTIFY_RATE_LIMIT /= self.num_workers
+        settings.SPOTIFY_RATE_BURST = max(1, settings.SPOTIFY_RATE_BURST // self.num_workers)
+        # Anything not preloaded (onnx sessions) loads before the worker reports ready
+        settings.MODEL_LOAD_MODE = "eager"
+
+        class Server(uvicorn.Server):
+            async def startup(self, sockets=None):
+                await super().startup(sockets=sockets)
+                if not self.should_exit:
+                    os.write(ready_fd, b"1")
+                os.close(ready_fd)
+
+        config = uvicorn.Config(
+            APP,
+            log_level=self.log_level,
+            timeout_graceful_shutdown=self.graceful_timeout,
+        )
+        Server(config).run(sockets=[self.socket])
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run the Mood Music Recommender API with preloaded, forked workers")
+    parser.add_argument("--host", default=settings.HOST)
+    parser.add_argument("--port", type=int, default=settings.PORT)
+    parser.add_argument("--workers", type=int, default=settings.WORKERS, help="0 = one per core")
+    parser.add_argument("--intra-op-threads", type=int, default=settings.TORCH_INTRAOP_THREADS,
+                        help="torch threads per worker, 0 = cores / workers")
+    parser.add_argument("--inter-op-threads", type=int, default=settings.TORCH_INTEROP_THREADS)
+    parser.add_argument("--graceful-timeout", type=float, default=settings.GRACEFUL_TIMEOUT)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    if not hasattr(os, "fork"):
+        import uvicorn
+        logger.warning("os.fork is unavailable on this platform; running a single worker")
+        uvicorn.run(APP, host=args.host, port=args.port, log_level=args.log_level)
+        return 0
+
+    workers, intra_op, inter_op = thread_plan(args.workers, args.intra_op_threads, args.inter_op_threads)
+    launcher = Launcher(
+        args.host, args.port, workers, intra_op, inter_op,
+        graceful_timeout=args.graceful_timeout,
+        ready_timeout=settings.WORKER_READY_TIMEOUT,
+        log_level=args.log_level,
+    )
+    return launcher.run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
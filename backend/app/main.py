@@ -6,12 +6,15 @@ from pathlib import Path
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, RedirectResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Optional, List, Dict
+from urllib.parse import urlencode
 from dotenv import load_dotenv
 import logging as logger
+import json
 import uvicorn
 
 # Set up paths
@@ -42,20 +45,53 @@ app.mount("/static", StaticFiles(directory=str(PROJECT_ROOT / "frontend" / "asse
 
 # Import services after path setup
 from backend.app.services.spotify_service import SpotifyService
-from backend.app.services.emotion_service import EmotionService
-from backend.app.models.sentiment_analysis import SentimentAnalyzer
+from backend.app.services.emotion_service import EmotionService, cascade_status
+from backend.app.services.feature_cache import FeatureCache
+from backend.app.services.history_service import HistoryService
+from backend.app.services.history_store import HistoryStore
+from backend.app.services.mood_service import MoodService
+from backend.app.services.mood_store import GRANULARITIES, MoodStore
+from backend.app.services.session_service import SessionService
+from backend.app.services.snapshot_service import SnapshotService, history_digest
+from backend.app.services.snapshot_store import SnapshotStore
+from backend.app.services.token_store import TokenStore
+from backend.app.models.registry import registry
+from backend.app.schemas.spotify import RecommendationRequest
+from backend.app.utils.config import settings
+from backend.app.utils.http_cache import ResponseCache
+from backend.app.utils.metrics import MetricsMiddleware, metrics
+from backend.app.utils.profiler import ProfilerMiddleware
 
-spotify_service = SpotifyService()
+# Per-route latency/in-flight metrics and the opt-in request profiler
+app.add_middleware(MetricsMiddleware, router_app=app)
+if settings.PROFILING_ENABLED:
+    app.add_middleware(
+        ProfilerMiddleware,
+        output_dir=settings.PROFILE_DIR,
+        token=settings.PROFILING_TOKEN,
+        interval=settings.PROFILING_INTERVAL_MS / 1000,
+    )
 
-# Initialize services with proper error handling
+# Initialize services with proper error handling. Heavy models are owned by
+# the registry and loaded on startup (see MODEL_LOAD_MODE), not at import.
 try:
     spotify_service = SpotifyService(
         client_id=os.getenv("SPOTIFY_CLIENT_ID"),
         client_secret=os.getenv("SPOTIFY_CLIENT_SECRET"),
-        redirect_uri=os.getenv("SPOTIFY_REDIRECT_URI")
+        redirect_uri=os.getenv("SPOTIFY_REDIRECT_URI"),
+        feature_cache=FeatureCache(settings.FEATURE_CACHE_PATH),
     )
     emotion_service = EmotionService()
-    sentiment_analyzer = SentimentAnalyzer()
+    session_service = SessionService(spotify_service, TokenStore(settings.TOKEN_DB_PATH))
+    history_service = HistoryService(spotify_service, HistoryStore(settings.HISTORY_DB_PATH), sessions=session_service)
+    snapshot_service = SnapshotService(SnapshotStore(settings.SNAPSHOT_DB_PATH), history_service.store)
+    mood_service = MoodService(MoodStore(settings.MOOD_DB_PATH))
+    response_cache = ResponseCache(
+        max_bytes=int(settings.HTTP_CACHE_MAX_MB * 2 ** 20),
+        min_compress_bytes=settings.HTTP_COMPRESS_MIN_BYTES,
+        gzip_level=settings.HTTP_GZIP_LEVEL,
+        brotli_quality=settings.HTTP_BROTLI_QUALITY,
+    )
 except Exception as e:
     print(f"Failed to initialize services: {str(e)}")
     raise
@@ -64,29 +100,192 @@ except Exception as e:
 class EmotionInput(BaseModel):
     text: Optional[str] = None
     history: Optional[list] = None
+    user_id: Optional[str] = None  # when set (must be the session's user), the result goes on their mood timeline
+
+class BatchEmotionInput(BaseModel):
+    items: List[EmotionInput]
+    include_scores: bool = False
+
+class NDJSONStreamingResponse(StreamingResponse):
+    """Streams results while the request body is still being read.
+
+    The stock StreamingResponse listens for disconnects on ``receive``, which
+    would race the route for request body chunks. Headers are held back until
+    the first results are ready, so an HTTPException raised before then still
+    gets its status code.
+    """
+    media_type = "application/x-ndjson"
+
+    async def __call__(self, scope, receive, send):
+        body = self.body_iterator.__aiter__()
+        try:
+            first = [await body.__anext__()]
+        except StopAsyncIteration:
+            first = []
+        except HTTPException as e:
+            await JSONResponse({"detail": e.detail}, status_code=e.status_code)(scope, receive, send)
+            return
+
+        async def chunks():
+            for chunk in first:
+                yield chunk
+            async for chunk in body:
+                yield chunk
+
+        self.body_iterator = chunks()
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
 
 class LanguagePreference(BaseModel):
     languages: list[str]
 
+@app.on_event("startup")
+async def load_models():
+    if settings.MODEL_LOAD_MODE == "eager":
+        await run_in_threadpool(registry.load_all)
+    elif settings.MODEL_LOAD_MODE == "background":
+        registry.start_background_load()
+
+@app.on_event("startup")
+async def start_history_sync():
+    if settings.HISTORY_BACKGROUND_SYNC_SECONDS > 0:
+        history_service.start_background_sync(settings.HISTORY_BACKGROUND_SYNC_SECONDS)
+
+@app.on_event("startup")
+async def start_token_refresh():
+    if settings.TOKEN_REFRESH_INTERVAL_SECONDS > 0:
+        session_service.start_background_refresh(settings.TOKEN_REFRESH_INTERVAL_SECONDS)
+
+@app.on_event("shutdown")
+async def close_clients():
+    await history_service.stop_background_sync()
+    await session_service.stop_background_refresh()
+    await mood_service.flush()
+    await spotify_service.aclose()
+
 # Routes
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving"""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: every model is loaded and warmed up"""
+    ready = settings.MODEL_LOAD_MODE == "lazy" or registry.is_ready()
+    body = {"status": "ready" if ready else "loading", "models": registry.status()}
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+async def cache_stats():
+    # Text scores cached while the cascade is off come from the sentiment model alone
+    return {"text_emotion": {**emotion_service.text_cache.stats(), "cascade": cascade_status()},
+            "http_responses": response_cache.stats()}
+
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
 @app.get("/recommendations")
-def get_recommendations(emotion: str):
-    tracks = spotify_service.get_recommendations(emotion)
-    if not tracks:
-        raise HTTPException(status_code=400, detail="Could not fetch recommendations")
-    return {"tracks": tracks}
+def get_recommendations(http_request: Request, emotion: Optional[str] = None, language: Optional[str] = None,
+                        genre: Optional[str] = None, limit: int = 20, offset: int = 0, user_id: Optional[str] = None):
+    request = RecommendationRequest(
+        emotion=emotion,
+        languages=[language] if language else [],
+        genres=[genre] if genre else None,
+        limit=limit,
+        offset=offset,
+        user_id=user_id,
+    )
+    return _recommend(http_request, request)
+
+@app.post("/recommendations")
+def post_recommendations(http_request: Request, request: RecommendationRequest):
+    return _recommend(http_request, request)
+
+def _recommend(http_request: Request, request: RecommendationRequest):
+    _session_user(http_request, request.user_id)
+    limit = max(0, min(request.limit or 0, settings.RECOMMENDATION_MAX_LIMIT))
+    offset = max(request.offset or 0, 0)
+    filtered = bool(request.languages or request.genres)
+
+    # Without an emotion, use the one precomputed for the user
+    emotion, snapshot = request.emotion, None
+    if request.user_id and (not emotion or not filtered):
+        snapshot = snapshot_service.fresh(request.user_id, "/recommendations")
+        emotion = emotion or (snapshot["emotion"] if snapshot is not None else None)
+    # The user's mood is private even when the tracks come from the shared catalog
+    from_snapshot = request.emotion is None and snapshot is not None
+    if not emotion:
+        raise HTTPException(status_code=400, detail="emotion is required (no fresh snapshot for this user)")
+    # The snapshot's list only answers for its own emotion, unfiltered, as far as it goes
+    if snapshot is not None and (snapshot["emotion"] != emotion or filtered
+                                 or offset + limit > len(snapshot["tracks"])):
+        snapshot = None
+
+    def build():
+        if snapshot is not None:
+            return {"emotion": emotion, "tracks": snapshot["tracks"][offset:offset + limit],
+                    "limit": limit, "offset": request.offset or 0}
+        try:
+            tracks = spotify_service.get_recommendations(
+                emotion,
+                language=request.languages or None,
+                limit=limit,
+                offset=offset,
+                genre=request.genres or None,
+            )
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if not tracks and not request.offset:
+            raise HTTPException(status_code=400, detail="Could not fetch recommendations")
+        return {"emotion": emotion, "tracks": tracks, "limit": limit, "offset": request.offset or 0}
+
+    # Same query against the same catalog build -> same bytes, served from the response cache
+    try:
+        version = spotify_service.catalog.version
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    key = "recommendations|" + json.dumps(
+        [version, emotion, request.languages or None, request.genres or None, limit, request.offset or 0]
+    )
+    if snapshot is not None:
+        # A user's own list: bytes keyed by the user and snapshot
+        key = "recommendations|" + json.dumps(
+            [version, "snapshot", request.user_id, snapshot["computed_at"], emotion, limit, request.offset or 0]
+        )
+    private = from_snapshot or snapshot is not None
+    return response_cache.respond(
+        http_request, key, build, "/recommendations",
+        cache_control=settings.USER_RECOMMENDATIONS_CACHE_CONTROL if private else settings.RECOMMENDATIONS_CACHE_CONTROL,
+        # Checked against the session, so shared caches must not answer for another session
+        vary=SESSION_VARY if request.user_id else "",
+    )
 
 @app.post("/detect-emotion")
-async def detect_emotion(data: EmotionInput):
+async def detect_emotion(request: Request, data: EmotionInput):
+    await run_in_threadpool(_session_user, request, data.user_id)
     try:
         if data.text:
-            emotion = emotion_service.detect_emotion_from_text(data.text)
+            emotion = await emotion_service.detect_emotion_from_text_async(data.text)
+            mood_service.record(data.user_id, emotion, "text")
         elif data.history:
-            emotion = emotion_service.predict_emotion_from_history(data.history)
+            snapshot = None
+            if data.user_id:
+                snapshot = await run_in_threadpool(snapshot_service.fresh, data.user_id, "/detect-emotion")
+            # Only valid for the tracks it was computed from, not whatever history the client sent
+            if snapshot is not None and snapshot.get("history_digest") == history_digest(data.history):
+                emotion = snapshot["emotion"]
+                mood_service.record(data.user_id, emotion, "history", data.history)
+            else:
+                history = await spotify_service.resolve_history_features(data.history)
+                emotion = emotion_service.predict_emotion_from_history(history)
+                mood_service.record(data.user_id, emotion, "history", history)
         else:
             raise HTTPException(status_code=400, detail="Either text or history must be provided")
         
@@ -94,6 +293,141 @@ async def detect_emotion(data: EmotionInput):
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.post("/detect-emotion/batch")
+async def detect_emotion_batch(request: Request, include_scores: bool = False):
+    """Score many texts/histories at once.
+
+    Send a JSON body ({"items": [...], "include_scores": bool}) for small jobs,
+    or Content-Type: application/x-ndjson with one EmotionInput per line to
+    stream large jobs; NDJSON results are streamed back line by line.
+    """
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type:
+        return NDJSONStreamingResponse(_stream_ndjson_emotions(request, include_scores))
+
+    try:
+        data = BatchEmotionInput.parse_obj(await request.json())
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if len(data.items) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.BATCH_MAX_ITEMS} items per request; use application/x-ndjson for larger jobs",
+        )
+
+    user_id = await run_in_threadpool(_session_user, request)
+    if any(item.user_id not in (None, user_id) for item in data.items):
+        raise HTTPException(status_code=401 if user_id is None else 403, detail="user_id does not match the session")
+
+    try:
+        items = await _resolve_item_features([item.dict() for item in data.items])
+        results = await emotion_service.detect_emotions_batch(items, data.include_scores or include_scores)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    _record_moods(items, results)
+    return {"status": "success", "results": results}
+
+def _record_moods(items, results):
+    for item, result in zip(items, results):
+        if item.get("user_id") and "emotion" in result:
+            source = "text" if item.get("text") else "history"
+            mood_service.record(item["user_id"], result["emotion"], source, item.get("history"))
+
+async def _resolve_item_features(items):
+    """Fill in audio features for history items that only carry track ids"""
+    histories = [item for item in items if not item.get("text") and item.get("history")]
+    if histories:
+        resolved = await spotify_service.resolve_history_features([t for item in histories for t in item["history"]])
+        offset = 0
+        for item in histories:
+            item["history"], offset = resolved[offset:offset + len(item["history"])], offset + len(item["history"])
+    return items
+
+async def _stream_ndjson_emotions(request: Request, include_scores: bool):
+    index = 0
+    chunk = []
+    buffer = b""
+    # Headers are already sent by the time lines are read, so mismatches are per-item errors
+    session_user = await run_in_threadpool(_session_user, request)
+
+    async def flush(chunk, start):
+        items = []
+        for line in chunk:
+            try:
+                item = EmotionInput.parse_raw(line).dict()
+            except Exception as e:
+                items.append({"error": str(e)})
+                continue
+            if item["user_id"] not in (None, session_user):
+                items.append({"error": "user_id does not match the session"})
+            else:
+                items.append(item)
+        parsed = [item for item in items if "error" not in item]
+        try:
+            parsed = await _resolve_item_features(parsed)
+            results = await emotion_service.detect_emotions_batch(parsed, include_scores)
+        except Exception as e:
+            # The stream is already under way: fail this chunk's items, keep going with the next
+            results = [{"error": str(e)}] * len(parsed)
+        else:
+            _record_moods(parsed, results)
+        scored = iter(results)
+        out = []
+        for offset, item in enumerate(items):
+            result = item if "error" in item else next(scored)
+            out.append(json.dumps({"index": start + offset, **result}) + "\n")
+        return "".join(out)
+
+    async for body in request.stream():
+        buffer += body
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if len(line) > settings.BATCH_MAX_BYTES:
+                break
+            if not line.strip():
+                continue
+            chunk.append(line)
+            if len(chunk) >= settings.NDJSON_CHUNK_SIZE:
+                yield await flush(chunk, index)
+                index += len(chunk)
+                chunk = []
+        else:
+            if len(buffer) <= settings.BATCH_MAX_BYTES:
+                continue
+        # An oversized line: reject the request while nothing has been sent, else end the stream on it
+        detail = f"NDJSON lines are limited to {settings.BATCH_MAX_BYTES} bytes"
+        if index == 0:
+            raise HTTPException(status_code=413, detail=detail)
+        if chunk:
+            yield await flush(chunk, index)
+            index += len(chunk)
+        yield json.dumps({"index": index, "error": detail}) + "\n"
+        return
+
+    if buffer.strip():
+        chunk.append(buffer)
+    if chunk:
+        yield await flush(chunk, index)
+
+@app.get("/mood/timeline")
+async def mood_timeline(request: Request, user_id: Optional[str] = None, days: float = 30, limit: int = 100):
+    """The signed-in user's detected moods, newest first"""
+    user_id = await _require_session_user(request, user_id)
+    days = min(max(days, 0), settings.MOOD_MAX_DAYS)
+    limit = min(max(limit, 1), 1000)
+    events = await run_in_threadpool(mood_service.timeline, user_id, days, limit)
+    return {"status": "success", "user_id": user_id, "events": events}
+
+@app.get("/mood/rollups")
+async def mood_rollups(request: Request, user_id: Optional[str] = None, granularity: str = "day", days: float = 30):
+    """The signed-in user's emotion counts and mean audio features per hour/day/week, from precomputed buckets"""
+    user_id = await _require_session_user(request, user_id)
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity must be one of {', '.join(GRANULARITIES)}")
+    days = min(max(days, 0), settings.MOOD_MAX_DAYS)
+    rollups = await run_in_threadpool(mood_service.rollups, user_id, granularity, days)
+    return {"status": "success", "user_id": user_id, **rollups}
+
 @app.get("/spotify-auth")
 async def spotify_auth():
     try:
@@ -104,26 +438,85 @@ async def spotify_auth():
 
 @app.get("/spotify-callback")
 async def spotify_callback(code: str, state: Optional[str] = None):
+    # Tokens stay on the server; the browser only gets an opaque session cookie
     try:
-        token_data = spotify_service.get_access_token(code)
-        # Redirect to frontend with token in URL fragment
-        access_token = token_data['access_token']
-        frontend_url = f"https://b390-2401-4900-4df9-d2da-782a-ec44-aee4-8c34.ngrok-free.app/spotify-callback#access_token={access_token}&token_type={token_data['token_type']}&expires_in={token_data['expires_in']}"
-        
-        # Log the URL you're redirecting to
-        print(f"Redirecting to: {frontend_url}")
-        
-        return RedirectResponse(url=frontend_url)
+        session_id, _ = await session_service.login(code)
     except Exception as e:
-        error_url = f"https://b390-2401-4900-4df9-d2da-782a-ec44-aee4-8c34.ngrok-free.app/spotify-callback?error={str(e)}"
-        return RedirectResponse(url=error_url)
+        return RedirectResponse(url=f"{settings.FRONTEND_URL}/?{urlencode({'error': str(e)})}")
+
+    response = RedirectResponse(url=f"{settings.FRONTEND_URL}/?spotify=connected")
+    response.set_cookie(
+        settings.SESSION_COOKIE,
+        session_id,
+        max_age=int(settings.SESSION_TTL_DAYS * 86400),
+        httponly=True,
+        secure=settings.SESSION_COOKIE_SECURE,
+        samesite="lax",
+    )
+    return response
 
+# Request headers a session can come from, for Vary on responses that depend on it
+SESSION_VARY = "Cookie, X-Session-ID"
+
+def _session_id(request: Request) -> Optional[str]:
+    return request.cookies.get(settings.SESSION_COOKIE) or request.headers.get("x-session-id")
+
+def _session_user(request: Request, claimed: Optional[str] = None) -> Optional[str]:
+    """The signed-in user (blocking); a ``claimed`` user_id must be that user"""
+    session_id = _session_id(request)
+    user_id = session_service.session_user(session_id) if session_id else None
+    if claimed and claimed != user_id:
+        raise HTTPException(status_code=401 if user_id is None else 403, detail="user_id does not match the session")
+    return user_id
+
+async def _require_session_user(request: Request, claimed: Optional[str] = None) -> str:
+    user_id = await run_in_threadpool(_session_user, request, claimed)
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Not connected to Spotify")
+    return user_id
+
+@app.get("/session")
+async def get_session(request: Request):
+    session_id = _session_id(request)
+    session = await session_service.get_token(session_id) if session_id else None
+    return {"connected": session is not None, "user_id": session[0] if session else None}
+
+@app.post("/spotify-logout")
+async def spotify_logout(request: Request):
+    session_id = _session_id(request)
+    if session_id:
+        await session_service.logout(session_id)
+    response = JSONResponse({"status": "success"})
+    response.delete_cookie(settings.SESSION_COOKIE)
+    return response
 
 @app.get("/user-history")
-async def get_user_history(token: str):
+async def get_user_history(request: Request, token: Optional[str] = None, limit: Optional[int] = None):
+    """History for the session (cookie or X-Session-ID header), or for a raw user token"""
+    user_id = session_id = None
+    # Never more than is stored; the limit is also part of the cache key
+    limit = max(1, min(limit, settings.HISTORY_MAX_ITEMS)) if limit else None
     try:
-        history = spotify_service.get_user_listening_history(token)
-        return {"status": "success", "history": history}
+        if not token:
+            session_id = _session_id(request)
+            session = await session_service.get_token(session_id) if session_id else None
+            if session is None:
+                raise HTTPException(status_code=401, detail="Not connected to Spotify")
+            user_id, token = session
+
+        async def build():
+            history = await history_service.get_history(token, limit, user_id=user_id, session_id=session_id)
+            return {"status": "success", "history": history}
+
+        # Sessions are already authenticated, so their bytes can be reused per user
+        key = f"user-history|{user_id}|{limit}" if user_id else None
+        return await response_cache.respond_async(
+            request, key, build, "/user-history",
+            cache_control=settings.USER_HISTORY_CACHE_CONTROL, ttl=settings.USER_HISTORY_CACHE_SECONDS,
+            vary=SESSION_VARY if session_id else "",
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
+
+from backend.app.utils.metrics import metrics
+
+BATCH_SIZE = metrics.histogram(
+    "mobrec_batch_size", "Items per micro-batch forward pass", ("batcher",), buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+BATCH_QUEUE_WAIT = metrics.histogram(
+    "mobrec_batch_queue_wait_seconds", "Time from enqueue until the item's batch is dispatched", ("batcher",)
+)
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """Collects concurrent calls into batches for a function that takes a list.
+
+    Items are gathered for up to ``window_ms`` (or until ``max_batch_size`` are
+    waiting), sorted by ``size_key`` so similar lengths share a batch, and run
+    on a single worker thread so the event loop is never blocked.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 32,
+        window_ms: float = 5.0,
+        size_key: Callable[[Any], int] = len,
+        max_pending_batches: int = 4,
+        name: str = "default",
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.window = max(window_ms, 0) / 1000.0
+        self.size_key = size_key
+        self.max_pending = max_batch_size * max(max_pending_batches, 1)
+        self.name = name
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="micro-batcher")
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        metrics.callback(
+            "mobrec_batch_queue_depth", "Items waiting for a micro-batch",
+            lambda: {(self.name,): self._queue.qsize() if self._queue is not None else 0}, ("batcher",),
+        )
+
+    async def submit(self, item: Any) -> Any:
+        """Queue one item and wait for its result"""
+        self._ensure_worker()
+        future = self._loop.create_future()
+        await self._queue.put((item, future, self._loop.time()))
+        return await future
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            pending = [await self._queue.get()]
+            deadline = self._loop.time() + self.window
+
+            # Wait for the window to close or a full batch to arrive
+            while len(pending) < self.max_batch_size:
+                timeout = deadline - self._loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    pending.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Pick up anything else that queued while we were waiting
+            while len(pending) < self.max_pending and not self._queue.empty():
+                pending.append(self._queue.get_nowait())
+
+            now = self._loop.time()
+            for _, _, queued_at in pending:
+                BATCH_QUEUE_WAIT.observe(now - queued_at, batcher=self.name)
+            pending = [(item, future) for item, future, _ in pending if not future.done()]
+            pending.sort(key=lambda entry: self.size_key(entry[0]))
+            for start in range(0, len(pending), self.max_batch_size):
+                await self._dispatch(pending[start:start + self.max_batch_size])
+
+    async def _dispatch(self, batch):
+        items = [item for item, _ in batch]
+        BATCH_SIZE.observe(len(items), batcher=self.name)
+        try:
+            results = await self._loop.run_in_executor(self._executor, self.batch_fn, items)
+            if len(results) != len(items):
+                raise RuntimeError(f"Batch function returned {len(results)} results for {len(items)} items")
+        except Exception as e:
+            logger.error(f"Micro-batch of {len(items)} failed: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,41 @@
+from typing import Dict, List
+
+import numpy as np
+
+# Emotion labels, in scoring order (ties go to the earlier one)
+EMOTIONS = ["happy", "sad", "angry", "calm", "energetic", "romantic"]
+
+# Audio features used to place a track or a listening history in mood space
+FEATURES = ["danceability", "energy", "valence", "tempo"]
+FEATURE_DEFAULTS = np.array([0.5, 0.5, 0.5, 100.0])
+# Differences are divided by this before summing, so tempo (BPM) is comparable
+FEATURE_SCALE = np.array([1.0, 1.0, 1.0, 200.0])
+
+# Audio features mapping to emotions: the ideal value of each feature per emotion
+FEATURE_WEIGHTS = {
+    'danceability': {'happy': 0.8, 'sad': 0.2, 'angry': 0.5, 'calm': 0.3, 'energetic': 0.9, 'romantic': 0.6},
+    'energy': {'happy': 0.7, 'sad': 0.3, 'angry': 0.9, 'calm': 0.2, 'energetic': 0.95, 'romantic': 0.5},
+    'valence': {'happy': 0.9, 'sad': 0.1, 'angry': 0.4, 'calm': 0.6, 'energetic': 0.7, 'romantic': 0.8},
+    'tempo': {'happy': 120, 'sad': 70, 'angry': 140, 'calm': 80, 'energetic': 130, 'romantic': 100}
+}
+
+
+def build_profile_matrix(feature_weights: Dict[str, Dict[str, float]], emotions: List[str]) -> np.ndarray:
+    """Emotion x feature matrix of ideal feature values"""
+    return np.array([[feature_weights[f][e] for f in FEATURES] for e in emotions], dtype=float)
+
+
+def pack_history(history: List[Dict]) -> np.ndarray:
+    """Tracks x features array; missing or null features fall back to FEATURE_DEFAULTS"""
+    packed = np.array([[t.get(f) for f in FEATURES] for t in history], dtype=float).reshape(len(history), len(FEATURES))
+    return np.where(np.isnan(packed), FEATURE_DEFAULTS, packed)
+
+
+def similarity(features: np.ndarray, profiles: np.ndarray) -> np.ndarray:
+    """Similarity of each row of `features` (N x F) to each emotion profile (E x F): N x E.
+
+    Each feature contributes 1 - |ideal - actual| / scale, so a perfect match
+    scores len(FEATURES).
+    """
+    distance = np.abs(features[:, None, :] - profiles[None, :, :]) / FEATURE_SCALE
+    return len(FEATURES) - distance.sum(axis=-1)
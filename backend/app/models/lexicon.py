@@ -0,0 +1,161 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class _CompiledLexicon:
+    """One immutable, compiled version of a lexicon file"""
+
+    def __init__(self, version: str, pattern, exact: Dict[str, list], prefixes: Dict[str, list], min_prefix: int):
+        self.version = version
+        self.pattern = pattern
+        self.exact = exact
+        self.prefixes = prefixes
+        self.min_prefix = min_prefix
+
+    def lookup(self, matched: str):
+        if matched in self.exact:
+            return matched, self.exact[matched]
+        # Matched a prefix term plus a word tail: find the longest prefix term
+        for end in range(len(matched), self.min_prefix - 1, -1):
+            if matched[:end] in self.prefixes:
+                return matched[:end] + "*", self.prefixes[matched[:end]]
+        return None, None
+
+
+# Trie node keys are characters; these non-string keys mark where a term ends
+_EXACT_END = 0
+_PREFIX_END = 1
+
+
+def _trie_pattern(node: Dict) -> str:
+    # Children first so the longest term wins
+    children = sorted((ch, child) for ch, child in node.items() if isinstance(ch, str))
+    alternatives = [re.escape(ch) + _trie_pattern(child) for ch, child in children]
+    if _PREFIX_END in node:
+        alternatives.append(r"\w*")
+    if _EXACT_END in node:
+        alternatives.append(r"(?!\w)")
+    if len(alternatives) == 1:
+        return alternatives[0]
+    return "(?:" + "|".join(alternatives) + ")"
+
+
+def compile_lexicon(data: Dict, emotions: List[str], digest: str = "") -> _CompiledLexicon:
+    """Compile parsed lexicon JSON; ``digest`` (of the file's bytes) goes into the version"""
+    exact: Dict[str, list] = {}
+    prefixes: Dict[str, list] = {}
+    trie: Dict = {}
+
+    for language, table in data.get("languages", {}).items():
+        for emotion, terms in table.items():
+            if emotion not in emotions:
+                raise ValueError(f"Lexicon language '{language}' uses unknown emotion '{emotion}'")
+            column = emotions.index(emotion)
+            for term, weight in terms.items():
+                term = " ".join(term.lower().split())
+                is_prefix = term.endswith("*")
+                term = term.rstrip("*")
+                if not term:
+                    continue
+                (prefixes if is_prefix else exact).setdefault(term, []).append((column, float(weight)))
+
+                node = trie
+                for ch in term:
+                    node = node.setdefault(ch, {})
+                node[_PREFIX_END if is_prefix else _EXACT_END] = True
+
+    pattern = re.compile(r"(?<!\w)" + _trie_pattern(trie)) if trie else None
+    min_prefix = min((len(p) for p in prefixes), default=1)
+    # The declared version alone misses edits that forget to bump it
+    version = str(data.get("version", "0")) + (f"+{digest}" if digest else "")
+    return _CompiledLexicon(version, pattern, exact, prefixes, min_prefix)
+
+
+class Lexicon:
+    """Weighted emotion keyword matcher compiled once from a versioned JSON file.
+
+    All terms of all languages are folded into one prefix-trie regex, so a text
+    is scanned in a single pass whatever the lexicon size. The file is re-read
+    when its mtime changes (checked at most every ``reload_seconds``).
+    """
+
+    def __init__(self, path: Path, emotions: List[str], reload_seconds: float = 0):
+        self.path = Path(path)
+        self.emotions = list(emotions)
+        self.reload_seconds = reload_seconds
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked_at = 0.0
+        self._compiled = self._load()
+
+    @property
+    def version(self) -> str:
+        return self._compiled.version
+
+    def _load(self) -> _CompiledLexicon:
+        self._mtime = os.path.getmtime(self.path)
+        raw = self.path.read_bytes()
+        digest = hashlib.blake2b(raw, digest_size=8).hexdigest()
+        compiled = compile_lexicon(json.loads(raw), self.emotions, digest)
+        logger.info(f"Loaded lexicon {compiled.version} ({len(compiled.exact) + len(compiled.prefixes)} terms)")
+        return compiled
+
+    def reload(self):
+        """Recompile from disk; on error the current lexicon stays in place"""
+        with self._lock:
+            try:
+                self._compiled = self._load()
+            except Exception as e:
+                logger.error(f"Failed to reload lexicon {self.path}: {e}")
+
+    def maybe_reload(self):
+        if not self.reload_seconds:
+            return
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_seconds:
+            return
+        self._checked_at = now
+        try:
+            changed = os.path.getmtime(self.path) != self._mtime
+        except OSError:
+            return
+        if changed:
+            self.reload()
+
+    def matches(self, text: str) -> List[Tuple[str, list]]:
+        """Distinct (term, [(emotion column, weight), ...]) found in text"""
+        compiled = self._compiled
+        if compiled.pattern is None:
+            return []
+        found = {}
+        for match in compiled.pattern.finditer(" ".join(text.lower().split())):
+            term, weights = compiled.lookup(match.group(0))
+            if term is not None:
+                found[term] = weights
+        return list(found.items())
+
+    def score(self, text: str) -> np.ndarray:
+        """Per-emotion keyword score, each distinct term counted once"""
+        scores = np.zeros(len(self.emotions))
+        for _, weights in self.matches(text):
+            for column, weight in weights:
+                scores[column] += weight
+        return scores
+
+    def score_batch(self, texts: List[str]) -> np.ndarray:
+        self.maybe_reload()
+        scores = np.zeros((len(texts), len(self.emotions)))
+        for row, text in enumerate(texts):
+            scores[row] = self.score(text)
+        return scores
@@ -0,0 +1,120 @@
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRegistry:
+    """Process-wide home for heavy models.
+
+    Each registered model is built at most once, on first ``get`` or via
+    ``load_all``/``start_background_load``, and warmed up with one inference so
+    the first real request doesn't pay for lazy initialisation.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._warmups: Dict[str, Optional[Callable[[Any], Any]]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._states: Dict[str, str] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._background: Optional[threading.Thread] = None
+
+    def register(self, name: str, factory: Callable[[], Any], warmup: Optional[Callable[[Any], Any]] = None):
+        self._factories[name] = factory
+        self._warmups[name] = warmup
+        self._states[name] = "pending"
+        self._locks[name] = threading.Lock()
+
+    def get(self, name: str) -> Any:
+        """Return the shared instance, loading it on first use"""
+        if name in self._instances:
+            return self._instances[name]
+        if name not in self._factories:
+            raise KeyError(f"Unknown model: {name}")
+
+        with self._locks[name]:
+            if name not in self._instances:
+                self._load(name)
+        return self._instances[name]
+
+    def _load(self, name: str):
+        self._states[name] = "loading"
+        try:
+            logger.info(f"Loading model '{name}'...")
+            instance = self._factories[name]()
+            warmup = self._warmups[name]
+            if warmup is not None:
+                warmup(instance)
+        except Exception as e:
+            self._states[name] = f"failed: {e}"
+            logger.error(f"Failed to load model '{name}': {e}")
+            raise
+        self._instances[name] = instance
+        self._states[name] = "ready"
+        logger.info(f"Model '{name}' ready.")
+
+    def load_all(self):
+        for name in self._factories:
+            self.get(name)
+
+    def start_background_load(self) -> threading.Thread:
+        """Load every model on a daemon thread so the server can accept probes meanwhile"""
+        if self._background is None or not self._background.is_alive():
+            def run():
+                try:
+                    self.load_all()
+                except Exception:
+                    pass  # state already records the failure
+            self._background = threading.Thread(target=run, name="model-loader", daemon=True)
+            self._background.start()
+        return self._background
+
+    def names(self):
+        return list(self._factories)
+
+    def unload(self):
+        """Forget every instance so the next load builds fresh ones (e.g. after new weights are deployed)"""
+        for name in self._factories:
+            with self._locks[name]:
+                self._instances.pop(name, None)
+                self._states[name] = "pending"
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._instances
+
+    def is_ready(self) -> bool:
+        return all(state == "ready" for state in self._states.values())
+
+    def status(self) -> Dict[str, str]:
+        return dict(self._states)
+
+
+def _create_sentiment_analyzer():
+    from backend.app.models.sentiment_analysis import SentimentAnalyzer
+    return SentimentAnalyzer()
+
+
+def _load_text_model():
+    from backend.app.models.text_model import TextEmotionModel
+    from backend.app.utils.config import settings
+    # None until backend/train_model.py has been run
+    return TextEmotionModel.load(settings.TEXT_MODEL_PATH, settings.VECTORIZER_PATH)
+
+
+def _load_catalog():
+    from backend.app.services.catalog import TrackCatalog
+    from backend.app.utils.config import settings
+    return TrackCatalog.load(settings.CATALOG_PATH)
+
+
+registry = ModelRegistry()
+registry.register(
+    "sentiment",
+    _create_sentiment_analyzer,
+    # strict: a model that can't run inference must fail readiness, not warm up on the fallback
+    warmup=lambda analyzer: analyzer.analyze_batch(["warming up the model", "ok"], strict=True),
+)
+registry.register("text_model", _load_text_model)
+registry.register("catalog", _load_catalog)
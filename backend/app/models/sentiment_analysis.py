@@ -1,18 +1,96 @@
-from transformers import pipeline
-from typing import Optional
+from typing import List, Optional
+import numpy as np
+from backend.app.models.sentiment_backends import MAX_LENGTH, create_backend, token_windows
+from backend.app.utils.config import settings
+from backend.app.utils.metrics import STAGE_SECONDS
 
 class SentimentAnalyzer:
-    def __init__(self):
-        # Initialize the sentiment analysis pipeline
-        self.analyzer = pipeline("sentiment-analysis", model="distilbert-base-uncased-finetuned-sst-2-english")
+    def __init__(self, backend=None):
+        # Initialize the inference backend (torch or onnx, see SENTIMENT_BACKEND)
+        self.backend = backend or create_backend(
+            settings.SENTIMENT_BACKEND,
+            model_name=settings.SENTIMENT_MODEL_NAME,
+            onnx_dir=settings.ONNX_MODEL_DIR,
+            quantized=settings.ONNX_QUANTIZED,
+            num_threads=settings.ONNX_THREADS,
+        )
+        self.window = min(settings.SENTIMENT_WINDOW_TOKENS, MAX_LENGTH)
+        self.overlap = settings.SENTIMENT_WINDOW_OVERLAP
+        self.max_tokens = settings.SENTIMENT_MAX_TOKENS
+        self.aggregation = settings.SENTIMENT_AGGREGATION
+        if self.aggregation not in ("mean", "max"):
+            raise ValueError(f"Unknown SENTIMENT_AGGREGATION: {self.aggregation}")
+
+    @property
+    def windowed(self) -> bool:
+        """Whether the backend scores token windows (otherwise texts are cut at 512 characters)"""
+        return hasattr(self.backend, "predict_windows") and getattr(self.backend, "tokenizer", None) is not None
+
+    @property
+    def version(self) -> str:
+        if not self.windowed:
+            return self.backend.version
+        return f"{self.backend.version}|{self.window}/{self.overlap}/{self.max_tokens}/{self.aggregation}"
 
     def analyze(self, text: str) -> str:
+        return self.analyze_batch([text])[0]
+
+    def analyze_batch(self, texts: List[str], strict: bool = False) -> List[str]:
+        """Run one batched forward pass over several texts
+
+        If inference fails the texts come back NEUTRAL, or with ``strict``
+        the error is raised, for callers that must not mistake the fallback
+        for a real answer (e.g. before caching it).
+        """
+        labels = ["NEUTRAL"] * len(texts)
+        indices = [i for i, text in enumerate(texts) if text.strip()]
+        if not indices:
+            return labels
+
         try:
-            if not text.strip():
-                return "NEUTRAL"
-                
-            result = self.analyzer(text[:512])  # Limit to 512 tokens
-            return result[0]["label"]
+            with STAGE_SECONDS.time(stage="sentiment_inference"):
+                if self.windowed:
+                    probs = self.predict_long([texts[i] for i in indices])
+                else:
+                    probs = self.backend.predict_proba([texts[i][:512] for i in indices])
         except Exception as e:
+            if strict:
+                raise
             print(f"Error in sentiment analysis: {e}")
-            return "NEUTRAL"
\ No newline at end of file
+            return labels
+
+        for i, row in zip(indices, probs.argmax(axis=1)):
+            labels[i] = self.backend.labels[row]
+        return labels
+
+    def predict_long(self, texts: List[str]) -> np.ndarray:
+        """Per-text probabilities from overlapping token windows, however long the text
+
+        Every window of every text is scored in length-sorted batches, so a
+        long document costs one pass per window and short texts in the same
+        batch aren't padded to its length.
+        """
+        windows, owners, lengths = token_windows(
+            self.backend.tokenizer, texts, window=self.window, overlap=self.overlap, max_tokens=self.max_tokens
+        )
+        window_probs = np.zeros((len(windows), len(self.backend.labels)))
+        order = sorted(range(len(windows)), key=lambda i: len(windows[i]))
+        step = max(settings.SENTIMENT_WINDOW_BATCH, 1)
+        for start in range(0, len(order), step):
+            batch = order[start:start + step]
+            window_probs[batch] = self.backend.predict_windows([windows[i] for i in batch])
+
+        probs = np.zeros((len(texts), len(self.backend.labels)))
+        if self.aggregation == "max":
+            # Each text takes the distribution of its single most confident window
+            confidence = window_probs.max(axis=1)
+            best = {}
+            for i, owner in enumerate(owners):
+                if owner not in best or confidence[i] > confidence[best[owner]]:
+                    best[owner] = i
+            for owner, i in best.items():
+                probs[owner] = window_probs[i]
+        else:
+            np.add.at(probs, owners, window_probs * lengths[:, None])
+            probs /= np.bincount(owners, weights=lengths, minlength=len(texts))[:, None]
+        return probs
@@ -0,0 +1,258 @@
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_NAME = "distilbert-base-uncased-finetuned-sst-2-english"
+MAX_LENGTH = 512
+
+
+# Upper bound on characters per token; text past max_tokens * this is never tokenized
+CHARS_PER_TOKEN_BOUND = 10
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    shifted = logits - logits.max(axis=-1, keepdims=True)
+    exp = np.exp(shifted)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+def _files_fingerprint(paths: List[Path]) -> str:
+    """Cheap identity of weight files (name, size, mtime), for cache versions"""
+    h = hashlib.blake2b(digest_size=6)
+    for path in paths:
+        stat = path.stat()
+        h.update(f"{path.name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return h.hexdigest()
+
+
+def _weights_fingerprint(model_name: str, model) -> str:
+    """Weight files of a local model directory, else the hub revision they were downloaded from"""
+    local = Path(model_name)
+    if local.is_dir():
+        return _files_fingerprint(sorted(p for p in local.iterdir() if p.suffix in (".bin", ".safetensors")))
+    return getattr(model.config, "_commit_hash", None) or "unknown"
+
+
+def _pad(windows: List[List[int]], pad_id: int):
+    """Right-pad token windows into (input_ids, attention_mask) int64 arrays"""
+    width = max(len(w) for w in windows)
+    ids = np.full((len(windows), width), pad_id, dtype=np.int64)
+    mask = np.zeros((len(windows), width), dtype=np.int64)
+    for row, window in enumerate(windows):
+        ids[row, :len(window)] = window
+        mask[row, :len(window)] = 1
+    return ids, mask
+
+
+def token_windows(tokenizer, texts: List[str], window: int = MAX_LENGTH, overlap: int = 64,
+                  max_tokens: int = 4096):
+    """Tokenize each text once and cut it into overlapping model-sized windows
+
+    Returns ``(windows, owners, lengths)``: token ids with special tokens
+    added, the index of the text each window came from, and how many of the
+    text's tokens each window holds. Texts are capped at ``max_tokens``
+    tokens, so cost is linear in length up to a fixed bound.
+    """
+    content = window - tokenizer.num_special_tokens_to_add()
+    overlap = min(overlap, content // 2)
+    stride = content - overlap
+    encoded = tokenizer(
+        [t[:max_tokens * CHARS_PER_TOKEN_BOUND] for t in texts],
+        add_special_tokens=False,
+        truncation=False,
+        verbose=False,
+    )["input_ids"]
+
+    windows, owners, lengths = [], [], []
+    for owner, ids in enumerate(encoded):
+        ids = ids[:max_tokens]
+        # The last window ends at the final token, so nothing is left uncovered
+        starts = range(0, max(len(ids) - overlap, 1), stride)
+        for start in starts:
+            chunk = ids[start:start + content]
+            windows.append(tokenizer.build_inputs_with_special_tokens(chunk))
+            owners.append(owner)
+            lengths.append(max(len(chunk), 1))
+    return windows, np.array(owners), np.array(lengths, dtype=np.float64)
+
+
+class TorchSentimentBackend:
+    """Reference backend: the Hugging Face model running in PyTorch (fp32)"""
+
+    name = "torch"
+
+    def __init__(self, model_name: str = DEFAULT_MODEL_NAME):
+        import torch
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+        self._torch = torch
+        self.model_name = model_name
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModelForSequenceClassification.from_pretrained(model_name).eval()
+        self.labels = [self.model.config.id2label[i] for i in range(self.model.config.num_labels)]
+        self.version = f"torch:{model_name}@{_weights_fingerprint(model_name, self.model)}"
+
+    def predict_proba(self, texts: List[str]) -> np.ndarray:
+        encoded = self.tokenizer(texts, padding=True, truncation=True, max_length=MAX_LENGTH, return_tensors="pt")
+        with self._torch.inference_mode():
+            logits = self.model(**encoded).logits
+        return _softmax(logits.numpy())
+
+    def predict_windows(self, windows: List[List[int]]) -> np.ndarray:
+        """Probabilities for already tokenized windows (see ``token_windows``)"""
+        ids, mask = _pad(windows, self.tokenizer.pad_token_id)
+        with self._torch.inference_mode():
+            logits = self.model(
+                input_ids=self._torch.from_numpy(ids), attention_mask=self._torch.from_numpy(mask)
+            ).logits
+        return _softmax(logits.numpy())
+
+
+class OnnxSentimentBackend:
+    """ONNX Runtime backend for a model exported with ``export_onnx``"""
+
+    name = "onnx"
+
+    def __init__(self, model_dir: Path, quantized: bool = False, num_threads: int = 0):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("The onnx backend needs onnxruntime: pip install onnxruntime") from e
+        from transformers import AutoTokenizer
+
+        model_dir = Path(model_dir)
+        model_path = model_dir / ("model.int8.onnx" if quantized else "model.onnx")
+        if not model_path.exists():
+            raise FileNotFoundError(f"{model_path} not found; run backend/export_onnx.py export first")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = AutoTokenizer.from_pretrained(str(model_dir))
+        config = json.loads((model_dir / "config.json").read_text())
+        id2label = {int(k): v for k, v in config["id2label"].items()}
+        self.labels = [id2label[i] for i in range(len(id2label))]
+        self.version = (f"onnx:{config.get('_name_or_path', model_dir.name)}" + (":int8" if quantized else "")
+                        + f"@{_files_fingerprint([model_path])}")
+
+    def predict_proba(self, texts: List[str]) -> np.ndarray:
+        encoded = self.tokenizer(texts, padding=True, truncation=True, max_length=MAX_LENGTH, return_tensors="np")
+        feeds = {k: v.astype(np.int64) for k, v in encoded.items() if k in self.input_names}
+        logits = self.session.run(None, feeds)[0]
+        return _softmax(logits)
+
+    def predict_windows(self, windows: List[List[int]]) -> np.ndarray:
+        """Probabilities for already tokenized windows (see ``token_windows``)"""
+        ids, mask = _pad(windows, self.tokenizer.pad_token_id)
+        feeds = {k: v for k, v in {"input_ids": ids, "attention_mask": mask}.items() if k in self.input_names}
+        return _softmax(self.session.run(None, feeds)[0])
+
+
+def create_backend(name: str, model_name: str = DEFAULT_MODEL_NAME, onnx_dir: Optional[Path] = None,
+                   quantized: bool = False, num_threads: int = 0):
+    if name == "torch":
+        return TorchSentimentBackend(model_name)
+    if name == "onnx":
+        return OnnxSentimentBackend(onnx_dir, quantized=quantized, num_threads=num_threads)
+    raise ValueError(f"Unknown sentiment backend: {name}")
+
+
+def export_onnx(output_dir: Path, model_name: str = DEFAULT_MODEL_NAME, quantize: bool = False, opset: int = 14) -> Path:
+    """Export the PyTorch model to ONNX (and optionally a dynamic int8 copy)"""
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name).eval()
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    model_path = output_dir / "model.onnx"
+    logger.info(f"Exporting {model_name} to {model_path}")
+    torch.onnx.export(
+        model,
+        (sample["input_ids"], sample["attention_mask"]),
+        str(model_path),
+        input_names=["input_ids", "attention_mask"],
+        output_names=["logits"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "sequence"},
+            "attention_mask": {0: "batch", 1: "sequence"},
+            "logits": {0: "batch"},
+        },
+        opset_version=opset,
+    )
+    tokenizer.save_pretrained(str(output_dir))
+    model.config.save_pretrained(str(output_dir))
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantized_path = output_dir / "model.int8.onnx"
+        logger.info(f"Quantizing to {quantized_path}")
+        quantize_dynamic(str(model_path), str(quantized_path), weight_type=QuantType.QInt8)
+        return quantized_path
+    return model_path
+
+
+def check_parity(reference, candidate, texts: List[str], batch_size: int = 32, window: int = MAX_LENGTH,
+                 overlap: int = 64, max_tokens: int = 4096) -> Dict:
+    """Compare labels and scores of two backends over a reference corpus
+
+    Texts are scored both through ``predict_proba`` (cut at 512 tokens) and,
+    cut into ``token_windows``, through ``predict_windows``, the path long
+    texts take in SentimentAnalyzer. Both sides get the reference
+    tokenizer's windows; ``tokenizer_match`` says whether the candidate's
+    tokenizer cuts them the same way.
+    """
+    def batched(predict, items):
+        if not items:
+            return np.zeros((0, len(reference.labels)))
+        return np.concatenate([predict(items[i:i + batch_size]) for i in range(0, len(items), batch_size)])
+
+    windows, owners, _ = token_windows(reference.tokenizer, texts, window=window, overlap=overlap, max_tokens=max_tokens)
+    candidate_windows, _, _ = token_windows(candidate.tokenizer, texts, window=window, overlap=overlap, max_tokens=max_tokens)
+    # Length-sorted, as in SentimentAnalyzer.predict_long, so batches are padded like in serving
+    order = sorted(range(len(windows)), key=lambda i: len(windows[i]))
+    ordered = [windows[i] for i in order]
+
+    ref_probs = np.concatenate([batched(reference.predict_proba, texts), batched(reference.predict_windows, ordered)])
+    cand_probs = np.concatenate([batched(candidate.predict_proba, texts), batched(candidate.predict_windows, ordered)])
+    # Row -> (path, text index)
+    rows = [("truncated", i) for i in range(len(texts))] + [("windowed", int(owners[i])) for i in order]
+
+    ref_labels = ref_probs.argmax(axis=1)
+    cand_labels = cand_probs.argmax(axis=1)
+    diff = np.abs(ref_probs - cand_probs).max(axis=1)
+    mismatches = np.flatnonzero(ref_labels != cand_labels)
+
+    return {
+        "reference": reference.version,
+        "candidate": candidate.version,
+        "samples": len(texts),
+        "windows": len(windows),
+        "tokenizer_match": candidate_windows == windows,
+        "label_agreement": float((ref_labels == cand_labels).mean()) if len(rows) else 1.0,
+        "max_score_diff": float(diff.max()) if len(rows) else 0.0,
+        "mean_score_diff": float(diff.mean()) if len(rows) else 0.0,
+        "mismatches": [
+            {
+                "text": texts[rows[i][1]][:200],
+                "path": rows[i][0],
+                "reference": reference.labels[ref_labels[i]],
+                "candidate": candidate.labels[cand_labels[i]],
+            }
+            for i in mismatches[:20]
+        ],
+    }
@@ -0,0 +1,86 @@
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import joblib
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer
+
+from backend.app.models.emotion_models import EMOTIONS
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_FORMAT = 1
+
+
+def create_vectorizer(n_features: int = 2 ** 20, ngram_max: int = 2) -> HashingVectorizer:
+    """Stateless text featurizer: nothing to fit, so chunks can be vectorized anywhere"""
+    return HashingVectorizer(
+        n_features=n_features,
+        ngram_range=(1, ngram_max),
+        alternate_sign=False,
+        norm="l2",
+    )
+
+
+class TextEmotionModel:
+    """Hashing vectorizer + linear classifier trained by ``backend/train_model.py``
+
+    ``predict_proba`` returns one column per emotion in ``EMOTIONS`` order,
+    whatever order the classifier learned its classes in.
+    """
+
+    def __init__(self, vectorizer: HashingVectorizer, classifier, version: str, metrics: Optional[Dict] = None):
+        self.vectorizer = vectorizer
+        self.classifier = classifier
+        self.version = version
+        self.metrics = metrics or {}
+        classes = list(classifier.classes_)
+        self._columns = np.array([classes.index(e) if e in classes else -1 for e in EMOTIONS])
+
+    def predict_proba(self, texts: List[str]) -> np.ndarray:
+        raw = self.classifier.predict_proba(self.vectorizer.transform(texts))
+        probs = np.zeros((len(texts), len(EMOTIONS)))
+        known = self._columns >= 0
+        probs[:, known] = raw[:, self._columns[known]]
+        return probs
+
+    def save(self, model_path: Path, vectorizer_path: Path):
+        """Write both artifacts, each replaced atomically, plus a copy under ``versions/``"""
+        artifacts = {
+            Path(model_path): {"format": ARTIFACT_FORMAT, "version": self.version,
+                               "classifier": self.classifier, "metrics": self.metrics},
+            Path(vectorizer_path): {"format": ARTIFACT_FORMAT, "version": self.version,
+                                    "vectorizer": self.vectorizer},
+        }
+        for path, payload in artifacts.items():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            archived = path.parent / "versions" / self.version / path.name
+            archived.parent.mkdir(parents=True, exist_ok=True)
+            joblib.dump(payload, archived)
+            tmp = path.with_name(path.name + ".tmp")
+            joblib.dump(payload, tmp)
+            os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, model_path: Path, vectorizer_path: Path) -> Optional["TextEmotionModel"]:
+        """The trained model, or None when it hasn't been trained yet or is unusable"""
+        if not Path(model_path).exists() or not Path(vectorizer_path).exists():
+            return None
+        try:
+            model = joblib.load(model_path)
+            vectorizer = joblib.load(vectorizer_path)
+        except Exception as e:
+            logger.error(f"Could not load text emotion model: {e}")
+            return None
+        if not isinstance(model, dict) or model.get("format") != ARTIFACT_FORMAT:
+            logger.warning(f"Ignoring {model_path}: not written by the streaming trainer")
+            return None
+        if vectorizer.get("version") != model["version"]:
+            logger.warning(
+                f"Text model {model['version']} and vectorizer {vectorizer.get('version')} differ; ignoring both"
+            )
+            return None
+        logger.info(f"Loaded text emotion model {model['version']}")
+        return cls(vectorizer["vectorizer"], model["classifier"], model["version"], model.get("metrics"))
@@ -19,9 +19,12 @@ class AudioFeatures(BaseModel):
     loudness: Optional[float] = None
 
 class RecommendationRequest(BaseModel):
-    emotion: str
+    emotion: Optional[str] = None  # may be left out when user_id has a precomputed snapshot
     languages: List[str]
+    genres: Optional[List[str]] = None
     limit: Optional[int] = 20
+    offset: Optional[int] = 0
+    user_id: Optional[str] = None
 
 class SpotifyAuthResponse(BaseModel):
     access_token: str
@@ -0,0 +1,287 @@
+import csv
+import json
+import logging
+import mmap
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from backend.app.models.emotion_models import FEATURE_DEFAULTS, FEATURE_SCALE, FEATURES
+
+logger = logging.getLogger(__name__)
+
+# Track fields returned to clients, besides the audio features
+TRACK_FIELDS = ["id", "name", "artists", "url", "preview_url", "album_image", "language", "genre"]
+
+# Fields with a postings list (value -> rows) for filtering
+POSTINGS_FIELDS = ["language", "genre"]
+
+# Rows scored per step of the brute-force search; bounds temporary memory
+BLOCK_SIZE = 1 << 17
+
+# Columnar format: version of the on-disk layout and the artists separator
+COLUMNAR_FORMAT = 1
+ARTIST_SEPARATOR = "\x1f"
+
+
+def _split_artists(artists) -> List[str]:
+    if isinstance(artists, list):
+        return artists
+    return [a for a in (artists or "").split(";") if a]
+
+
+def _csv_features(row: Dict, path: Path, line: int) -> Dict:
+    """CSV cells are strings: parse the features, leaving blank or invalid ones None (imputed later)"""
+    record = dict(row)
+    for key in FEATURES:
+        value = (row.get(key) or "").strip()
+        if key not in row or not value:
+            record[key] = None
+            continue
+        try:
+            record[key] = float(value)
+        except ValueError:
+            logger.warning(f"{path.name}:{line}: {key}={value!r} is not a number; using the default")
+            record[key] = None
+    return record
+
+
+def _iter_lines(path: Path, suffix: str) -> Iterator[Dict]:
+    with open(path, newline="" if suffix == ".csv" else None, encoding="utf-8") as f:
+        if suffix == ".csv":
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield _csv_features(row, path, reader.line_num)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def read_records(path: Path) -> Tuple[Iterable[Dict], str]:
+    """(tracks, version) of a JSON list (or {"version", "tracks"}), JSON lines or CSV file.
+
+    CSV and JSON lines are streamed; a JSON file is parsed once for both its
+    tracks and version. Without a declared version it is the file's mtime.
+    """
+    path = Path(path)
+    suffix = path.suffix.lower()
+    mtime_version = str(int(path.stat().st_mtime))
+    if suffix in (".csv", ".jsonl", ".ndjson"):
+        return _iter_lines(path, suffix), mtime_version
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        return data["tracks"], str(data["version"]) if "version" in data else mtime_version
+    return data, mtime_version
+
+
+def iter_records(path: Path) -> Iterator[Dict]:
+    """Tracks from a JSON list (or {"version", "tracks"}), JSON lines or CSV file"""
+    yield from read_records(path)[0]
+
+
+def _build_postings(values: Sequence[str]) -> Dict[str, np.ndarray]:
+    """value -> sorted row indices having that value"""
+    keys, inverse = np.unique(np.asarray([(v or "").lower() for v in values]), return_inverse=True)
+    order = np.argsort(inverse, kind="stable")
+    bounds = np.searchsorted(inverse[order], np.arange(len(keys) + 1))
+    return {key: order[bounds[i]:bounds[i + 1]] for i, key in enumerate(keys) if key}
+
+
+class StringColumn:
+    """Read-only column of strings backed by a memory-mapped blob and an offsets array"""
+
+    def __init__(self, blob_path: Path, offsets_path: Path, separator: Optional[str] = None):
+        self.offsets = np.load(offsets_path, mmap_mode="r")
+        self.separator = separator
+        with open(blob_path, "rb") as f:
+            # Empty files can't be mapped
+            self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.offsets[-1] else b""
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int):
+        value = self._blob[int(self.offsets[row]):int(self.offsets[row + 1])].decode("utf-8")
+        if self.separator is not None:
+            return [v for v in value.split(self.separator) if v]
+        return value or None
+
+
+class TrackCatalog:
+    """Tracks with audio features, indexed once for nearest-neighbour lookups.
+
+    Features are kept one contiguous array per feature (summing columns is
+    much faster than rows) and search is blocked brute force; the L1 distance
+    is scaled by FEATURE_SCALE so it matches the emotion similarity used in
+    EmotionService. Language and genre postings lists restrict the search
+    before any distance is computed.
+
+    ``open``/``load`` of a columnar directory (see ``write_columnar``) memory
+    maps every array, so worker processes share one copy via the page cache.
+    """
+
+    def __init__(self, features: np.ndarray, columns: Dict[str, Sequence], version: str = "0",
+                 postings: Optional[Dict[str, Dict[str, np.ndarray]]] = None):
+        # features: len(FEATURES) x tracks, float32
+        self.features = features
+        self.inverse_scale = (1.0 / FEATURE_SCALE).astype(np.float32)
+        self.columns = columns
+        self.version = version
+        if postings is None:
+            postings = {field: _build_postings(columns[field]) for field in POSTINGS_FIELDS}
+        self.by_language = postings["language"]
+        self.by_genre = postings["genre"]
+
+    def __len__(self):
+        return self.features.shape[1]
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict], version: str = "0") -> "TrackCatalog":
+        records = list(records)
+        features = np.array([[r.get(f) for f in FEATURES] for r in records], dtype=float).reshape(len(records), len(FEATURES))
+        features = np.where(np.isnan(features), FEATURE_DEFAULTS, features)
+        columns = {field: [r.get(field) for r in records] for field in TRACK_FIELDS}
+        columns["artists"] = [_split_artists(a) for a in columns["artists"]]
+        return cls(np.ascontiguousarray(features.T, dtype=np.float32), columns, version)
+
+    @classmethod
+    def load(cls, path: Path) -> "TrackCatalog":
+        """Open a columnar directory, or parse a JSON/JSON lines/CSV track dump"""
+        path = Path(path)
+        if path.is_dir():
+            catalog = cls.open(path)
+        else:
+            catalog = cls.from_records(*read_records(path))
+        logger.info(f"Loaded catalog {path.name}: {len(catalog)} tracks")
+        return catalog
+
+    @classmethod
+    def open(cls, directory: Path) -> "TrackCatalog":
+        """Memory-map a catalog written by ``write_columnar``"""
+        directory = Path(directory)
+        meta = json.loads((directory / "meta.json").read_text())
+        if meta.get("format") != COLUMNAR_FORMAT or meta.get("features") != FEATURES:
+            raise ValueError(f"{directory} is not a format {COLUMNAR_FORMAT} catalog with features {FEATURES}")
+
+        features = np.load(directory / "features.npy", mmap_mode="r")
+        columns = {
+            field: StringColumn(
+                directory / f"{field}.bin",
+                directory / f"{field}.offsets.npy",
+                separator=ARTIST_SEPARATOR if field == "artists" else None,
+            )
+            for field in TRACK_FIELDS
+        }
+        postings = {}
+        for field in POSTINGS_FIELDS:
+            keys = meta["postings"][field]
+            rows = np.load(directory / f"{field}.postings.npy", mmap_mode="r")
+            bounds = np.load(directory / f"{field}.postings_offsets.npy")
+            postings[field] = {key: rows[bounds[i]:bounds[i + 1]] for i, key in enumerate(keys)}
+        return cls(features, columns, str(meta["version"]), postings)
+
+    def track(self, row: int) -> Dict:
+        track = {field: self.columns[field][row] for field in TRACK_FIELDS}
+        track.update((f, round(v, 6)) for f, v in zip(FEATURES, self.features[:, row].tolist()))
+        return track
+
+    def candidates(self, languages: Optional[List[str]] = None, genres: Optional[List[str]] = None) -> Optional[np.ndarray]:
+        """Rows matching any of the languages and any of the genres; None means every row"""
+        mask = None
+        for postings, wanted in ((self.by_language, languages), (self.by_genre, genres)):
+            if not wanted:
+                continue
+            matched = np.zeros(len(self), dtype=bool)
+            for value in wanted:
+                if value.lower() in postings:
+                    matched[postings[value.lower()]] = True
+            mask = matched if mask is None else mask & matched
+        return None if mask is None else np.flatnonzero(mask)
+
+    def nearest(self, centroid: np.ndarray, limit: int = 20, offset: int = 0,
+                languages: Optional[List[str]] = None, genres: Optional[List[str]] = None) -> List[Dict]:
+        """Tracks closest to `centroid` (raw feature values), best first, paginated"""
+        wanted = offset + limit
+        rows = self.candidates(languages, genres)
+        total = len(self) if rows is None else len(rows)
+        if wanted <= 0 or total == 0:
+            return []
+
+        query = np.asarray(centroid, dtype=np.float32)
+        best_rows = np.empty(0, dtype=np.int64)
+        best_dist = np.empty(0, dtype=np.float32)
+        for start in range(0, total, BLOCK_SIZE):
+            if rows is None:
+                block_rows = np.arange(start, min(start + BLOCK_SIZE, total))
+                selector = slice(start, start + BLOCK_SIZE)
+            else:
+                block_rows = rows[start:start + BLOCK_SIZE]
+                selector = block_rows
+            dist = np.zeros(len(block_rows), dtype=np.float32)
+            for column, value, scale in zip(self.features, query, self.inverse_scale):
+                dist += np.abs(column[selector] - value) * scale
+            if len(dist) > wanted:
+                keep = np.argpartition(dist, wanted - 1)[:wanted]
+                block_rows, dist = block_rows[keep], dist[keep]
+            best_rows = np.concatenate((best_rows, block_rows))
+            best_dist = np.concatenate((best_dist, dist))
+            if len(best_dist) > wanted:
+                keep = np.argpartition(best_dist, wanted - 1)[:wanted]
+                best_rows, best_dist = best_rows[keep], best_dist[keep]
+
+        order = np.lexsort((best_rows, best_dist))[offset:wanted]
+        return [self.track(int(row)) for row in best_rows[order]]
+
+
+def write_columnar(records: Iterable[Dict], directory: Path, version: str) -> int:
+    """Stream tracks into the memory-mappable columnar format; returns the track count.
+
+    Layout: features.npy (features x tracks, float32), per string field a
+    UTF-8 blob <field>.bin plus <field>.offsets.npy (uint64, tracks + 1), and
+    per postings field the row ids grouped by value with their offsets.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    feature_rows = []
+    blobs = {field: open(directory / f"{field}.bin", "wb") for field in TRACK_FIELDS}
+    offsets = {field: [0] for field in TRACK_FIELDS}
+    postings_values = {field: [] for field in POSTINGS_FIELDS}
+    try:
+        for record in records:
+            feature_rows.append([record.get(f) for f in FEATURES])
+            for field in TRACK_FIELDS:
+                value = record.get(field)
+                if field == "artists":
+                    value = ARTIST_SEPARATOR.join(_split_artists(value))
+                encoded = (value or "").encode("utf-8")
+                blobs[field].write(encoded)
+                offsets[field].append(offsets[field][-1] + len(encoded))
+            for field in POSTINGS_FIELDS:
+                postings_values[field].append(record.get(field))
+    finally:
+        for blob in blobs.values():
+            blob.close()
+
+    count = len(feature_rows)
+    features = np.array(feature_rows, dtype=float).reshape(count, len(FEATURES))
+    features = np.where(np.isnan(features), FEATURE_DEFAULTS, features)
+    np.save(directory / "features.npy", np.ascontiguousarray(features.T, dtype=np.float32))
+    for field in TRACK_FIELDS:
+        np.save(directory / f"{field}.offsets.npy", np.asarray(offsets[field], dtype=np.uint64))
+
+    postings_keys = {}
+    for field in POSTINGS_FIELDS:
+        postings = _build_postings(postings_values[field])
+        keys = sorted(postings)
+        lists = [postings[k] for k in keys]
+        np.save(directory / f"{field}.postings.npy", np.concatenate(lists or [np.empty(0)]).astype(np.int64))
+        np.save(directory / f"{field}.postings_offsets.npy", np.concatenate(([0], np.cumsum([len(l) for l in lists]))).astype(np.int64))
+        postings_keys[field] = keys
+
+    meta = {"format": COLUMNAR_FORMAT, "version": version, "rows": count, "features": FEATURES, "postings": postings_keys}
+    (directory / "meta.json").write_text(json.dumps(meta, indent=2))
+    return count
@@ -1,108 +1,356 @@
-from typing import List, Dict, Optional
+import asyncio
+import hashlib
+import logging
+from typing import List, Dict, Optional, Tuple
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.svm import SVC
-from joblib import load
-import os
-from backend.app.models.sentiment_analysis import SentimentAnalyzer
+from backend.app.models.batching import MicroBatcher
+from backend.app.models.emotion_models import EMOTIONS, FEATURE_WEIGHTS, build_profile_matrix, pack_history, similarity
+from backend.app.models.lexicon import Lexicon
+from backend.app.models.registry import registry
+from backend.app.utils.cache import create_cache
+from backend.app.utils.config import settings
+from backend.app.utils.metrics import STAGE_SECONDS, metrics
+
+logger = logging.getLogger(__name__)
+
+CASCADE_DECISIONS = metrics.counter(
+    "mobrec_cascade_decisions_total",
+    "Texts answered by the fast text model (accepted) or sent on to the sentiment model (escalated)",
+    ("outcome",),
+)
+
+# Used when the sentiment model fails; such degraded scores are answered but never cached
+FALLBACK_SENTIMENT = "NEUTRAL"
+
+# Bump when the meaning of cached text score rows changes
+SCORE_FORMAT = 2
+
+def cascade_status() -> str:
+    """disabled, not_loaded (the registry hasn't loaded the text model), no_model (none trained) or active"""
+    if not settings.CASCADE_ENABLED:
+        return "disabled"
+    if not registry.is_loaded("text_model") and settings.MODEL_LOAD_MODE != "lazy":
+        return "not_loaded"
+    return "active" if registry.get("text_model") is not None else "no_model"
 
 class EmotionService:
-    def __init__(self):
-        # Initialize models
-        self.text_model = self._load_text_model()
+    def __init__(self, sentiment_analyzer=None):
+        # Initialize models; the trained text model comes from the registry
         self.history_model = self._load_history_model()
-        self.vectorizer = self._load_vectorizer()
-        self.sentiment_analyzer = SentimentAnalyzer()
+        # The sentiment model is shared process-wide and loaded by the registry
+        self._sentiment_analyzer = sentiment_analyzer
+        self.sentiment_batcher = MicroBatcher(
+            lambda texts: self.sentiment_analyzer.analyze_batch(texts, strict=True),
+            max_batch_size=settings.BATCH_MAX_SIZE,
+            window_ms=settings.BATCH_WINDOW_MS,
+            name="sentiment",
+        )
         
         # Emotion labels
-        self.emotions = ["happy", "sad", "angry", "calm", "energetic", "romantic"]
+        self.emotions = list(EMOTIONS)
         
-        # Audio features mapping to emotions
-        self.feature_weights = {
-            'danceability': {'happy': 0.8, 'sad': 0.2, 'angry': 0.5, 'calm': 0.3, 'energetic': 0.9, 'romantic': 0.6},
-            'energy': {'happy': 0.7, 'sad': 0.3, 'angry': 0.9, 'calm': 0.2, 'energetic': 0.95, 'romantic': 0.5},
-            'valence': {'happy': 0.9, 'sad': 0.1, 'angry': 0.4, 'calm': 0.6, 'energetic': 0.7, 'romantic': 0.8},
-            'tempo': {'happy': 120, 'sad': 70, 'angry': 140, 'calm': 80, 'energetic': 130, 'romantic': 100}
+        # Audio features mapping to emotions, compiled into an emotion x feature matrix
+        self.feature_weights = FEATURE_WEIGHTS
+        self.feature_profiles = build_profile_matrix(self.feature_weights, self.emotions)
+
+        # Per-emotion confidence the fast text model needs before its answer is kept
+        self.cascade_thresholds = np.array(
+            [float(settings.CASCADE_THRESHOLDS.get(e, settings.CASCADE_THRESHOLD)) for e in self.emotions]
+        )
+
+        # Map sentiment to emotion
+        self.sentiment_mapping = {
+            "POSITIVE": "happy",
+            "NEGATIVE": "sad",
+            "NEUTRAL": "calm"
         }
 
-    def _load_text_model(self):
-        # In a real app, this would load a pre-trained model
-        # For demo, we'll use a simple model
-        return None
+        # Keywords that push the score towards an emotion, compiled once and
+        # hot-reloaded when the lexicon file changes
+        self.lexicon = Lexicon(settings.LEXICON_PATH, self.emotions, reload_seconds=settings.LEXICON_RELOAD_SECONDS)
+
+        # Text -> score vector cache for repeated phrases
+        self.text_cache = create_cache(
+            settings.TEXT_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.TEXT_CACHE_TTL_SECONDS,
+            url=settings.TEXT_CACHE_URL,
+            namespace="emotion-text",
+        )
+        self._cascade_warned = False
+        metrics.callback(
+            "mobrec_cascade_status", "1 for the cascade's current state (disabled, not_loaded, no_model, active)",
+            lambda: {(cascade_status(),): 1}, ("status",),
+        )
+        for stat, kind in (("hits", "counter"), ("misses", "counter"), ("evictions", "counter"), ("entries", "gauge")):
+            metrics.callback(
+                f"mobrec_text_cache_{stat}" + ("_total" if kind == "counter" else ""),
+                f"Text emotion cache {stat}",
+                lambda stat=stat: {(): self.text_cache.stats()[stat]},
+                type=kind,
+            )
+
+    @property
+    def sentiment_analyzer(self):
+        if self._sentiment_analyzer is not None:
+            return self._sentiment_analyzer
+        return registry.get("sentiment")
+
+    @property
+    def text_model(self):
+        """Model written by backend/train_model.py, or None if it hasn't been trained"""
+        return registry.get("text_model")
+
+    @property
+    def vectorizer(self):
+        return self.text_model.vectorizer if self.text_model is not None else None
 
     def _load_history_model(self):
         # In a real app, this would load a pre-trained model
         # For demo, we'll use a simple model
         return None
 
-    def _load_vectorizer(self):
-        # In a real app, this would load a pre-trained vectorizer
-        # For demo, we'll use a simple vectorizer
-        return None
-
     def detect_emotion_from_text(self, text: str) -> str:
-        # First try sentiment analysis
-        sentiment = self.sentiment_analyzer.analyze(text)
-        
+        scores = self._score_texts([text])[0]
+        return self.emotions[int(np.argmax(scores))]
+
+    async def detect_emotion_from_text_async(self, text: str) -> str:
+        """Same as detect_emotion_from_text, but the sentiment pass goes through the micro-batcher"""
+        scores = (await self._score_texts_async([text]))[0]
+        return self.emotions[int(np.argmax(scores))]
+
+    def _fast_model(self):
+        """The cascade's first stage, if enabled and available without loading it here"""
+        if not settings.CASCADE_ENABLED:
+            return None
+        if not registry.is_loaded("text_model") and settings.MODEL_LOAD_MODE != "lazy":
+            if not self._cascade_warned:
+                self._cascade_warned = True
+                logger.warning("Cascade enabled but the text model isn't loaded yet; scoring with the sentiment model only")
+            return None
+        return self.text_model
+
+    def _cascade_version(self) -> str:
+        model = self._fast_model()
+        if model is None:
+            return "-"
+        return f"{model.version}@{','.join(f'{t:g}' for t in self.cascade_thresholds)}"
+
+    def _cache_keys(self, texts: List[str]) -> Optional[List[str]]:
+        """Keys tied to the model, cascade and lexicon versions, so any of them changing invalidates them.
+
+        Returns None until the shared sentiment model is loaded; checking its
+        version must never trigger a load on the event loop.
+        """
+        if self._sentiment_analyzer is None and not registry.is_loaded("sentiment"):
+            return None
+        # Reload before reading the version, or the first scores after a lexicon edit
+        # would be cached under the old one
+        self.lexicon.maybe_reload()
+        prefix = f"{SCORE_FORMAT}|{self.sentiment_analyzer.version}|{self._cascade_version()}|{self.lexicon.version}|"
+        return [prefix + hashlib.sha256(" ".join(t.lower().split()).encode()).hexdigest() for t in texts]
+
+    def _split_cached(self, texts: List[str], cached: List):
+        scores = np.zeros((len(texts), len(self.emotions)))
+        missing = []
+        for i, row in enumerate(cached):
+            if row is None:
+                missing.append(i)
+            else:
+                scores[i] = row
+        return scores, missing
+
+    def _store_scores(self, keys: Optional[List[str]], indices: List[int], scores: np.ndarray):
+        if keys is not None:
+            self.text_cache.set_many({keys[i]: scores[i].tolist() for i in indices})
+
+    def _fast_scores(self, texts: List[str]) -> Tuple[np.ndarray, List[int]]:
+        """Cascade first stage: probabilities for texts the fast model is sure about, and the rest to escalate
+
+        Either way a text's score row is a distribution over the emotions: the
+        fast model's (calibrated) probabilities for accepted texts, and the
+        normalized sentiment + keyword evidence (``_keyword_scores``) for
+        escalated ones, so rows from both stages can be compared and cached
+        together.
+        """
+        scores = np.zeros((len(texts), len(self.emotions)))
+        model = self._fast_model()
+        candidates = [i for i, text in enumerate(texts) if text.strip()] if model is not None else []
+        if not candidates:
+            return scores, list(range(len(texts)))
+
+        with STAGE_SECONDS.time(stage="fast_model"):
+            probs = model.predict_proba([texts[i] for i in candidates])
+        winners = probs.argmax(axis=1)
+        confident = probs[np.arange(len(candidates)), winners] >= self.cascade_thresholds[winners]
+        accepted = [i for i, ok in zip(candidates, confident) if ok]
+        scores[accepted] = probs[confident]
+        escalate = sorted(set(range(len(texts))) - set(accepted))
+        CASCADE_DECISIONS.inc(len(accepted), outcome="accepted")
+        CASCADE_DECISIONS.inc(len(escalate), outcome="escalated")
+        return scores, escalate
+
+    def _score_texts(self, texts: List[str]) -> np.ndarray:
+        keys = self._cache_keys(texts)
+        cached = self.text_cache.get_many(keys) if keys is not None else [None] * len(texts)
+        scores, missing = self._split_cached(texts, cached)
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            scores[missing], escalate = self._fast_scores(missing_texts)
+            failed = set()
+            if escalate:
+                escalated_texts = [missing_texts[i] for i in escalate]
+                sentiments = []
+                for start in range(0, len(escalated_texts), settings.BATCH_MAX_SIZE):
+                    chunk = escalated_texts[start:start + settings.BATCH_MAX_SIZE]
+                    try:
+                        sentiments.extend(self.sentiment_analyzer.analyze_batch(chunk, strict=True))
+                    except Exception as e:
+                        print(f"Error in sentiment analysis: {e}")
+                        failed.update(missing[i] for i in escalate[start:start + len(chunk)])
+                        sentiments.extend([FALLBACK_SENTIMENT] * len(chunk))
+                scores[[missing[i] for i in escalate]] = self._keyword_scores(escalated_texts, sentiments)
+            self._store_scores(keys, [i for i in missing if i not in failed], scores)
+        return scores
+
+    async def _score_texts_async(self, texts: List[str]) -> np.ndarray:
+        keys = self._cache_keys(texts)
+        if keys is None:
+            cached = [None] * len(texts)
+        elif self.text_cache.remote:
+            cached = await asyncio.to_thread(self.text_cache.get_many, keys)
+        else:
+            cached = self.text_cache.get_many(keys)
+        scores, missing = self._split_cached(texts, cached)
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            scores[missing], escalate = self._fast_scores(missing_texts)
+            failed = set()
+            if escalate:
+                escalated_texts = [missing_texts[i] for i in escalate]
+                sentiments = await asyncio.gather(
+                    *(self.sentiment_batcher.submit(t) for t in escalated_texts), return_exceptions=True
+                )
+                for i, sentiment in zip(escalate, sentiments):
+                    if isinstance(sentiment, Exception):
+                        failed.add(missing[i])
+                sentiments = [FALLBACK_SENTIMENT if isinstance(s, Exception) else s for s in sentiments]
+                scores[[missing[i] for i in escalate]] = self._keyword_scores(escalated_texts, sentiments)
+            stored = [i for i in missing if i not in failed]
+            if self.text_cache.remote:
+                await asyncio.to_thread(self._store_scores, keys, stored, scores)
+            else:
+                self._store_scores(keys, stored, scores)
+        return scores
+
+    def _keyword_scores(self, texts: List[str], sentiments: List[str]) -> np.ndarray:
+        """Score a whole batch at once: one row per text, one column per emotion, each row summing to 1
+
+        The sentiment vote and keyword weights are evidence counts; they are
+        normalized into shares so they sit on the same scale as the fast
+        model's probabilities.
+        """
+        scores = np.zeros((len(texts), len(self.emotions)))
+
         # Map sentiment to emotion
-        sentiment_mapping = {
-            "POSITIVE": "happy",
-            "NEGATIVE": "sad",
-            "NEUTRAL": "calm"
-        }
-        
-        base_emotion = sentiment_mapping.get(sentiment, "happy")
-        
+        base = [self.emotions.index(self.sentiment_mapping.get(s, "happy")) for s in sentiments]
+        scores[np.arange(len(texts)), base] += 1
+
         # Enhance with keyword analysis
-        keywords = {
-            "happy": ["happy", "joy", "excited", "great", "awesome"],
-            "sad": ["sad", "depressed", "lonely", "miss", "hurt"],
-            "angry": ["angry", "mad", "hate", "annoyed", "frustrated"],
-            "calm": ["calm", "peace", "relax", "chill", "quiet"],
-            "energetic": ["energy", "pump", "workout", "party", "dance"],
-            "romantic": ["love", "romantic", "heart", "kiss", "together"]
-        }
-        
-        text_lower = text.lower()
-        emotion_scores = {e: 0 for e in self.emotions}
-        emotion_scores[base_emotion] += 1
-        
-        for emotion, words in keywords.items():
-            for word in words:
-                if word in text_lower:
-                    emotion_scores[emotion] += 1
-        
-        # Get emotion with highest score
-        detected_emotion = max(emotion_scores.items(), key=lambda x: x[1])[0]
-        return detected_emotion
+        with STAGE_SECONDS.time(stage="keyword_scoring"):
+            scores += self.lexicon.score_batch(texts)
+
+        scores = np.clip(scores, 0, None)
+        totals = scores.sum(axis=1, keepdims=True)
+        return np.divide(scores, totals, out=np.zeros_like(scores), where=totals > 0)
+
+    def detect_emotions_from_texts(self, texts: List[str], include_scores: bool = False) -> List:
+        """Batched detect_emotion_from_text for offline jobs"""
+        return self._format_results(self._score_texts(texts), include_scores)
+
+    async def detect_emotions_batch(self, items: List[Dict], include_scores: bool = False) -> List[Dict]:
+        """Detect emotions for a mix of text and history items, keeping input order"""
+        results: List[Optional[Dict]] = [None] * len(items)
+        text_indices = [i for i, item in enumerate(items) if item.get("text")]
+        history_indices = [i for i, item in enumerate(items) if not item.get("text") and item.get("history")]
+
+        if text_indices:
+            texts = [items[i]["text"] for i in text_indices]
+            scored = self._format_results(await self._score_texts_async(texts), include_scores)
+            for i, result in zip(text_indices, scored):
+                results[i] = result
+
+        if history_indices:
+            histories = [items[i]["history"] for i in history_indices]
+            for i, result in zip(history_indices, self.predict_emotions_from_histories(histories, include_scores)):
+                results[i] = result
+
+        for i, result in enumerate(results):
+            if result is None:
+                results[i] = {"error": "Either text or history must be provided"}
+        return results
+
+    def _format_results(self, scores: np.ndarray, include_scores: bool) -> List[Dict]:
+        winners = np.argmax(scores, axis=1) if len(scores) else []
+        results = []
+        for row, winner in zip(scores, winners):
+            result = {"emotion": self.emotions[int(winner)]}
+            if include_scores:
+                result["scores"] = {e: float(v) for e, v in zip(self.emotions, row)}
+            results.append(result)
+        return results
 
     def predict_emotion_from_history(self, history: List[Dict]) -> str:
         if not history:
             return "happy"  # default emotion
-            
-        # Calculate average audio features
-        avg_features = {
-            'danceability': np.mean([t.get('danceability', 0.5) for t in history]),
-            'energy': np.mean([t.get('energy', 0.5) for t in history]),
-            'valence': np.mean([t.get('valence', 0.5) for t in history]),
-            'tempo': np.mean([t.get('tempo', 100) for t in history])
-        }
-        
-        # Calculate similarity to each emotion's ideal features
-        emotion_scores = {}
-        for emotion in self.emotions:
-            score = 0
-            for feature, weights in self.feature_weights.items():
-                if feature == 'tempo':
-                    ideal_value = weights[emotion]
-                    actual_value = avg_features[feature]
-                    score += 1 - (abs(ideal_value - actual_value) / 200)  # normalize tempo difference
-                else:
-                    ideal_weight = weights[emotion]
-                    actual_weight = avg_features[feature]
-                    score += 1 - abs(ideal_weight - actual_weight)
-            emotion_scores[emotion] = score
-        
-        # Get emotion with highest score
-        predicted_emotion = max(emotion_scores.items(), key=lambda x: x[1])[0]
-        return predicted_emotion
\ No newline at end of file
+
+        return self.score_histories([history], detailed=False)[0]["emotion"]
+
+    def predict_emotions_from_histories(self, histories: List[List[Dict]], include_scores: bool = False) -> List[Dict]:
+        return self.score_histories(histories, detailed=include_scores)
+
+    def score_histories(self, histories: List[List[Dict]], detailed: bool = True) -> List[Dict]:
+        """Score many users' histories in one vectorized pass.
+
+        For each history returns the emotion closest to its average audio
+        features; with `detailed`, also the similarity score per emotion, each
+        track's own emotion and the share of tracks per emotion (the distribution).
+        """
+        with STAGE_SECONDS.time(stage="history_scoring"):
+            return self._score_histories(histories, detailed)
+
+    def _score_histories(self, histories: List[List[Dict]], detailed: bool) -> List[Dict]:
+        lengths = np.array([len(h) for h in histories])
+        non_empty = [h for h in histories if h]
+        if not non_empty:
+            return [{"emotion": "happy"} for _ in histories]
+
+        tracks = pack_history([t for h in non_empty for t in h])
+        counts = lengths[lengths > 0]
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+        # Average features per history, then similarity to each emotion profile
+        means = np.add.reduceat(tracks, starts, axis=0) / counts[:, None]
+        history_scores = similarity(means, self.feature_profiles)
+        winners = history_scores.argmax(axis=1)
+
+        if detailed:
+            # Per-track labels and their share per history
+            track_labels = similarity(tracks, self.feature_profiles).argmax(axis=1)
+            one_hot = np.eye(len(self.emotions))[track_labels]
+            distributions = np.add.reduceat(one_hot, starts, axis=0) / counts[:, None]
+
+        scored = iter(range(len(counts)))
+        results = []
+        for length in lengths:
+            if not length:
+                results.append({"emotion": "happy"})
+                continue
+            i = next(scored)
+            result = {"emotion": self.emotions[winners[i]]}
+            if detailed:
+                labels = track_labels[starts[i]:starts[i] + counts[i]]
+                result["scores"] = dict(zip(self.emotions, history_scores[i].tolist()))
+                result["distribution"] = dict(zip(self.emotions, distributions[i].tolist()))
+                result["track_emotions"] = [self.emotions[label] for label in labels]
+            results.append(result)
+        return results
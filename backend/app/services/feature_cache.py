@@ -0,0 +1,82 @@
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from backend.app.schemas.spotify import AudioFeatures
+
+# Stored for tracks Spotify has no features for, so they aren't re-requested
+_MISSING = ""
+
+
+class FeatureCache:
+    """Persistent track id -> AudioFeatures cache.
+
+    Audio features never change for a track, so entries never expire. A small
+    in-memory LRU sits in front of the SQLite file for hot tracks; it has its
+    own lock, so ``get_memory`` never waits behind a database query and is
+    cheap enough to call on the event loop.
+    """
+
+    def __init__(self, path: Path, memory_items: int = 50000):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.memory_items = memory_items
+        self._memory: "OrderedDict[str, Optional[AudioFeatures]]" = OrderedDict()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()  # guards _memory
+        self._db_lock = threading.Lock()  # guards _conn
+        with self._db_lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS audio_features (track_id TEXT PRIMARY KEY, features TEXT NOT NULL)")
+
+    def get_memory(self, track_ids: Iterable[str]) -> Tuple[Dict[str, Optional[AudioFeatures]], List[str]]:
+        """In-memory hits only (no I/O), and the ids left to look up with ``get_many``"""
+        found = {}
+        missing = []
+        with self._lock:
+            for track_id in track_ids:
+                if track_id in self._memory:
+                    self._memory.move_to_end(track_id)
+                    found[track_id] = self._memory[track_id]
+                else:
+                    missing.append(track_id)
+        return found, missing
+
+    def get_many(self, track_ids: Iterable[str]) -> Dict[str, Optional[AudioFeatures]]:
+        """Cached entries only; a None value means Spotify has no features for that track (blocking: SQLite)"""
+        found, missing = self.get_memory(track_ids)
+        rows = []
+        with self._db_lock:
+            for start in range(0, len(missing), 500):
+                chunk = missing[start:start + 500]
+                rows.extend(self._conn.execute(
+                    f"SELECT track_id, features FROM audio_features WHERE track_id IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall())
+        loaded = {track_id: AudioFeatures.parse_raw(features) if features != _MISSING else None
+                  for track_id, features in rows}
+        with self._lock:
+            for track_id, features in loaded.items():
+                self._remember(track_id, features)
+        found.update(loaded)
+        return found
+
+    def put_many(self, features: Dict[str, Optional[AudioFeatures]]):
+        rows = [(track_id, f.json() if f is not None else _MISSING) for track_id, f in features.items()]
+        with self._db_lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO audio_features VALUES (?, ?)", rows)
+        with self._lock:
+            for track_id, f in features.items():
+                self._remember(track_id, f)
+
+    def _remember(self, track_id: str, features: Optional[AudioFeatures]):
+        self._memory[track_id] = features
+        self._memory.move_to_end(track_id)
+        if len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def close(self):
+        with self._db_lock:
+            self._conn.close()
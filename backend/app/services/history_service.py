@@ -0,0 +1,121 @@
+import asyncio
+import hashlib
+import logging
+import time
+import weakref
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from backend.app.services.history_store import HistoryStore
+from backend.app.services.spotify_scheduler import BACKGROUND, spotify_priority
+from backend.app.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 50  # Spotify's maximum for recently-played
+
+
+def _played_at_ms(played_at: str) -> int:
+    return int(datetime.fromisoformat(played_at.replace("Z", "+00:00")).timestamp() * 1000)
+
+
+class HistoryService:
+    """Answers /user-history from the local store, fetching only plays newer than the stored cursor"""
+
+    def __init__(self, spotify_service, store: HistoryStore, sessions=None):
+        self.spotify_service = spotify_service
+        self.store = store
+        self.sessions = sessions
+        self._user_ids: "OrderedDict[str, str]" = OrderedDict()  # token hash -> Spotify user id
+        self._active: Dict[str, Dict] = {}  # user id -> {"token", "session_id", "last_seen"}
+        # Held only by the syncs using them, so a user's lock goes away once their syncs finish
+        self._sync_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        self._background: Optional[asyncio.Task] = None
+
+    async def get_history(self, token: str, limit: Optional[int] = None, user_id: Optional[str] = None,
+                          session_id: Optional[str] = None) -> List[Dict]:
+        """``user_id`` skips the profile lookup; with ``session_id`` background syncs fetch a fresh token"""
+        user_id = user_id or await self._resolve_user_id(token)
+        self._active[user_id] = {"token": token, "session_id": session_id, "last_seen": time.time()}
+        await self.sync_user(user_id, token)
+        history = await asyncio.to_thread(self.store.get_history, user_id, limit or settings.HISTORY_MAX_ITEMS)
+        return await self.spotify_service.resolve_history_features(history)
+
+    async def _resolve_user_id(self, token: str) -> str:
+        key = hashlib.sha256(token.encode()).hexdigest()
+        if key in self._user_ids:
+            self._user_ids.move_to_end(key)
+            return self._user_ids[key]
+
+        user_id = await self.spotify_service.get_current_user_id(token)
+        self._user_ids[key] = user_id
+        if len(self._user_ids) > 10000:
+            self._user_ids.popitem(last=False)
+        return user_id
+
+    async def sync_user(self, user_id: str, token: str, force: bool = False) -> int:
+        """Fetch plays newer than the stored cursor and merge them in; returns plays added"""
+        lock = self._sync_locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            state = await asyncio.to_thread(self.store.get_sync_state, user_id)
+            if not force and state["synced_at"] and time.time() - state["synced_at"] < settings.HISTORY_MIN_SYNC_SECONDS:
+                return 0
+
+            after = state["after"]
+            added = 0
+            while True:
+                page = await self.spotify_service.get_recently_played_page(token, after=after, limit=PAGE_SIZE)
+                items = page.get("items", [])
+                cursor = (page.get("cursors") or {}).get("after")
+                if cursor is None and items:
+                    cursor = max(_played_at_ms(item["played_at"]) for item in items)
+                new_after = int(cursor) if cursor is not None else after
+
+                added += await asyncio.to_thread(
+                    self.store.add_plays, user_id, items, new_after, settings.HISTORY_MAX_ITEMS
+                )
+                if len(items) < PAGE_SIZE or new_after == after:
+                    break
+                after = new_after
+
+            if added:
+                logger.info(f"Synced {added} new plays for user {user_id}")
+            return added
+
+    def start_background_sync(self, interval: float):
+        if self._background is None or self._background.done():
+            self._background = asyncio.get_running_loop().create_task(self._background_sync(interval))
+
+    async def stop_background_sync(self):
+        if self._background is not None:
+            self._background.cancel()
+            try:
+                await self._background
+            except asyncio.CancelledError:
+                pass
+            self._background = None
+
+    async def _background_sync(self, interval: float):
+        # Background syncs yield to interactive Spotify calls under the rate limit
+        with spotify_priority(BACKGROUND):
+            while True:
+                await asyncio.sleep(interval)
+                cutoff = time.time() - settings.HISTORY_ACTIVE_USER_SECONDS
+                for user_id, entry in list(self._active.items()):
+                    if entry["last_seen"] < cutoff:
+                        del self._active[user_id]
+                        continue
+                    try:
+                        token = entry["token"]
+                        if entry.get("session_id") and self.sessions is not None:
+                            session = await self.sessions.get_token(entry["session_id"])
+                            if session is None:
+                                del self._active[user_id]
+                                continue
+                            token = session[1]
+                        await self.sync_user(user_id, token)
+                    except Exception as e:
+                        # Most likely an expired user token; wait for the user to come back
+                        logger.warning(f"Background history sync failed for {user_id}: {e}")
+                        del self._active[user_id]
@@ -0,0 +1,88 @@
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+class HistoryStore:
+    """Per-user listening history in SQLite, plus the last recently-played cursor.
+
+    Plays are keyed by (user, played_at, track) so re-fetching an overlapping
+    page never duplicates rows, and each merge can trim a user to their most
+    recent plays so the file doesn't grow without bound. Safe to share between threads; several worker
+    processes can open the same file (WAL mode).
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS plays ("
+                " user_id TEXT NOT NULL, played_at TEXT NOT NULL, track_id TEXT NOT NULL, item TEXT NOT NULL,"
+                " PRIMARY KEY (user_id, played_at, track_id))"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sync_state ("
+                " user_id TEXT PRIMARY KEY, after_cursor INTEGER, synced_at REAL)"
+            )
+
+    def get_sync_state(self, user_id: str) -> Dict:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT after_cursor, synced_at FROM sync_state WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        if row is None:
+            return {"after": None, "synced_at": None}
+        return {"after": row[0], "synced_at": row[1]}
+
+    def add_plays(self, user_id: str, items: List[Dict], after_cursor: Optional[int],
+                  keep: Optional[int] = None) -> int:
+        """Merge a page of recently-played items and advance the cursor; returns rows added.
+
+        With ``keep``, older plays beyond the user's ``keep`` most recent are
+        deleted in the same transaction.
+        """
+        rows = [
+            (user_id, item["played_at"], (item.get("track") or {}).get("id") or "", json.dumps(item))
+            for item in items
+            if item.get("played_at")
+        ]
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany("INSERT OR IGNORE INTO plays VALUES (?, ?, ?, ?)", rows)
+            added = self._conn.total_changes - before
+            if keep and added:
+                self._conn.execute(
+                    "DELETE FROM plays WHERE user_id = ? AND played_at < ("
+                    " SELECT played_at FROM plays WHERE user_id = ? ORDER BY played_at DESC LIMIT 1 OFFSET ?)",
+                    (user_id, user_id, keep - 1),
+                )
+            self._conn.execute(
+                "INSERT INTO sync_state VALUES (?, ?, ?) ON CONFLICT(user_id) DO UPDATE SET"
+                " after_cursor = COALESCE(excluded.after_cursor, after_cursor), synced_at = excluded.synced_at",
+                (user_id, after_cursor, time.time()),
+            )
+        return added
+
+    def get_history(self, user_id: str, limit: Optional[int] = None) -> List[Dict]:
+        """Most recent plays first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT item FROM plays WHERE user_id = ? ORDER BY played_at DESC LIMIT ?",
+                (user_id, limit if limit else -1),
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def users(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT user_id FROM sync_state ORDER BY user_id")]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from backend.app.models.emotion_models import EMOTIONS, FEATURES
+from backend.app.services.mood_store import MoodStore
+from backend.app.utils.config import settings
+from backend.app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+MOOD_EVENTS = metrics.counter(
+    "mobrec_mood_events_total", "Mood events by outcome (written, dropped, failed)", ("outcome",)
+)
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def mean_features(history: Optional[List[Dict]]) -> Optional[Dict[str, float]]:
+    """Mean audio features over the tracks that carry them, or None"""
+    if not history:
+        return None
+    means = {}
+    for feature in FEATURES:
+        values = [item[feature] for item in history if isinstance(item.get(feature), (int, float))]
+        if not values:
+            return None
+        means[feature] = sum(values) / len(values)
+    return means
+
+
+class MoodService:
+    """Records detected moods per user off the request path and answers trend queries.
+
+    ``record`` only enqueues; a background task writes events to the store in
+    batches of up to MOOD_BATCH_SIZE, at least every MOOD_FLUSH_SECONDS. If
+    the queue is full (the store can't keep up) new events are dropped and
+    counted rather than slowing requests down.
+    """
+
+    def __init__(self, store: MoodStore):
+        self.store = store
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._closing = False
+
+    def record(self, user_id: str, emotion: str, source: str, history: Optional[List[Dict]] = None):
+        if not user_id or emotion not in EMOTIONS:
+            return
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=settings.MOOD_QUEUE_SIZE)
+        event = {"user_id": user_id, "ts": time.time(), "emotion": emotion, "source": source,
+                 "features": mean_features(history)}
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            MOOD_EVENTS.inc(outcome="dropped")
+            return
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.get_running_loop().create_task(self._write_batches())
+
+    async def _write_batches(self):
+        # wait_for can swallow a cancel that races a completed get(), so flush also sets _closing
+        while not self._closing:
+            batch = []
+            try:
+                batch.append(await self._queue.get())
+                deadline = asyncio.get_running_loop().time() + settings.MOOD_FLUSH_SECONDS
+                while len(batch) < settings.MOOD_BATCH_SIZE:
+                    timeout = deadline - asyncio.get_running_loop().time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+            except asyncio.CancelledError:
+                # Shutting down: events already taken off the queue still get written
+                if batch:
+                    await self._write(batch)
+                raise
+            await self._write(batch)
+
+    async def _write(self, batch: List[Dict]):
+        try:
+            await asyncio.to_thread(self.store.add_events, batch)
+            MOOD_EVENTS.inc(len(batch), outcome="written")
+        except Exception as e:
+            logger.error(f"Failed to write {len(batch)} mood events: {e}")
+            MOOD_EVENTS.inc(len(batch), outcome="failed")
+
+    async def flush(self):
+        """Stop the writer and persist everything still queued"""
+        if self._writer is not None:
+            self._closing = True
+            self._writer.cancel()
+            try:
+                await self._writer
+            except asyncio.CancelledError:
+                pass
+            self._writer = None
+            self._closing = False
+        pending = []
+        while self._queue is not None and not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        if pending:
+            await self._write(pending)
+
+    def timeline(self, user_id: str, days: float = 30, limit: int = 100) -> List[Dict]:
+        events = self.store.timeline(user_id, since=time.time() - days * 86400, limit=limit)
+        for event in events:
+            event["time"] = _iso(event.pop("ts"))
+        return events
+
+    def rollups(self, user_id: str, granularity: str = "day", days: float = 30) -> Dict:
+        """Buckets for the last ``days`` plus a summary over all of them"""
+        buckets = self.store.rollups(user_id, granularity, since=time.time() - days * 86400)
+        counts = {e: sum(b["counts"][e] for b in buckets) for e in EMOTIONS}
+        total = sum(counts.values())
+        for bucket in buckets:
+            bucket["start"] = _iso(bucket.pop("bucket"))
+        return {
+            "granularity": granularity,
+            "days": days,
+            "buckets": buckets,
+            "summary": {
+                "total": total,
+                "counts": counts,
+                "distribution": {e: round(c / total, 4) for e, c in counts.items()} if total else None,
+                "dominant": max(counts, key=counts.get) if total else None,
+            },
+        }
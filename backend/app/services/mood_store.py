@@ -0,0 +1,147 @@
+import sqlite3
+import threading
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from backend.app.models.emotion_models import EMOTIONS, FEATURES
+
+# Rollup granularities and their bucket widths in seconds (weeks start on Monday, UTC)
+GRANULARITIES = {"hour": 3600, "day": 86400, "week": 7 * 86400}
+
+
+def bucket_start(ts: float, granularity: str) -> int:
+    """Start (unix seconds, UTC) of the bucket containing ``ts``"""
+    if granularity == "week":
+        day = int(ts // 86400)
+        # 1970-01-01 was a Thursday (weekday 3)
+        return (day - (day + 3) % 7) * 86400
+    width = GRANULARITIES[granularity]
+    return int(ts // width) * width
+
+
+class MoodStore:
+    """Append-only per-user mood events plus rollups maintained on every write.
+
+    Each batch of events updates hourly, daily and weekly buckets (emotion
+    counts and audio-feature sums) in the same transaction, so range queries
+    read a handful of bucket rows instead of rescanning raw events. Safe to
+    share between threads; several worker processes can open the same file
+    (WAL mode).
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        feature_columns = ", ".join(f"{f} REAL" for f in FEATURES)
+        sum_columns = ", ".join(f"sum_{f} REAL NOT NULL DEFAULT 0" for f in FEATURES)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS mood_events ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, ts REAL NOT NULL,"
+                f" emotion TEXT NOT NULL, source TEXT NOT NULL, {feature_columns})"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS mood_events_user_ts ON mood_events (user_id, ts)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS mood_rollups ("
+                " user_id TEXT NOT NULL, granularity TEXT NOT NULL, bucket INTEGER NOT NULL, emotion TEXT NOT NULL,"
+                f" count INTEGER NOT NULL DEFAULT 0, feature_count INTEGER NOT NULL DEFAULT 0, {sum_columns},"
+                " PRIMARY KEY (user_id, granularity, bucket, emotion))"
+            )
+
+    def add_events(self, events: List[Dict]) -> int:
+        """Append events ({user_id, ts, emotion, source, features?}) and fold them into the rollups"""
+        if not events:
+            return 0
+        rows = []
+        # (user, granularity, bucket, emotion) -> [count, feature_count, *sums], pre-aggregated per batch
+        deltas = defaultdict(lambda: [0, 0] + [0.0] * len(FEATURES))
+        for event in events:
+            features = event.get("features") or {}
+            values = [features.get(f) for f in FEATURES]
+            rows.append((event["user_id"], event["ts"], event["emotion"], event["source"], *values))
+            has_features = all(v is not None for v in values)
+            for granularity in GRANULARITIES:
+                delta = deltas[(event["user_id"], granularity, bucket_start(event["ts"], granularity), event["emotion"])]
+                delta[0] += 1
+                if has_features:
+                    delta[1] += 1
+                    for i, v in enumerate(values):
+                        delta[2 + i] += v
+
+        placeholders = ", ".join("?" * (4 + len(FEATURES)))
+        sums = ", ".join(f"sum_{f}" for f in FEATURES)
+        updates = ", ".join(f"sum_{f} = sum_{f} + excluded.sum_{f}" for f in FEATURES)
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT INTO mood_events (user_id, ts, emotion, source, {', '.join(FEATURES)}) VALUES ({placeholders})",
+                rows,
+            )
+            self._conn.executemany(
+                f"INSERT INTO mood_rollups (user_id, granularity, bucket, emotion, count, feature_count, {sums})"
+                f" VALUES ({', '.join('?' * (6 + len(FEATURES)))})"
+                " ON CONFLICT(user_id, granularity, bucket, emotion) DO UPDATE SET"
+                f" count = count + excluded.count, feature_count = feature_count + excluded.feature_count, {updates}",
+                [(*key, *delta) for key, delta in deltas.items()],
+            )
+        return len(rows)
+
+    def timeline(self, user_id: str, since: Optional[float] = None, until: Optional[float] = None,
+                 limit: int = 100) -> List[Dict]:
+        """Raw events, newest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT ts, emotion, source, {', '.join(FEATURES)} FROM mood_events"
+                " WHERE user_id = ? AND ts >= ? AND ts < ? ORDER BY ts DESC LIMIT ?",
+                (user_id, since or 0, until or float("inf"), limit),
+            ).fetchall()
+        events = []
+        for ts, emotion, source, *values in rows:
+            event = {"ts": ts, "emotion": emotion, "source": source}
+            if all(v is not None for v in values):
+                event["features"] = dict(zip(FEATURES, values))
+            events.append(event)
+        return events
+
+    def rollups(self, user_id: str, granularity: str, since: Optional[float] = None,
+                until: Optional[float] = None) -> List[Dict]:
+        """One entry per non-empty bucket in [since, until), oldest first"""
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+        start = bucket_start(since, granularity) if since else 0
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT bucket, emotion, count, feature_count, {', '.join(f'sum_{f}' for f in FEATURES)}"
+                " FROM mood_rollups WHERE user_id = ? AND granularity = ? AND bucket >= ? AND bucket < ?"
+                " ORDER BY bucket",
+                (user_id, granularity, start, until or float("inf")),
+            ).fetchall()
+
+        buckets: Dict[int, Dict] = {}
+        for bucket, emotion, count, feature_count, *sums in rows:
+            entry = buckets.setdefault(bucket, {
+                "bucket": bucket, "counts": {e: 0 for e in EMOTIONS}, "total": 0,
+                "feature_count": 0, "sums": [0.0] * len(FEATURES),
+            })
+            entry["counts"][emotion] = entry["counts"].get(emotion, 0) + count
+            entry["total"] += count
+            entry["feature_count"] += feature_count
+            entry["sums"] = [a + b for a, b in zip(entry["sums"], sums)]
+
+        results = []
+        for entry in buckets.values():
+            sums = entry.pop("sums")
+            feature_count = entry.pop("feature_count")
+            entry["dominant"] = max(entry["counts"], key=entry["counts"].get)
+            entry["mean_features"] = (
+                {f: round(s / feature_count, 6) for f, s in zip(FEATURES, sums)} if feature_count else None
+            )
+            results.append(entry)
+        return results
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import os
+import secrets
+import time
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+from backend.app.services.spotify_scheduler import BACKGROUND, spotify_priority
+from backend.app.services.token_store import TokenStore
+from backend.app.utils.config import settings
+from backend.app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+TOKEN_REFRESHES = metrics.counter(
+    "mobrec_user_token_refresh_total", "User token refreshes by outcome (refreshed, revoked, failed)", ("outcome",)
+)
+
+# A token this close to expiry is treated as expired and refreshed before use
+MIN_VALIDITY_SECONDS = 10
+
+
+class SessionService:
+    """Spotify user tokens behind opaque session ids.
+
+    The OAuth callback stores the user's access and refresh tokens in the
+    TokenStore and gives the browser only a random session id. A background
+    task refreshes tokens TOKEN_REFRESH_MARGIN_SECONDS before they expire, so
+    requests find a valid token without calling the accounts endpoint; a token
+    that has already run out (nothing was running to refresh it) is refreshed
+    inline. Workers share the store and take a lease per refresh, so each
+    token is refreshed by one process only.
+    """
+
+    def __init__(self, spotify_service, store: TokenStore):
+        self.spotify_service = spotify_service
+        self.store = store
+        self._owner = f"{os.getpid()}-{secrets.token_hex(4)}"
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self._background: Optional[asyncio.Task] = None
+
+    async def login(self, code: str) -> Tuple[str, str]:
+        """Exchange an authorization code; returns (session id, Spotify user id)"""
+        token_info = await self.spotify_service.get_access_token(code)
+        user_id = await self.spotify_service.get_current_user_id(token_info["access_token"])
+        session_id = await asyncio.to_thread(
+            self.store.create, user_id, token_info["access_token"], token_info.get("refresh_token"),
+            time.time() + token_info["expires_in"],
+        )
+        return session_id, user_id
+
+    async def logout(self, session_id: str):
+        await asyncio.to_thread(self.store.delete, session_id)
+
+    def session_user(self, session_id: str) -> Optional[str]:
+        """Spotify user id of a session, without refreshing its token or marking it used (blocking: SQLite)"""
+        session = self.store.get(session_id, touch=False)
+        return session["user_id"] if session is not None else None
+
+    async def get_token(self, session_id: str) -> Optional[Tuple[str, str]]:
+        """(Spotify user id, valid access token) for a session, or None if unknown or revoked"""
+        session = await asyncio.to_thread(self.store.get, session_id)
+        if session is None:
+            return None
+        remaining = session["expires_at"] - time.time()
+        if remaining <= MIN_VALIDITY_SECONDS:
+            session = await self.refresh(session["session_key"])
+            if session is None:
+                return None
+        elif remaining <= settings.TOKEN_REFRESH_MARGIN_SECONDS:
+            # The background refresher is behind (or off); don't make this request wait for it
+            with spotify_priority(BACKGROUND):
+                asyncio.get_running_loop().create_task(self._refresh_quietly(session["session_key"]))
+        return session["user_id"], session["access_token"]
+
+    async def refresh(self, session_key: str) -> Optional[Dict]:
+        """Refresh one session's token, at most once at a time per process; None if it was revoked"""
+        task = self._refreshing.get(session_key)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._refresh(session_key))
+            self._refreshing[session_key] = task
+            task.add_done_callback(lambda _: self._refreshing.pop(session_key, None))
+        return await asyncio.shield(task)
+
+    async def _refresh_quietly(self, session_key: str):
+        try:
+            await self.refresh(session_key)
+        except Exception as e:
+            logger.warning(f"Background token refresh failed: {e}")
+
+    async def _refresh(self, session_key: str) -> Optional[Dict]:
+        deadline = time.time() + settings.TOKEN_LEASE_SECONDS
+        while True:
+            due_before = time.time() + settings.TOKEN_REFRESH_MARGIN_SECONDS
+            if await asyncio.to_thread(
+                self.store.acquire_lease, session_key, self._owner, settings.TOKEN_LEASE_SECONDS, due_before
+            ):
+                break
+            # Another worker holds the lease or has just refreshed: use its result
+            session = await asyncio.to_thread(self.store.get_by_key, session_key)
+            if session is None or session["expires_at"] >= due_before or time.time() > deadline:
+                return session
+            await asyncio.sleep(0.2)
+
+        session = await asyncio.to_thread(self.store.get_by_key, session_key)
+        if session is None or not session["refresh_token"]:
+            await asyncio.to_thread(self.store.release_lease, session_key, self._owner)
+            return session
+        try:
+            token_info = await self.spotify_service.refresh_user_token(session["refresh_token"])
+        except httpx.HTTPStatusError as e:
+            await asyncio.to_thread(self.store.release_lease, session_key, self._owner)
+            if e.response.status_code in (400, 401):
+                # invalid_grant: the user revoked access, the session is useless now
+                await asyncio.to_thread(self.store.delete_key, session_key)
+                TOKEN_REFRESHES.inc(outcome="revoked")
+                logger.info(f"Spotify refused the refresh token for user {session['user_id']}; session removed")
+                return None
+            TOKEN_REFRESHES.inc(outcome="failed")
+            raise
+        except Exception:
+            await asyncio.to_thread(self.store.release_lease, session_key, self._owner)
+            TOKEN_REFRESHES.inc(outcome="failed")
+            raise
+
+        session["access_token"] = token_info["access_token"]
+        session["expires_at"] = time.time() + token_info["expires_in"]
+        await asyncio.to_thread(
+            self.store.update_tokens, session_key, self._owner, session["access_token"],
+            token_info.get("refresh_token"), session["expires_at"],
+        )
+        TOKEN_REFRESHES.inc(outcome="refreshed")
+        return session
+
+    async def refresh_expiring(self) -> int:
+        """Refresh every recently used session that expires within the margin; returns how many"""
+        now = time.time()
+        keys = await asyncio.to_thread(
+            self.store.expiring, now + settings.TOKEN_REFRESH_MARGIN_SECONDS, now - settings.TOKEN_REFRESH_ACTIVE_SECONDS
+        )
+        refreshed = 0
+        for key in keys:
+            try:
+                if await self.refresh(key) is not None:
+                    refreshed += 1
+            except Exception as e:
+                logger.warning(f"Token refresh failed: {e}")
+        return refreshed
+
+    def start_background_refresh(self, interval: float):
+        if self._background is None or self._background.done():
+            self._background = asyncio.get_running_loop().create_task(self._background_refresh(interval))
+
+    async def stop_background_refresh(self):
+        if self._background is not None:
+            self._background.cancel()
+            try:
+                await self._background
+            except asyncio.CancelledError:
+                pass
+            self._background = None
+
+    async def _background_refresh(self, interval: float):
+        with spotify_priority(BACKGROUND):
+            while True:
+                try:
+                    await self.refresh_expiring()
+                    idle_before = time.time() - settings.SESSION_TTL_DAYS * 86400
+                    purged = await asyncio.to_thread(self.store.purge_idle, idle_before)
+                    if purged:
+                        logger.info(f"Removed {purged} idle sessions")
+                except Exception as e:
+                    logger.error(f"Token refresh pass failed: {e}")
+                await asyncio.sleep(interval)
@@ -0,0 +1,63 @@
+import hashlib
+import time
+from typing import Dict, List, Optional
+
+from backend.app.models.registry import registry
+from backend.app.services.history_store import HistoryStore
+from backend.app.services.snapshot_store import SnapshotStore
+from backend.app.utils.config import settings
+from backend.app.utils.metrics import metrics
+
+# Bump when the snapshot payload or the history scoring changes meaning
+SNAPSHOT_FORMAT = 2
+
+SNAPSHOT_LOOKUPS = metrics.counter(
+    "mobrec_snapshot_lookups_total", "Precomputed snapshot lookups by outcome (fresh, stale, missing)",
+    ("route", "outcome"),
+)
+
+
+def snapshot_version(catalog) -> str:
+    """Everything a snapshot depends on: its format and the catalog build the tracks came from"""
+    return f"{SNAPSHOT_FORMAT}:{catalog.version}"
+
+
+def history_digest(history: List[Dict]) -> str:
+    """Identifies the set of tracks a history mood was computed from (order doesn't change the mood)"""
+    ids = sorted(str((item.get("track") or {}).get("id") or item.get("id") or "") for item in history)
+    return hashlib.blake2b("\n".join(ids).encode("utf-8"), digest_size=16).hexdigest()
+
+
+class SnapshotService:
+    """Serves precomputed per-user results while they are still fresh.
+
+    A snapshot is fresh when it was made for the current catalog, is younger
+    than SNAPSHOT_MAX_AGE_SECONDS and no plays have been synced for the user
+    since it was computed (the stored history cursor hasn't moved).
+    """
+
+    def __init__(self, store: SnapshotStore, history_store: HistoryStore, catalog=None):
+        self.store = store
+        self.history_store = history_store
+        self._catalog = catalog
+
+    @property
+    def catalog(self):
+        if self._catalog is not None:
+            return self._catalog
+        return registry.get("catalog")
+
+    def fresh(self, user_id: str, route: str) -> Optional[Dict]:
+        """The user's snapshot, or None if there is none or it is out of date"""
+        if settings.SNAPSHOT_MAX_AGE_SECONDS <= 0:
+            return None
+        snapshot = self.store.get(user_id, snapshot_version(self.catalog))
+        if snapshot is None:
+            SNAPSHOT_LOOKUPS.inc(route=route, outcome="missing")
+            return None
+        if (time.time() - snapshot["computed_at"] > settings.SNAPSHOT_MAX_AGE_SECONDS
+                or snapshot["history_after"] != self.history_store.get_sync_state(user_id)["after"]):
+            SNAPSHOT_LOOKUPS.inc(route=route, outcome="stale")
+            return None
+        SNAPSHOT_LOOKUPS.inc(route=route, outcome="fresh")
+        return snapshot
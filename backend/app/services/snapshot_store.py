@@ -0,0 +1,111 @@
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from backend.app.utils.http_cache import dumps
+
+
+class SnapshotStore:
+    """Precomputed per-user results (emotion + recommendations) written by ``backend/precompute.py``.
+
+    One row per (user, version): payloads are zlib-compressed JSON, and the
+    version names everything the result depends on, so a new catalog build
+    simply stops matching old rows. The ``precompute_runs`` table is the
+    job's checkpoint: the last user (in id order) whose chunk is done,
+    updated in the same transaction as the snapshots, and in
+    ``precompute_failed`` the users of failed chunks, to retry on resume. Safe to share between
+    threads; several worker processes can open the same file (WAL mode).
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS snapshots ("
+                " user_id TEXT NOT NULL, version TEXT NOT NULL, computed_at REAL NOT NULL,"
+                " history_after INTEGER, payload BLOB NOT NULL, PRIMARY KEY (user_id, version))"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS precompute_runs ("
+                " run_id INTEGER PRIMARY KEY AUTOINCREMENT, version TEXT NOT NULL, started_at REAL NOT NULL,"
+                " finished_at REAL, last_user TEXT, done INTEGER NOT NULL DEFAULT 0, failed INTEGER NOT NULL DEFAULT 0)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS precompute_failed ("
+                " run_id INTEGER NOT NULL, user_id TEXT NOT NULL, PRIMARY KEY (run_id, user_id))"
+            )
+
+    def get(self, user_id: str, version: str) -> Optional[Dict]:
+        """{computed_at, history_after, **payload} or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT computed_at, history_after, payload FROM snapshots WHERE user_id = ? AND version = ?",
+                (user_id, version),
+            ).fetchone()
+        if row is None:
+            return None
+        return {"computed_at": row[0], "history_after": row[1], **json.loads(zlib.decompress(row[2]))}
+
+    def start_run(self, version: str, restart: bool = False) -> Dict:
+        """The unfinished run for ``version`` to resume, or a new one"""
+        with self._lock, self._conn:
+            row = None if restart else self._conn.execute(
+                "SELECT run_id, last_user, done, failed FROM precompute_runs"
+                " WHERE version = ? AND finished_at IS NULL ORDER BY run_id DESC LIMIT 1",
+                (version,),
+            ).fetchone()
+            if row is None:
+                cursor = self._conn.execute(
+                    "INSERT INTO precompute_runs (version, started_at) VALUES (?, ?)", (version, time.time())
+                )
+                row = (cursor.lastrowid, None, 0, 0)
+            failed_users = [r[0] for r in self._conn.execute(
+                "SELECT user_id FROM precompute_failed WHERE run_id = ? ORDER BY user_id", (row[0],)
+            )]
+        return {"run_id": row[0], "version": version, "last_user": row[1], "done": row[2], "failed": row[3],
+                "failed_users": failed_users}
+
+    def checkpoint(self, run_id: int, version: str, snapshots: List[Tuple[str, Optional[int], Dict]],
+                   last_user: str, failed: Sequence[str] = ()):
+        """Write a chunk of (user_id, history_after, payload) and advance the run past ``last_user``.
+
+        ``failed`` users are kept for a retry when the run resumes; a written
+        snapshot clears its user from that list.
+        """
+        now = time.time()
+        rows = [(user_id, version, now, after, zlib.compress(dumps(payload))) for user_id, after, payload in snapshots]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?, ?)", rows)
+            self._conn.executemany(
+                "DELETE FROM precompute_failed WHERE run_id = ? AND user_id = ?", [(run_id, row[0]) for row in rows]
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO precompute_failed VALUES (?, ?)", [(run_id, user_id) for user_id in failed]
+            )
+            # Retried users sort before the checkpoint, which must not move back
+            self._conn.execute(
+                "UPDATE precompute_runs SET last_user = MAX(COALESCE(last_user, ?), ?), done = done + ?,"
+                " failed = (SELECT COUNT(*) FROM precompute_failed WHERE run_id = ?) WHERE run_id = ?",
+                (last_user, last_user, len(rows), run_id, run_id),
+            )
+
+    def finish_run(self, run_id: int):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE precompute_runs SET finished_at = ? WHERE run_id = ?", (time.time(), run_id))
+
+    def prune(self, keep_version: str) -> int:
+        """Delete snapshots of every other version; returns rows removed"""
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM snapshots WHERE version != ?", (keep_version,)).rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
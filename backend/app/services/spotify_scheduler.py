@@ -0,0 +1,200 @@
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import logging
+import random
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from backend.app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+_priority: contextvars.ContextVar = contextvars.ContextVar("spotify_priority", default=INTERACTIVE)
+
+QUEUE_WAIT = metrics.histogram(
+    "mobrec_spotify_queue_wait_seconds", "Time Spotify calls wait for a rate-limit slot", ("priority",)
+)
+RETRIES = metrics.counter("mobrec_spotify_retries_total", "Spotify calls retried", ("endpoint", "reason"))
+COALESCED = metrics.counter("mobrec_spotify_coalesced_total", "GETs answered by an identical in-flight call", ("endpoint",))
+
+RETRYABLE_STATUS = {429, 502, 503, 504}
+
+
+@contextlib.contextmanager
+def spotify_priority(level: int):
+    """Run the Spotify calls made inside the block (and tasks started from it) at ``level``"""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    value = response.headers.get("retry-after")
+    try:
+        return max(float(value), 0.0) if value is not None else None
+    except ValueError:
+        return None
+
+
+class SpotifyScheduler:
+    """Single gate for outbound Spotify calls.
+
+    * token bucket: at most ``rate`` calls per second with bursts up to ``burst``
+    * priority: waiting interactive calls always get the next slot before
+      background ones (history sync, precompute)
+    * 429 / 5xx: the call is retried after ``Retry-After`` (or exponential
+      backoff with jitter), and a 429 pauses everyone, since the quota is
+      app-wide; interactive calls give up instead of waiting past ``max_wait``
+    * coalescing: identical GETs in flight share one upstream call
+    """
+
+    def __init__(self, rate: float, burst: int, max_retries: int = 3, max_wait: float = 10.0,
+                 backoff_base: float = 0.5):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_retries = max_retries
+        self.max_wait = max_wait
+        self.backoff_base = backoff_base
+        self._tokens = float(self.burst)
+        self._updated: Optional[float] = None
+        self._blocked_until = 0.0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._inflight: Dict[str, asyncio.Task] = {}
+        metrics.callback(
+            "mobrec_spotify_queue_depth", "Spotify calls waiting for a rate-limit slot",
+            lambda: self.queue_depth(), ("priority",),
+        )
+
+    def queue_depth(self) -> Dict[Tuple[str], int]:
+        depth = {(name,): 0 for name in PRIORITY_NAMES.values()}
+        for level, _, future in self._waiters:
+            if not future.done():
+                depth[(PRIORITY_NAMES.get(level, str(level)),)] += 1
+        return depth
+
+    # Rate limiting
+
+    def _refill(self, now: float):
+        if self._updated is not None and self.rate > 0:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def _acquire(self, level: int):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        self._refill(now)
+        if self.rate <= 0:
+            if now < self._blocked_until:
+                await asyncio.sleep(self._blocked_until - now)
+            return
+        if not self._waiters and now >= self._blocked_until and self._tokens >= 1:
+            self._tokens -= 1
+            return
+
+        future = loop.create_future()
+        heapq.heappush(self._waiters, (level, next(self._sequence), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._dispatcher = loop.create_task(self._dispatch())
+        with QUEUE_WAIT.time(priority=PRIORITY_NAMES.get(level, str(level))):
+            await future
+
+    async def _dispatch(self):
+        """Hand out slots to waiters in priority order as tokens become available"""
+        loop = asyncio.get_running_loop()
+        while self._waiters:
+            now = loop.time()
+            self._refill(now)
+            if now < self._blocked_until:
+                delay = self._blocked_until - now
+            elif self._tokens >= 1:
+                _, _, future = heapq.heappop(self._waiters)
+                if not future.done():  # the caller may have been cancelled meanwhile
+                    self._tokens -= 1
+                    future.set_result(None)
+                continue
+            else:
+                delay = (1 - self._tokens) / self.rate
+            self._wakeup.clear()
+            try:
+                # A new Retry-After can move the deadline; wake early to re-check
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _pause(self, seconds: float):
+        loop = asyncio.get_running_loop()
+        self._blocked_until = max(self._blocked_until, loop.time() + seconds)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    # Calls
+
+    async def submit(self, send: Callable[[], Awaitable[httpx.Response]], endpoint: str = "",
+                     key: Optional[str] = None, idempotent: bool = False) -> httpx.Response:
+        """Run ``send`` under the rate limit; ``key`` enables coalescing with identical calls"""
+        if key is None:
+            return await self._execute(send, endpoint, idempotent)
+        task = self._inflight.get(key)
+        if task is not None:
+            COALESCED.inc(endpoint=endpoint)
+        else:
+            # A separate task, so one caller disconnecting doesn't cancel the call for the others
+            task = asyncio.get_running_loop().create_task(self._execute(send, endpoint, idempotent))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        return await asyncio.shield(task)
+
+    def _finished(self, key: str, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # retrieved here too, in case every caller went away
+
+    async def _execute(self, send, endpoint: str, idempotent: bool) -> httpx.Response:
+        level = _priority.get()
+        attempt = 0
+        while True:
+            await self._acquire(level)
+            try:
+                response = await send()
+            except httpx.TransportError as e:
+                if not idempotent or attempt >= self.max_retries:
+                    raise
+                RETRIES.inc(endpoint=endpoint, reason=type(e).__name__)
+                await asyncio.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+
+            status = response.status_code
+            if status not in RETRYABLE_STATUS or (status != 429 and not idempotent):
+                return response
+            wait = _retry_after(response)
+            if status == 429:
+                wait = wait if wait is not None else self._backoff(attempt)
+                self._pause(wait)
+                logger.warning(f"Spotify rate limit hit on {endpoint}, pausing {wait:.1f}s")
+            else:
+                wait = wait if wait is not None else self._backoff(attempt)
+            if attempt >= self.max_retries or (level == INTERACTIVE and wait > self.max_wait):
+                return response
+            RETRIES.inc(endpoint=endpoint, reason=str(status))
+            if status != 429:
+                await asyncio.sleep(wait)
+            attempt += 1
+
+    def _backoff(self, attempt: int) -> float:
+        return self.backoff_base * (2 ** attempt) * (0.5 + random.random())
@@ -1,25 +1,113 @@
+import asyncio
 import base64
-import requests
+import httpx
 import os
+import time
 from datetime import datetime, timedelta
 from urllib.parse import urlencode
 import logging
+from typing import Dict, List, Optional
+from backend.app.models.emotion_models import EMOTIONS, FEATURE_WEIGHTS, FEATURES
+from backend.app.models.registry import registry
+from backend.app.schemas.spotify import AudioFeatures
+from backend.app.services.spotify_scheduler import SpotifyScheduler
+from backend.app.utils.config import settings
+from backend.app.utils.metrics import STAGE_SECONDS, metrics
+
+SPOTIFY_LATENCY = metrics.histogram(
+    "mobrec_spotify_request_duration_seconds", "Outbound Spotify HTTP calls", ("method", "endpoint", "status")
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def _http2_available():
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def recommend_tracks(catalog, mood: str, language=None, limit: int = 20, offset: int = 0, genre=None) -> List[Dict]:
+    """Catalog tracks closest to the mood's feature profile; needs no Spotify credentials"""
+    if mood not in EMOTIONS:
+        raise Exception(f"Recommendations not available for mood: {mood}")
+
+    centroid = [FEATURE_WEIGHTS[feature][mood] for feature in FEATURES]
+    languages = [language] if isinstance(language, str) else language
+    genres = [genre] if isinstance(genre, str) else genre
+    return catalog.nearest(centroid, limit=limit, offset=offset, languages=languages, genres=genres)
+
 class SpotifyService:
-    def __init__(self, client_id=None, client_secret=None, redirect_uri=None):
+    def __init__(self, client_id=None, client_secret=None, redirect_uri=None,
+                 accounts_url=None, api_url=None, http_client=None, feature_cache=None, catalog=None,
+                 scheduler=None):
         self.client_id = client_id or os.getenv("SPOTIFY_CLIENT_ID")
         self.client_secret = client_secret or os.getenv("SPOTIFY_CLIENT_SECRET")
         self.redirect_uri = redirect_uri or os.getenv("SPOTIFY_REDIRECT_URI")
+        # Base URLs are configurable so the client can be pointed at a local fake server
+        self.accounts_url = (accounts_url or settings.SPOTIFY_ACCOUNTS_URL).rstrip("/")
+        self.api_url = (api_url or settings.SPOTIFY_API_URL).rstrip("/")
         self.access_token = None
         self.token_expiration = datetime.utcnow()
+        self._client = http_client
+        self._token_lock = asyncio.Lock()
+        self.feature_cache = feature_cache
+        self._catalog = catalog
+        # Every outbound call goes through one rate limiter / retry / coalescing gate
+        self.scheduler = scheduler or SpotifyScheduler(
+            rate=settings.SPOTIFY_RATE_LIMIT,
+            burst=settings.SPOTIFY_RATE_BURST,
+            max_retries=settings.SPOTIFY_MAX_RETRIES,
+            max_wait=settings.SPOTIFY_MAX_WAIT_SECONDS,
+            backoff_base=settings.SPOTIFY_BACKOFF_SECONDS,
+        )
 
         if not all([self.client_id, self.client_secret, self.redirect_uri]):
             raise ValueError("Missing Spotify credentials.")
 
-    def _refresh_access_token(self):
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Shared keep-alive connection pool, created on first use"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=settings.SPOTIFY_HTTP2 and _http2_available(),
+                limits=httpx.Limits(
+                    max_connections=settings.SPOTIFY_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.SPOTIFY_MAX_KEEPALIVE,
+                    keepalive_expiry=settings.SPOTIFY_KEEPALIVE_EXPIRY,
+                ),
+                timeout=httpx.Timeout(settings.SPOTIFY_TIMEOUT, connect=settings.SPOTIFY_CONNECT_TIMEOUT),
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _request(self, method, url, **kwargs) -> httpx.Response:
+        endpoint = httpx.URL(url).path
+        key = None
+        if method == "GET":
+            # Identical GETs (same URL, query and caller token) can share one upstream call
+            full_url = httpx.URL(url, params=kwargs.get("params"))
+            key = f"{full_url}|{(kwargs.get('headers') or {}).get('Authorization', '')}"
+        return await self.scheduler.submit(
+            lambda: self._send(method, url, endpoint, **kwargs), endpoint=endpoint, key=key, idempotent=method == "GET"
+        )
+
+    async def _send(self, method, url, endpoint, **kwargs) -> httpx.Response:
+        started = time.perf_counter()
+        status = "error"
+        try:
+            response = await self.client.request(method, url, **kwargs)
+            status = response.status_code
+            return response
+        finally:
+            SPOTIFY_LATENCY.observe(time.perf_counter() - started, method=method, endpoint=endpoint, status=status)
+
+    async def _refresh_access_token(self):
         """Uses client credentials flow"""
         logger.info("Refreshing Spotify access token...")
 
@@ -33,7 +121,7 @@ class SpotifyService:
             "grant_type": "client_credentials"
         }
 
-        response = requests.post("https://accounts.spotify.com/api/token", headers=headers, data=data)
+        response = await self._request("POST", f"{self.accounts_url}/api/token", headers=headers, data=data)
         response.raise_for_status()
         token_info = response.json()
 
@@ -41,9 +129,17 @@ class SpotifyService:
         self.token_expiration = datetime.utcnow() + timedelta(seconds=token_info["expires_in"])
         logger.info("Spotify token refreshed.")
 
-    def _ensure_token(self):
-        if not self.access_token or datetime.utcnow() >= self.token_expiration:
-            self._refresh_access_token()
+    def _token_valid(self):
+        return self.access_token and datetime.utcnow() < self.token_expiration
+
+    async def _ensure_token(self):
+        if self._token_valid():
+            return
+        # Single-flight: the first caller refreshes, everyone else waits for it
+        async with self._token_lock:
+            if not self._token_valid():
+                with STAGE_SECONDS.time(stage="token_refresh"):
+                    await self._refresh_access_token()
 
     def get_auth_url(self):
         """Use for Authorization Code Flow (user access)"""
@@ -53,9 +149,9 @@ class SpotifyService:
             "redirect_uri": self.redirect_uri,
             "scope": "user-read-recently-played user-top-read",
         }
-        return f"https://accounts.spotify.com/authorize?{urlencode(params)}"
+        return f"{self.accounts_url}/authorize?{urlencode(params)}"
 
-    def get_access_token(self, code):
+    async def get_access_token(self, code):
         """Authorization Code Flow - exchange code for access token"""
         data = {
             "grant_type": "authorization_code",
@@ -69,65 +165,134 @@ class SpotifyService:
             "Content-Type": "application/x-www-form-urlencoded"
         }
 
-        response = requests.post("https://accounts.spotify.com/api/token", data=data, headers=headers)
+        response = await self._request("POST", f"{self.accounts_url}/api/token", data=data, headers=headers)
         response.raise_for_status()
         return response.json()
 
-    def get_valid_seed_genres(self):
-        self._ensure_token()
+    async def get_valid_seed_genres(self):
+        await self._ensure_token()
 
-        endpoint = "https://api.spotify.com/v1/recommendations/available-genre-seeds"
+        endpoint = f"{self.api_url}/recommendations/available-genre-seeds"
         headers = {
             "Authorization": f"Bearer {self.access_token}"
         }
 
         logger.info(f"Getting seed genres with token: {self.access_token}")
-        response = requests.get(endpoint, headers=headers)
+        response = await self._request("GET", endpoint, headers=headers)
         response.raise_for_status()
         return response.json().get("genres", [])
 
-    def get_recommendations(self, mood: str, language: str = None):
-        """Returns predefined recommendations based on mood (happy, sad, etc.) and language"""
-        predefined_recommendations = {
-            "happy": [
-                {"name": "Happy", "artists": ["Pharrell Williams"], "url": "https://spotify.com", "preview_url": "https://open.spotify.com/track/0h1ti3sC21H94a8sqAlpcj", "album_image": "https://i.scdn.co/image/ab67616d0000b2731e95a7226d90393c8ff3bc36"},
-                {"name": "Can't Stop the Feeling!", "artists": ["Justin Timberlake"], "url": "https://spotify.com", "preview_url": "https://open.spotify.com/track/6J6R3ZuBYE8BhUcu57NE7u", "album_image": "https://i.scdn.co/image/ab67616d0000b27317cced61f45e912a8db0e06c"},
-                {"name": "Shake It Off", "artists": ["Taylor Swift"], "url": "https://spotify.com", "preview_url": "https://open.spotify.com/track/6cD1rZd7gVORdpUyNs5Ics", "album_image": "https://i.scdn.co/image/ab67616d0000b2731b411e747456705f79f05651"}
-            ],
-            "sad": [
-                {"name": "Someone Like You", "artists": ["Adele"], "url": "https://spotify.com", "preview_url": "https://open.spotify.com/track/7mH9W1QZbwzQktoc32Bh8V", "album_image": "https://i.scdn.co/image/ab67616d0000b273cc1638e2b5d85b616189af9b"},
-                {"name": "The Night We Met", "artists": ["Lord Huron"], "url": "https://spotify.com", "preview_url": "https://open.spotify.com/track/4j6B8QjIHb6b27bS2ec9V0", "album_image": "https://i.scdn.co/image/ab67616d0000b273111b6f59b0f3b4d1182b871f"},
-                {"name": "All I Want", "artists": ["Kodaline"], "url": "https://spotify.com", "preview_url": "https://open.spotify.com/track/39jmjc5oRJrFVeLR9lt7bY", "album_image": "https://i.scdn.co/image/ab67616d0000b27347ec233f7b7359a7647f87b1"}
-            ]
-        }
-
-        if mood not in predefined_recommendations:
-            raise Exception(f"Recommendations not available for mood: {mood}")
-
-        # Filter by language if provided (for now, assuming `language` is a valid language filter)
-        mood_recommendations = predefined_recommendations[mood]
-
-        if language:
-            # Apply language-based filter here (dummy logic for now)
-            mood_recommendations = [track for track in mood_recommendations if language.lower() in track["name"].lower()]
+    @property
+    def catalog(self):
+        """Track catalog, shared process-wide through the model registry unless injected"""
+        if self._catalog is not None:
+            return self._catalog
+        return registry.get("catalog")
 
-        return mood_recommendations
+    def get_recommendations(self, mood: str, language: str = None, limit: int = 20, offset: int = 0, genre: str = None):
+        """Tracks from the catalog whose audio features are closest to the mood's profile"""
+        return recommend_tracks(self.catalog, mood, language=language, limit=limit, offset=offset, genre=genre)
 
-    def get_user_listening_history(self, token: str):
+    async def get_user_listening_history(self, token: str):
         """Fetch user listening history using a user access token"""
+        page = await self.get_recently_played_page(token)
+        return page.get("items", [])
+
+    async def get_recently_played_page(self, token: str, after: int = None, limit: int = 50):
+        """One page of /me/player/recently-played; `after` is a unix ms cursor"""
         headers = {
             "Authorization": f"Bearer {token}"
         }
+        params = {"limit": limit}
+        if after:
+            params["after"] = after
 
-        response = requests.get("https://api.spotify.com/v1/me/player/recently-played", headers=headers)
+        response = await self._request("GET", f"{self.api_url}/me/player/recently-played", headers=headers, params=params)
         if response.status_code != 200:
             logger.error(f"Spotify user history error: {response.status_code} - {response.text}")
             raise Exception("Failed to fetch user listening history.")
 
-        return response.json().get("items", [])
+        return response.json()
+
+    async def get_current_user_id(self, token: str):
+        """Spotify user id for a user access token"""
+        headers = {
+            "Authorization": f"Bearer {token}"
+        }
+
+        response = await self._request("GET", f"{self.api_url}/me", headers=headers)
+        if response.status_code != 200:
+            logger.error(f"Spotify profile error: {response.status_code} - {response.text}")
+            raise Exception("Failed to fetch Spotify user profile.")
+
+        return response.json()["id"]
+
+    async def get_audio_features(self, track_ids: List[str]) -> Dict[str, Optional[AudioFeatures]]:
+        """Audio features for many tracks: cached ones first, the rest in concurrent batches of 100"""
+        track_ids = list(dict.fromkeys(t for t in track_ids if t))
+        found, missing = self.feature_cache.get_memory(track_ids) if self.feature_cache else ({}, track_ids)
+        if missing and self.feature_cache:
+            # Only the LRU misses need SQLite, off the event loop
+            found.update(await asyncio.to_thread(self.feature_cache.get_many, missing))
+            missing = [t for t in missing if t not in found]
+        if not missing:
+            return found
+
+        await self._ensure_token()
+        semaphore = asyncio.Semaphore(settings.SPOTIFY_FEATURE_CONCURRENCY)
+        batch_size = settings.SPOTIFY_FEATURE_BATCH_SIZE
+
+        async def fetch(batch):
+            async with semaphore:
+                response = await self._request(
+                    "GET",
+                    f"{self.api_url}/audio-features",
+                    headers={"Authorization": f"Bearer {self.access_token}"},
+                    params={"ids": ",".join(batch)},
+                )
+            response.raise_for_status()
+            # Spotify returns null for tracks without features, in request order
+            return {
+                track_id: AudioFeatures.parse_obj(item) if item else None
+                for track_id, item in zip(batch, response.json().get("audio_features", []))
+            }
+
+        batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+        fetched = {}
+        for result in await asyncio.gather(*(fetch(b) for b in batches), return_exceptions=True):
+            if isinstance(result, Exception):
+                logger.error(f"Audio features batch failed: {result}")
+                continue
+            fetched.update(result)
 
-    def refresh_user_token(self, refresh_token):
-        """Optional: Refresh user token using refresh_token (if needed for user login flow)"""
+        if self.feature_cache and fetched:
+            await asyncio.to_thread(self.feature_cache.put_many, fetched)
+        found.update(fetched)
+        return found
+
+    async def resolve_history_features(self, history: List[Dict]) -> List[Dict]:
+        """Copy of history with each item's audio features merged in at the top level"""
+        def track_id(item):
+            return (item.get("track") or {}).get("id") or item.get("id")
+
+        wanted = [track_id(item) for item in history if "valence" not in item]
+        if not any(wanted):
+            return history
+
+        try:
+            features = await self.get_audio_features(wanted)
+        except Exception as e:
+            logger.error(f"Could not resolve audio features: {e}")
+            return history
+
+        resolved = []
+        for item in history:
+            f = features.get(track_id(item)) if "valence" not in item else None
+            resolved.append({**item, **f.dict(exclude_none=True)} if f is not None else item)
+        return resolved
+
+    async def refresh_user_token(self, refresh_token):
+        """New access token for a user's refresh token; the app's own token is left alone"""
         data = {
             "grant_type": "refresh_token",
             "refresh_token": refresh_token,
@@ -139,12 +304,9 @@ class SpotifyService:
             "Content-Type": "application/x-www-form-urlencoded"
         }
 
-        response = requests.post("https://accounts.spotify.com/api/token", data=data, headers=headers)
+        response = await self._request("POST", f"{self.accounts_url}/api/token", data=data, headers=headers)
         response.raise_for_status()
-        token_info = response.json()
-        self.access_token = token_info["access_token"]
-        self.token_expiration = datetime.utcnow() + timedelta(seconds=token_info["expires_in"])
-        return token_info
+        return response.json()
 
 # Example Usage:
 if __name__ == "__main__":
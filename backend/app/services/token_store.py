@@ -0,0 +1,137 @@
+import hashlib
+import secrets
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+# last_seen only drives refresh activity and idle expiry, so minute resolution is plenty
+TOUCH_SECONDS = 60
+
+
+def _key(session_id: str) -> str:
+    # Only a hash of the session id is stored, so a leaked database can't be replayed as cookies
+    return hashlib.sha256(session_id.encode()).hexdigest()
+
+
+class TokenStore:
+    """Spotify user tokens keyed by an opaque session id, in SQLite.
+
+    Several worker processes open the same file (WAL mode), so a session
+    created by one worker is usable by all of them. Refreshes are coordinated
+    with a lease column: only the process holding an unexpired lease on a
+    session refreshes it. Safe to share between threads.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS user_tokens ("
+                " session_key TEXT PRIMARY KEY, user_id TEXT NOT NULL, access_token TEXT NOT NULL,"
+                " refresh_token TEXT, expires_at REAL NOT NULL, last_seen REAL NOT NULL,"
+                " lease_owner TEXT, lease_until REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS user_tokens_expires ON user_tokens (expires_at)")
+
+    def create(self, user_id: str, access_token: str, refresh_token: Optional[str], expires_at: float) -> str:
+        """Store a new session and return its id (the only copy of it)"""
+        session_id = secrets.token_urlsafe(32)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO user_tokens (session_key, user_id, access_token, refresh_token, expires_at, last_seen)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (_key(session_id), user_id, access_token, refresh_token, expires_at, time.time()),
+            )
+        return session_id
+
+    def get(self, session_id: str, touch: bool = True) -> Optional[Dict]:
+        """{session_key, user_id, access_token, refresh_token, expires_at, last_seen} or None
+
+        ``touch`` records the use in last_seen, written at most every
+        TOUCH_SECONDS per session so reads don't turn into write transactions.
+        """
+        session = self.get_by_key(_key(session_id))
+        if session is None:
+            return None
+        now = time.time()
+        if touch and now - session["last_seen"] >= TOUCH_SECONDS:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "UPDATE user_tokens SET last_seen = ? WHERE session_key = ?", (now, session["session_key"])
+                )
+        return session
+
+    def get_by_key(self, session_key: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT user_id, access_token, refresh_token, expires_at, last_seen FROM user_tokens"
+                " WHERE session_key = ?",
+                (session_key,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {"session_key": session_key, "user_id": row[0], "access_token": row[1],
+                "refresh_token": row[2], "expires_at": row[3], "last_seen": row[4] or 0}
+
+    def expiring(self, before: float, seen_after: float = 0, limit: int = 100) -> List[str]:
+        """Keys of sessions used since ``seen_after`` whose token expires before ``before`` and nobody is refreshing"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT session_key FROM user_tokens WHERE expires_at < ? AND last_seen >= ?"
+                " AND refresh_token IS NOT NULL AND (lease_until IS NULL OR lease_until < ?)"
+                " ORDER BY expires_at LIMIT ?",
+                (before, seen_after, time.time(), limit),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def acquire_lease(self, session_key: str, owner: str, seconds: float, expiring_before: float) -> bool:
+        """Claim the right to refresh a session; False if another process holds it or already refreshed"""
+        now = time.time()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE user_tokens SET lease_owner = ?, lease_until = ?"
+                " WHERE session_key = ? AND expires_at < ? AND (lease_until IS NULL OR lease_until < ?)",
+                (owner, now + seconds, session_key, expiring_before, now),
+            )
+        return cursor.rowcount == 1
+
+    def update_tokens(self, session_key: str, owner: str, access_token: str, refresh_token: Optional[str],
+                      expires_at: float):
+        """Store refreshed tokens and release the lease; Spotify may or may not rotate the refresh token"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE user_tokens SET access_token = ?, refresh_token = COALESCE(?, refresh_token),"
+                " expires_at = ?, lease_owner = NULL, lease_until = NULL"
+                " WHERE session_key = ? AND lease_owner = ?",
+                (access_token, refresh_token, expires_at, session_key, owner),
+            )
+
+    def release_lease(self, session_key: str, owner: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE user_tokens SET lease_owner = NULL, lease_until = NULL WHERE session_key = ? AND lease_owner = ?",
+                (session_key, owner),
+            )
+
+    def delete(self, session_id: str):
+        self.delete_key(_key(session_id))
+
+    def delete_key(self, session_key: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM user_tokens WHERE session_key = ?", (session_key,))
+
+    def purge_idle(self, idle_before: float) -> int:
+        """Forget sessions not used since ``idle_before``; returns how many"""
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM user_tokens WHERE last_seen < ?", (idle_before,)).rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
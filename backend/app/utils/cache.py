@@ -0,0 +1,147 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """Thread-safe in-process cache bounded by entry count, with optional TTL"""
+
+    remote = False
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and self.ttl_seconds and entry[1] < time.monotonic():
+                del self._data[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def get_many(self, keys: List[str]) -> List[Optional[Any]]:
+        return [self.get(key) for key in keys]
+
+    def set(self, key: str, value: Any):
+        expires = time.monotonic() + self.ttl_seconds if self.ttl_seconds else 0
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def set_many(self, items: Dict[str, Any]):
+        for key, value in items.items():
+            self.set(key, value)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class SharedCache:
+    """Local LRU in front of a Redis cache shared by every worker.
+
+    Values must be JSON-serialisable. Redis errors are logged and treated as
+    misses so the cache can never fail a request.
+    """
+
+    remote = True
+
+    def __init__(self, url: str, max_entries: int = 10000, ttl_seconds: float = 0, namespace: str = "mobrec"):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("A shared cache needs the redis package: pip install redis") from e
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5)
+        self.local = LRUCache(max_entries, ttl_seconds)
+        self.ttl_seconds = ttl_seconds
+        self.namespace = namespace
+        self.shared_hits = 0
+        self.shared_misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.get_many([key])[0]
+
+    def get_many(self, keys: List[str]) -> List[Optional[Any]]:
+        values = self.local.get_many(keys)
+        missing = [i for i, value in enumerate(values) if value is None]
+        if not missing:
+            return values
+        try:
+            shared = self.client.mget([f"{self.namespace}:{keys[i]}" for i in missing])
+        except Exception as e:
+            logger.warning(f"Shared cache lookup failed: {e}")
+            return values
+        for i, raw in zip(missing, shared):
+            if raw is None:
+                self.shared_misses += 1
+                continue
+            self.shared_hits += 1
+            values[i] = json.loads(raw)
+            self.local.set(keys[i], values[i])
+        return values
+
+    def set(self, key: str, value: Any):
+        self.set_many({key: value})
+
+    def set_many(self, items: Dict[str, Any]):
+        self.local.set_many(items)
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for key, value in items.items():
+                pipe.set(f"{self.namespace}:{key}", json.dumps(value), ex=int(self.ttl_seconds) or None)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Shared cache write failed: {e}")
+
+    def clear(self):
+        self.local.clear()
+
+    def stats(self) -> Dict:
+        stats = self.local.stats()
+        lookups = stats["hits"] + self.shared_hits + self.shared_misses
+        stats.update({
+            "shared_hits": self.shared_hits,
+            "shared_misses": self.shared_misses,
+            "hit_rate": (stats["hits"] + self.shared_hits) / lookups if lookups else 0.0,
+        })
+        return stats
+
+
+def create_cache(max_entries: int, ttl_seconds: float = 0, url: str = "", namespace: str = "mobrec"):
+    """In-process LRU, or a Redis-backed shared cache when `url` is set"""
+    if url:
+        return SharedCache(url, max_entries, ttl_seconds, namespace)
+    return LRUCache(max_entries, ttl_seconds)
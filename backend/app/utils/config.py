@@ -1,3 +1,4 @@
+import json
 import os
 from pathlib import Path
 from dotenv import load_dotenv
@@ -13,21 +14,184 @@ class Settings:
     SPOTIFY_CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
     SPOTIFY_CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET")
     SPOTIFY_REDIRECT_URI = os.getenv("SPOTIFY_REDIRECT_URI", "http://localhost:8000/spotify-callback")
+    # Where /spotify-callback sends the browser after login
+    FRONTEND_URL = os.getenv("FRONTEND_URL", "https://b390-2401-4900-4df9-d2da-782a-ec44-aee4-8c34.ngrok-free.app").rstrip("/")
+
+    # Spotify HTTP client: base URLs (override to point at a fake server),
+    # connection pool and timeouts in seconds. HTTP/2 is used when h2 is installed.
+    SPOTIFY_ACCOUNTS_URL = os.getenv("SPOTIFY_ACCOUNTS_URL", "https://accounts.spotify.com")
+    SPOTIFY_API_URL = os.getenv("SPOTIFY_API_URL", "https://api.spotify.com/v1")
+    SPOTIFY_HTTP2 = os.getenv("SPOTIFY_HTTP2", "true").lower() in ("1", "true", "yes")
+    SPOTIFY_MAX_CONNECTIONS = int(os.getenv("SPOTIFY_MAX_CONNECTIONS", "100"))
+    SPOTIFY_MAX_KEEPALIVE = int(os.getenv("SPOTIFY_MAX_KEEPALIVE", "20"))
+    SPOTIFY_KEEPALIVE_EXPIRY = float(os.getenv("SPOTIFY_KEEPALIVE_EXPIRY", "30"))
+    SPOTIFY_TIMEOUT = float(os.getenv("SPOTIFY_TIMEOUT", "10"))
+    SPOTIFY_CONNECT_TIMEOUT = float(os.getenv("SPOTIFY_CONNECT_TIMEOUT", "5"))
     
     # Model paths - these should be created when you train the models
     MODELS_DIR = BASE_DIR / "models"
     
     # Text emotion model
-    TEXT_MODEL_PATH = MODELS_DIR / "text_emotion_model.joblib"
+    TEXT_MODEL_PATH = Path(os.getenv("TEXT_MODEL_PATH", str(MODELS_DIR / "text_emotion_model.joblib")))
     
     # Listening history model
     HISTORY_MODEL_PATH = MODELS_DIR / "history_emotion_model.joblib"
     
     # Text vectorizer
-    VECTORIZER_PATH = MODELS_DIR / "tfidf_vectorizer.joblib"
+    VECTORIZER_PATH = Path(os.getenv("VECTORIZER_PATH", str(MODELS_DIR / "text_vectorizer.joblib")))
+
+    # Model cascade: the trained text model answers first and only texts whose
+    # top probability is below the threshold go on to the sentiment model.
+    # CASCADE_THRESHOLDS overrides it per emotion, e.g. '{"romantic": 0.9}'.
+    CASCADE_ENABLED = os.getenv("CASCADE_ENABLED", "true").lower() in ("1", "true", "yes")
+    CASCADE_THRESHOLD = float(os.getenv("CASCADE_THRESHOLD", "0.8"))
+    CASCADE_THRESHOLDS = json.loads(os.getenv("CASCADE_THRESHOLDS", "{}"))
+
+    # Emotion keyword lexicon (versioned JSON); re-read when the file changes,
+    # checked at most every LEXICON_RELOAD_SECONDS (0 disables hot reload)
+    LEXICON_PATH = Path(os.getenv("LEXICON_PATH", str(BASE_DIR / "app" / "data" / "emotion_lexicon.json")))
+    LEXICON_RELOAD_SECONDS = float(os.getenv("LEXICON_RELOAD_SECONDS", "5"))
+
+    # Recommendation catalog: a columnar directory built with
+    # backend/build_catalog.py (memory-mapped, shared by all workers), or a
+    # JSON / JSON lines / CSV track dump parsed at startup
+    CATALOG_PATH = Path(os.getenv("CATALOG_PATH", str(BASE_DIR / "app" / "data" / "catalog.json")))
+    RECOMMENDATION_MAX_LIMIT = int(os.getenv("RECOMMENDATION_MAX_LIMIT", "100"))
+
+    # Text emotion result cache. Entries are a hash key plus six floats, so
+    # TEXT_CACHE_MAX_ENTRIES bounds memory (~100k entries is roughly 30 MB).
+    # Set TEXT_CACHE_URL (redis://...) to share results between workers.
+    TEXT_CACHE_MAX_ENTRIES = int(os.getenv("TEXT_CACHE_MAX_ENTRIES", "100000"))
+    TEXT_CACHE_TTL_SECONDS = float(os.getenv("TEXT_CACHE_TTL_SECONDS", "86400"))
+    TEXT_CACHE_URL = os.getenv("TEXT_CACHE_URL", "")
+
+    # Sentiment inference backend: "torch" (reference fp32 pipeline) or
+    # "onnx" (ONNX Runtime, export with backend/export_onnx.py first)
+    SENTIMENT_BACKEND = os.getenv("SENTIMENT_BACKEND", "torch")
+    SENTIMENT_MODEL_NAME = os.getenv("SENTIMENT_MODEL_NAME", "distilbert-base-uncased-finetuned-sst-2-english")
+    ONNX_MODEL_DIR = Path(os.getenv("ONNX_MODEL_DIR", str(MODELS_DIR / "sentiment-onnx")))
+    ONNX_QUANTIZED = os.getenv("ONNX_QUANTIZED", "false").lower() in ("1", "true", "yes")
+    ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))
+
+    # Long texts are tokenized once and scored as overlapping windows of
+    # SENTIMENT_WINDOW_TOKENS, combined by "mean" (weighted by window length)
+    # or "max" (the most confident window). SENTIMENT_MAX_TOKENS caps the
+    # tokens read per text, which bounds latency for very long inputs.
+    SENTIMENT_WINDOW_TOKENS = int(os.getenv("SENTIMENT_WINDOW_TOKENS", "512"))
+    SENTIMENT_WINDOW_OVERLAP = int(os.getenv("SENTIMENT_WINDOW_OVERLAP", "64"))
+    SENTIMENT_MAX_TOKENS = int(os.getenv("SENTIMENT_MAX_TOKENS", "4096"))
+    SENTIMENT_AGGREGATION = os.getenv("SENTIMENT_AGGREGATION", "mean")
+    SENTIMENT_WINDOW_BATCH = int(os.getenv("SENTIMENT_WINDOW_BATCH", "32"))
+
+    # How models are loaded: "background" (start serving immediately, /readyz
+    # turns green once warm), "eager" (block startup until warm) or "lazy"
+    # (load on first request)
+    MODEL_LOAD_MODE = os.getenv("MODEL_LOAD_MODE", "background")
+
+    # Sentiment micro-batching: how long to collect concurrent requests and
+    # the largest batch sent through one forward pass
+    BATCH_WINDOW_MS = float(os.getenv("BATCH_WINDOW_MS", "5"))
+    BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "32"))
+
+    # /detect-emotion/batch: largest JSON body accepted, longest NDJSON line,
+    # and how many NDJSON lines are scored together while streaming
+    BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+    BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_BYTES", str(1024 * 1024)))
+    NDJSON_CHUNK_SIZE = int(os.getenv("NDJSON_CHUNK_SIZE", "256"))
     
+    # Runtime state (SQLite stores, caches)
+    DATA_DIR = Path(os.getenv("DATA_DIR", str(BASE_DIR / "data")))
+
+    # Listening history store: answers /user-history and only fetches plays
+    # newer than the stored cursor, at most once per HISTORY_MIN_SYNC_SECONDS.
+    # Set HISTORY_BACKGROUND_SYNC_SECONDS > 0 to keep active users fresh.
+    HISTORY_DB_PATH = Path(os.getenv("HISTORY_DB_PATH", str(DATA_DIR / "history.sqlite3")))
+    HISTORY_MAX_ITEMS = int(os.getenv("HISTORY_MAX_ITEMS", "500"))
+    HISTORY_MIN_SYNC_SECONDS = float(os.getenv("HISTORY_MIN_SYNC_SECONDS", "30"))
+    HISTORY_BACKGROUND_SYNC_SECONDS = float(os.getenv("HISTORY_BACKGROUND_SYNC_SECONDS", "0"))
+    HISTORY_ACTIVE_USER_SECONDS = float(os.getenv("HISTORY_ACTIVE_USER_SECONDS", "1800"))
+
+    # HTTP caching for read routes: serialized responses (orjson when
+    # installed) are kept in memory up to HTTP_CACHE_MAX_MB with a content-hash
+    # ETag, answered with 304 on If-None-Match, and gzip/br compressed above
+    # HTTP_COMPRESS_MIN_BYTES. History bytes are reused for at most
+    # USER_HISTORY_CACHE_SECONDS, recommendations until the catalog changes;
+    # recommendations served from a user's snapshot are private to that user.
+    HTTP_CACHE_MAX_MB = float(os.getenv("HTTP_CACHE_MAX_MB", "64"))
+    HTTP_COMPRESS_MIN_BYTES = int(os.getenv("HTTP_COMPRESS_MIN_BYTES", "1024"))
+    HTTP_GZIP_LEVEL = int(os.getenv("HTTP_GZIP_LEVEL", "6"))
+    HTTP_BROTLI_QUALITY = int(os.getenv("HTTP_BROTLI_QUALITY", "5"))
+    RECOMMENDATIONS_CACHE_CONTROL = os.getenv("RECOMMENDATIONS_CACHE_CONTROL", "public, max-age=300")
+    USER_RECOMMENDATIONS_CACHE_CONTROL = os.getenv("USER_RECOMMENDATIONS_CACHE_CONTROL", "private, max-age=60")
+    USER_HISTORY_CACHE_CONTROL = os.getenv("USER_HISTORY_CACHE_CONTROL", "private, max-age=30")
+    USER_HISTORY_CACHE_SECONDS = float(os.getenv("USER_HISTORY_CACHE_SECONDS", str(HISTORY_MIN_SYNC_SECONDS)))
+
+    # Outbound Spotify scheduler: token bucket per process (the launcher splits
+    # it across workers), retries on 429/5xx honouring Retry-After, and
+    # interactive calls give up rather than wait longer than SPOTIFY_MAX_WAIT_SECONDS
+    SPOTIFY_RATE_LIMIT = float(os.getenv("SPOTIFY_RATE_LIMIT", "10"))  # calls per second, 0 = unlimited
+    SPOTIFY_RATE_BURST = int(os.getenv("SPOTIFY_RATE_BURST", "20"))
+    SPOTIFY_MAX_RETRIES = int(os.getenv("SPOTIFY_MAX_RETRIES", "3"))
+    SPOTIFY_MAX_WAIT_SECONDS = float(os.getenv("SPOTIFY_MAX_WAIT_SECONDS", "10"))
+    SPOTIFY_BACKOFF_SECONDS = float(os.getenv("SPOTIFY_BACKOFF_SECONDS", "0.5"))
+
+    # User sessions: Spotify user tokens live server-side (shared by all
+    # workers) behind an opaque session cookie / X-Session-ID header. Tokens of
+    # sessions used within TOKEN_REFRESH_ACTIVE_SECONDS are refreshed in the
+    # background TOKEN_REFRESH_MARGIN_SECONDS before they expire.
+    TOKEN_DB_PATH = Path(os.getenv("TOKEN_DB_PATH", str(DATA_DIR / "sessions.sqlite3")))
+    SESSION_COOKIE = os.getenv("SESSION_COOKIE", "mobrec_session")
+    SESSION_COOKIE_SECURE = os.getenv("SESSION_COOKIE_SECURE", "true").lower() in ("1", "true", "yes")
+    SESSION_TTL_DAYS = float(os.getenv("SESSION_TTL_DAYS", "30"))
+    TOKEN_REFRESH_INTERVAL_SECONDS = float(os.getenv("TOKEN_REFRESH_INTERVAL_SECONDS", "60"))  # 0 = off
+    TOKEN_REFRESH_MARGIN_SECONDS = float(os.getenv("TOKEN_REFRESH_MARGIN_SECONDS", "300"))
+    TOKEN_REFRESH_ACTIVE_SECONDS = float(os.getenv("TOKEN_REFRESH_ACTIVE_SECONDS", "86400"))
+    TOKEN_LEASE_SECONDS = float(os.getenv("TOKEN_LEASE_SECONDS", "30"))
+
+    # Audio features: persistent per-track cache (features never change) and
+    # how /audio-features lookups are batched and parallelised
+    FEATURE_CACHE_PATH = Path(os.getenv("FEATURE_CACHE_PATH", str(DATA_DIR / "audio_features.sqlite3")))
+    SPOTIFY_FEATURE_BATCH_SIZE = int(os.getenv("SPOTIFY_FEATURE_BATCH_SIZE", "100"))
+    SPOTIFY_FEATURE_CONCURRENCY = int(os.getenv("SPOTIFY_FEATURE_CONCURRENCY", "4"))
+
+    # Mood timeline: detected emotions for requests carrying a user_id are
+    # written in batches off the request path, with hourly/daily/weekly rollups
+    MOOD_DB_PATH = Path(os.getenv("MOOD_DB_PATH", str(DATA_DIR / "mood.sqlite3")))
+    MOOD_FLUSH_SECONDS = float(os.getenv("MOOD_FLUSH_SECONDS", "1"))
+    MOOD_BATCH_SIZE = int(os.getenv("MOOD_BATCH_SIZE", "500"))
+    MOOD_QUEUE_SIZE = int(os.getenv("MOOD_QUEUE_SIZE", "10000"))
+    MOOD_MAX_DAYS = int(os.getenv("MOOD_MAX_DAYS", "366"))
+
+    # Precomputed per-user snapshots (backend/precompute.py): history-mode
+    # /detect-emotion and /recommendations?user_id= answer from a snapshot made
+    # for the current catalog, no older than SNAPSHOT_MAX_AGE_SECONDS and with
+    # no plays synced since (0 = always compute live)
+    SNAPSHOT_DB_PATH = Path(os.getenv("SNAPSHOT_DB_PATH", str(DATA_DIR / "snapshots.sqlite3")))
+    SNAPSHOT_MAX_AGE_SECONDS = float(os.getenv("SNAPSHOT_MAX_AGE_SECONDS", "86400"))
+    PRECOMPUTE_RECOMMENDATIONS = int(os.getenv("PRECOMPUTE_RECOMMENDATIONS", str(RECOMMENDATION_MAX_LIMIT)))
+
+    # Production launcher (backend/app/launcher.py): models are loaded once in
+    # the parent and shared copy-on-write by forked workers. 0 = one worker per
+    # core and cores / workers intra-op threads per worker.
+    HOST = os.getenv("HOST", "0.0.0.0")
+    PORT = int(os.getenv("PORT", "8000"))
+    WORKERS = int(os.getenv("WORKERS", "0"))
+    TORCH_INTRAOP_THREADS = int(os.getenv("TORCH_INTRAOP_THREADS", "0"))
+    TORCH_INTEROP_THREADS = int(os.getenv("TORCH_INTEROP_THREADS", "1"))
+    GRACEFUL_TIMEOUT = float(os.getenv("GRACEFUL_TIMEOUT", "30"))
+    WORKER_READY_TIMEOUT = float(os.getenv("WORKER_READY_TIMEOUT", "300"))
+
+    # Per-request sampling profiler: send "X-Profile: <PROFILING_TOKEN>" (or
+    # "X-Profile: 1" when no token is set) to write folded stacks to PROFILE_DIR
+    PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+    PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+    PROFILING_INTERVAL_MS = float(os.getenv("PROFILING_INTERVAL_MS", "5"))
+    PROFILE_DIR = Path(os.getenv("PROFILE_DIR", str(DATA_DIR / "profiles")))
+
     # Create models directory if it doesn't exist
     if not MODELS_DIR.exists():
         MODELS_DIR.mkdir()
+    if not DATA_DIR.exists():
+        DATA_DIR.mkdir(parents=True)
 
 settings = Settings()
\ No newline at end of file
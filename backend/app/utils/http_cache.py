@@ -0,0 +1,228 @@
+import gzip
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from backend.app.utils.metrics import metrics
+
+try:
+    import orjson
+except ImportError:  # optional: pip install orjson
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional: pip install brotli
+    brotli = None
+
+HTTP_CACHE = metrics.counter(
+    "mobrec_http_cache_total", "Cacheable responses by outcome (hit, miss, not_modified)", ("route", "outcome")
+)
+
+
+def _default(value):
+    # numpy scalars/arrays and anything else the stdlib encoder doesn't know
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    if hasattr(value, "dict"):
+        return value.dict()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(value: Any) -> bytes:
+    """Compact JSON bytes, through orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(value, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, default=_default, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def _accepted_encodings(header: str) -> Dict[str, float]:
+    weights = {}
+    for part in header.split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name] = weight
+    return weights
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison, as If-None-Match requires"""
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in (tag.removeprefix("W/") for tag in tags)
+
+
+class CachedBody:
+    """A serialized response body, its ETag and compressed variants made on first request"""
+
+    __slots__ = ("body", "etag", "expires", "variants", "cached")
+
+    def __init__(self, body: bytes, expires: float = 0):
+        self.body = body
+        # Weak: the same tag stands for the identity, gzip and br representations
+        self.etag = f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        self.expires = expires
+        self.variants: Dict[str, bytes] = {}
+        self.cached = False  # counted in a ResponseCache's byte budget
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(v) for v in self.variants.values())
+
+
+class ResponseCache:
+    """Conditional, compressed JSON responses from an in-process cache of serialized bytes.
+
+    ``respond`` serializes the value built for a key once (orjson when
+    available) and keeps the bytes, content-hash ETag and gzip/brotli
+    variants, bounded by ``max_bytes`` in LRU order. A request whose
+    If-None-Match carries the ETag gets an empty 304; otherwise the body goes
+    out compressed with the best encoding the client accepts, when it is at
+    least ``min_compress_bytes`` long.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 2 ** 20, min_compress_bytes: int = 1024, gzip_level: int = 6,
+                 brotli_quality: int = 5):
+        self.max_bytes = max_bytes
+        self.min_compress_bytes = min_compress_bytes
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self._entries: "OrderedDict[str, CachedBody]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[CachedBody]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires and entry.expires < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, entry: CachedBody):
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = entry
+            entry.cached = True
+            self._bytes += entry.size
+            self._evict()
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            entry.cached = False
+            self._bytes -= entry.size
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _encoding(self, request: Request, entry: CachedBody) -> Optional[str]:
+        if len(entry.body) < self.min_compress_bytes:
+            return None
+        accepted = _accepted_encodings(request.headers.get("accept-encoding", ""))
+        best, best_weight = None, 0.0
+        for encoding in ("br", "gzip") if brotli is not None else ("gzip",):
+            weight = accepted.get(encoding, accepted.get("*", 0.0))
+            if weight > best_weight:
+                best, best_weight = encoding, weight
+        return best
+
+    def _encoded(self, entry: CachedBody, encoding: str) -> bytes:
+        data = entry.variants.get(encoding)
+        if data is None:
+            if encoding == "br":
+                data = brotli.compress(entry.body, quality=self.brotli_quality)
+            else:
+                data = gzip.compress(entry.body, compresslevel=self.gzip_level, mtime=0)
+            with self._lock:
+                if encoding not in entry.variants:
+                    entry.variants[encoding] = data
+                    if entry.cached:
+                        self._bytes += len(data)
+                        self._evict()
+        return data
+
+    def _lookup(self, key: Optional[str], route: str) -> Optional[CachedBody]:
+        entry = self.get(key) if key is not None else None
+        HTTP_CACHE.inc(route=route, outcome="hit" if entry is not None else "miss")
+        return entry
+
+    def _store(self, key: Optional[str], value: Any, ttl: float) -> CachedBody:
+        entry = CachedBody(dumps(value), time.monotonic() + ttl if ttl else 0)
+        if key is not None:
+            self.put(key, entry)
+        return entry
+
+    def respond(self, request: Request, key: Optional[str], build: Callable[[], Any], route: str,
+                cache_control: str = "", ttl: float = 0, vary: str = "") -> Response:
+        """Response for the value ``build()`` returns, reusing the cached bytes for ``key`` if any.
+
+        ``key=None`` skips the server-side cache but still sets the ETag and
+        compresses; ``ttl`` (seconds, 0 = until evicted) bounds how long the
+        bytes are reused. ``vary`` names request headers the response depends
+        on besides Accept-Encoding (e.g. the session's).
+        """
+        entry = self._lookup(key, route) or self._store(key, build(), ttl)
+        return self._response(request, entry, route, cache_control, vary)
+
+    async def respond_async(self, request: Request, key: Optional[str], build: Callable[[], Awaitable[Any]],
+                            route: str, cache_control: str = "", ttl: float = 0, vary: str = "") -> Response:
+        """``respond`` for coroutine builders"""
+        entry = self._lookup(key, route) or self._store(key, await build(), ttl)
+        return self._response(request, entry, route, cache_control, vary)
+
+    def _response(self, request: Request, entry: CachedBody, route: str, cache_control: str,
+                  vary: str = "") -> Response:
+        headers = {"ETag": entry.etag, "Vary": "Accept-Encoding" + (f", {vary}" if vary else "")}
+        if cache_control:
+            headers["Cache-Control"] = cache_control
+        if request.method in ("GET", "HEAD") and _matches(request.headers.get("if-none-match", ""), entry.etag):
+            HTTP_CACHE.inc(route=route, outcome="not_modified")
+            return Response(status_code=304, headers=headers)
+
+        encoding = self._encoding(request, entry)
+        if encoding is None:
+            return Response(entry.body, media_type="application/json", headers=headers)
+        headers["Content-Encoding"] = encoding
+        return Response(self._encoded(entry, encoding), media_type="application/json", headers=headers)
@@ -0,0 +1,106 @@
+"""Opt-in, header-triggered sampling profiler for single requests.
+
+When PROFILING_ENABLED is set, a request carrying ``X-Profile: <PROFILING_TOKEN>``
+is profiled by sampling every thread's stack (the event loop, the threadpool
+and the inference thread) until the response completes. Stacks are written in
+collapsed "folded" format, ready for flamegraph.pl or speedscope, and the file
+name is returned in the ``X-Profile-File`` response header.
+"""
+import itertools
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+class ProfilerMiddleware:
+    """ASGI middleware running SamplingProfiler for requests that ask for it"""
+
+    def __init__(self, app, output_dir: Path, token: str = "", interval: float = 0.005):
+        self.app = app
+        self.output_dir = Path(output_dir)
+        self.token = token.encode()
+        self.interval = interval
+        self._busy = threading.Lock()  # one profile at a time keeps overhead bounded
+        self._count = itertools.count(1)
+
+    def _requested(self, scope) -> bool:
+        for name, value in scope.get("headers", []):
+            if name == b"x-profile":
+                return value == self.token if self.token else value in (b"1", b"true")
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._requested(scope) or not self._busy.acquire(blocking=False):
+            return await self.app(scope, receive, send)
+
+        # pid and counter keep names unique across workers and within the same second
+        route = scope["path"].strip("/").replace("/", "_") or "root"
+        path = self.output_dir / f"{time.strftime('%Y%m%d-%H%M%S')}-{route}-{os.getpid()}-{next(self._count)}.folded"
+        profiler = SamplingProfiler(self.interval)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-file", path.name.encode())]
+            await send(message)
+
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Joining the sampler and writing the file both block, so keep them off the event loop
+            try:
+                await run_in_threadpool(self._finish, profiler, path)
+            finally:
+                self._busy.release()
+
+    def _finish(self, profiler: SamplingProfiler, path: Path):
+        profiler.stop()
+        try:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            path.write_text(profiler.folded())
+        except OSError as e:
+            logger.error(f"Could not write profile {path}: {e}")
@@ -0,0 +1,87 @@
+"""Seeded synthetic inputs so every run measures the same work"""
+import random
+import string
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from backend.app.models.emotion_models import EMOTIONS
+
+_WORDS = [
+    "today", "feel", "really", "so", "music", "night", "morning", "work", "friends", "song",
+    "playlist", "weather", "rain", "sun", "drive", "home", "week", "weekend", "tired", "coffee",
+    "happy", "sad", "angry", "calm", "excited", "love", "lonely", "great", "awful", "chill",
+    "pumped", "furious", "peaceful", "miss", "heart", "dance", "cry", "relaxed", "not", "very",
+]
+_LANGUAGES = ["en", "en", "en", "es", "hi", "ta", "fr"]
+_GENRES = ["pop", "rock", "indie", "hip-hop", "jazz", "classical", "edm", "r&b", "folk", "metal"]
+
+
+def _track_id(rng: random.Random) -> str:
+    return "".join(rng.choices(string.ascii_letters + string.digits, k=22))
+
+
+def texts(count: int, min_words: int = 3, max_words: int = 40, seed: int = 0) -> List[str]:
+    """Short social-style messages mixing neutral filler with emotion words"""
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(_WORDS, k=rng.randint(min_words, max_words))) for _ in range(count)]
+
+
+def audio_features(rng: random.Random, track_id: str) -> Dict:
+    return {
+        "id": track_id,
+        "danceability": round(rng.random(), 3),
+        "energy": round(rng.random(), 3),
+        "valence": round(rng.random(), 3),
+        "tempo": round(rng.uniform(60, 200), 3),
+        "acousticness": round(rng.random(), 3),
+        "instrumentalness": round(rng.random(), 3),
+        "loudness": round(rng.uniform(-30, 0), 3),
+    }
+
+
+def histories(count: int, length: int, seed: int = 0) -> List[List[Dict]]:
+    """Listening histories whose items already carry audio features"""
+    rng = random.Random(seed)
+    return [[audio_features(rng, _track_id(rng)) for _ in range(length)] for _ in range(count)]
+
+
+def catalog_records(count: int, seed: int = 0) -> List[Dict]:
+    rng = random.Random(seed)
+    records = []
+    for i in range(count):
+        track_id = _track_id(rng)
+        features = audio_features(rng, track_id)
+        records.append({
+            "id": track_id,
+            "name": f"Track {i}",
+            "artists": [f"Artist {rng.randrange(max(count // 10, 1))}"],
+            "url": f"https://open.spotify.com/track/{track_id}",
+            "preview_url": f"https://open.spotify.com/track/{track_id}",
+            "album_image": "",
+            "language": rng.choice(_LANGUAGES),
+            "genre": rng.choice(_GENRES),
+            **{k: features[k] for k in ("danceability", "energy", "valence", "tempo")},
+        })
+    return records
+
+
+def recently_played(track_ids: List[str], start: datetime, seed: int = 0) -> List[Dict]:
+    """``/me/player/recently-played`` items, newest first, one play per minute"""
+    rng = random.Random(seed)
+    items = []
+    for i, track_id in enumerate(track_ids):
+        played_at = start - timedelta(minutes=i, seconds=rng.randrange(60))
+        items.append({
+            "track": {
+                "id": track_id,
+                "name": f"Track {track_id[:6]}",
+                "artists": [{"name": f"Artist {rng.randrange(50)}"}],
+                "external_urls": {"spotify": f"https://open.spotify.com/track/{track_id}"},
+            },
+            "played_at": played_at.strftime("%Y-%m-%dT%H:%M:%S.%fZ")[:-4] + "Z",
+        })
+    return items
+
+
+def moods() -> List[str]:
+    return list(EMOTIONS)
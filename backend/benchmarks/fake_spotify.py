@@ -0,0 +1,159 @@
+"""Local stand-in for the Spotify accounts and Web API endpoints the app calls
+
+Serves ``/api/token``, ``/v1/me``, ``/v1/me/player/recently-played`` and
+``/v1/audio-features`` with deterministic data, a configurable per-request
+latency and an optional share of ``429 Too Many Requests`` responses, so the
+I/O paths can be measured offline. Use it in-process through
+``httpx.ASGITransport`` or standalone::
+
+    python -m backend.benchmarks.fake_spotify --port 8900 --latency-ms 40 --throttle-rate 0.02
+
+and point the app at it with ``SPOTIFY_ACCOUNTS_URL=http://127.0.0.1:8900``
+and ``SPOTIFY_API_URL=http://127.0.0.1:8900/v1``.
+"""
+import argparse
+import asyncio
+import hashlib
+import random
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from backend.benchmarks import corpus
+
+
+class FakeSpotify:
+    """State behind the fake endpoints: per-user histories and request counters"""
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, throttle_rate: float = 0.0,
+                 retry_after: int = 1, history_size: int = 200, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.history_size = history_size
+        self.seed = seed
+        self.requests = Counter()
+        self.throttled = Counter()
+        self._rng = random.Random(seed)
+        self._histories = {}
+        self._now = datetime.utcnow()
+
+    def user_id(self, token: str) -> str:
+        return "user-" + hashlib.sha1(token.encode()).hexdigest()[:12]
+
+    def history(self, user_id: str):
+        if user_id not in self._histories:
+            rng = random.Random(f"{self.seed}:{user_id}")
+            # Users share part of their library so the audio-feature cache sees realistic reuse
+            track_ids = [f"track{rng.randrange(self.history_size * 20):018d}" for _ in range(self.history_size)]
+            self._histories[user_id] = corpus.recently_played(track_ids, self._now, seed=rng.randrange(1 << 30))
+        return self._histories[user_id]
+
+    def features(self, track_id: str):
+        return corpus.audio_features(random.Random(f"{self.seed}:{track_id}"), track_id)
+
+    async def delay(self, endpoint: str) -> Optional[JSONResponse]:
+        """Simulated network/server time; returns a 429 response when throttling this call"""
+        self.requests[endpoint] += 1
+        latency = self.latency_ms + (self._rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0)
+        if latency > 0:
+            await asyncio.sleep(latency / 1000)
+        if self.throttle_rate and self._rng.random() < self.throttle_rate:
+            self.throttled[endpoint] += 1
+            return JSONResponse(
+                {"error": {"status": 429, "message": "API rate limit exceeded"}},
+                status_code=429,
+                headers={"Retry-After": str(self.retry_after)},
+            )
+        return None
+
+    def stats(self):
+        return {"requests": dict(self.requests), "throttled": dict(self.throttled)}
+
+
+def _bearer(request: Request) -> str:
+    return request.headers.get("authorization", "").partition(" ")[2]
+
+
+def create_app(fake: Optional[FakeSpotify] = None) -> FastAPI:
+    fake = fake or FakeSpotify()
+    app = FastAPI(title="Fake Spotify")
+    app.state.fake = fake
+
+    @app.post("/api/token")
+    async def token():
+        throttled = await fake.delay("token")
+        if throttled:
+            return throttled
+        return {
+            "access_token": f"fake-{time.monotonic_ns()}",
+            "token_type": "Bearer",
+            "expires_in": 3600,
+            "refresh_token": "fake-refresh",
+        }
+
+    @app.get("/v1/me")
+    async def me(request: Request):
+        throttled = await fake.delay("me")
+        if throttled:
+            return throttled
+        return {"id": fake.user_id(_bearer(request))}
+
+    @app.get("/v1/me/player/recently-played")
+    async def recently_played(request: Request, limit: int = 50, after: Optional[int] = None):
+        throttled = await fake.delay("recently-played")
+        if throttled:
+            return throttled
+        items = fake.history(fake.user_id(_bearer(request)))
+        if after:
+            cutoff = datetime.utcfromtimestamp(after / 1000).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]
+            items = [item for item in items if item["played_at"][:-1] > cutoff]
+            # Pages after a cursor run oldest to newest, like Spotify's
+            page = items[-limit:]
+        else:
+            page = items[:limit]
+        cursors = {"after": None}
+        if page:
+            newest = max(item["played_at"] for item in page)
+            ms = int(datetime.fromisoformat(newest.replace("Z", "+00:00")).timestamp() * 1000)
+            cursors = {"after": str(ms)}
+        return {"items": page, "limit": limit, "cursors": cursors}
+
+    @app.get("/v1/audio-features")
+    async def audio_features(ids: str = ""):
+        throttled = await fake.delay("audio-features")
+        if throttled:
+            return throttled
+        return {"audio_features": [fake.features(track_id) for track_id in ids.split(",") if track_id]}
+
+    @app.get("/_stats")
+    async def stats():
+        return fake.stats()
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--history-size", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    import uvicorn
+    fake = FakeSpotify(args.latency_ms, args.jitter_ms, args.throttle_rate, args.retry_after, args.history_size, args.seed)
+    uvicorn.run(create_app(fake), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""Timing, result bookkeeping and baseline comparison shared by the suites"""
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+
+def summarize(latencies: List[float], elapsed: float, operations: Optional[int] = None, errors: int = 0) -> Dict:
+    """Throughput and latency percentiles (ms) for one benchmark"""
+    samples = np.asarray(latencies, dtype=np.float64) * 1000
+    operations = len(latencies) if operations is None else operations
+    if not len(samples):
+        samples = np.zeros(1)
+    return {
+        "operations": operations,
+        "errors": errors,
+        "seconds": round(elapsed, 6),
+        "ops_per_sec": round(operations / elapsed, 3) if elapsed > 0 else 0.0,
+        "mean_ms": round(float(samples.mean()), 4),
+        "p50_ms": round(float(np.percentile(samples, 50)), 4),
+        "p95_ms": round(float(np.percentile(samples, 95)), 4),
+        "p99_ms": round(float(np.percentile(samples, 99)), 4),
+    }
+
+
+def measure(fn: Callable[[], object], min_time: float = 1.0, min_calls: int = 5,
+            warmup: int = 1, ops_per_call: int = 1) -> Dict:
+    """Call ``fn`` repeatedly for at least ``min_time`` seconds and ``min_calls`` calls"""
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    started = time.perf_counter()
+    while len(latencies) < min_calls or time.perf_counter() - started < min_time:
+        t0 = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies, time.perf_counter() - started, operations=len(latencies) * ops_per_call)
+
+
+async def run_load(call: Callable[[int], Awaitable[bool]], concurrency: int, requests: int) -> Dict:
+    """Closed-loop load: ``concurrency`` workers issue ``requests`` calls in total
+
+    ``call`` receives the request number and returns False for a failed request.
+    """
+    latencies = []
+    errors = 0
+    issued = 0
+
+    async def worker():
+        nonlocal errors, issued
+        while issued < requests:
+            n = issued
+            issued += 1
+            t0 = time.perf_counter()
+            try:
+                ok = await call(n)
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - t0)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - started, errors=errors)
+
+
+class NeutralSentimentBackend:
+    """Sentiment backend that skips the transformer, for ``--no-model`` runs
+
+    Every text comes back NEUTRAL in constant time, so the numbers cover only
+    the code around inference: batching, caching, lexicon and history scoring.
+    """
+
+    name = "neutral"
+    version = "neutral:0"
+    labels = ["NEUTRAL"]
+
+    def predict_proba(self, texts: List[str]) -> np.ndarray:
+        return np.ones((len(texts), 1), dtype=np.float32)
+
+
+def environment() -> Dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+            cwd=Path(__file__).resolve().parent,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+
+def write_results(results: Dict, path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(results, indent=2, sort_keys=True) + "\n")
+
+
+# Run settings that change what the benchmarks measure; runs differing in any of them aren't comparable
+COMPARABLE_ARGS = (
+    "no_model", "concurrency", "requests", "load_catalog_size", "users",
+    "spotify_latency_ms", "spotify_jitter_ms", "spotify_throttle_rate", "seed",
+)
+
+
+def config_mismatches(results: Dict, baseline: Dict) -> List[str]:
+    """Settings (and the core count and cascade state) that differ between a run and its baseline"""
+    current_meta, base_meta = results["meta"], baseline.get("meta", {})
+    current_args, base_args = current_meta.get("args", {}), base_meta.get("args", {})
+    mismatches = [
+        f"{key}: {current_args.get(key)!r} (baseline {base_args.get(key)!r})"
+        for key in COMPARABLE_ARGS
+        if current_args.get(key) != base_args.get(key)
+    ]
+    for key in ("cascade", "cpu_count"):
+        if current_meta.get(key) != base_meta.get(key):
+            mismatches.append(f"{key}: {current_meta.get(key)!r} (baseline {base_meta.get(key)!r})")
+    return mismatches
+
+
+def compare(results: Dict, baseline: Dict, throughput_tolerance: float, latency_tolerance: float) -> List[str]:
+    """Regressions of ``results`` against ``baseline``, one message per failed check
+
+    A benchmark regresses when its throughput drops by more than
+    ``throughput_tolerance`` or its p99 latency grows by more than
+    ``latency_tolerance`` (both fractions). Benchmarks missing on either side
+    are ignored (see ``unchecked``). Raises ValueError when the runs were made
+    with different settings, rather than reporting that nothing regressed.
+    """
+    mismatches = config_mismatches(results, baseline)
+    if mismatches:
+        raise ValueError("run and baseline settings differ: " + "; ".join(mismatches))
+    failures = []
+    for name, current in sorted(results["benchmarks"].items()):
+        base = baseline.get("benchmarks", {}).get(name)
+        if not base:
+            continue
+        if current["ops_per_sec"] < base["ops_per_sec"] * (1 - throughput_tolerance):
+            failures.append(
+                f"{name}: throughput {current['ops_per_sec']:.1f}/s < baseline {base['ops_per_sec']:.1f}/s"
+            )
+        if current["p99_ms"] > base["p99_ms"] * (1 + latency_tolerance):
+            failures.append(f"{name}: p99 {current['p99_ms']:.3f} ms > baseline {base['p99_ms']:.3f} ms")
+        if current["errors"] > base["errors"]:
+            failures.append(f"{name}: {current['errors']} errors (baseline {base['errors']})")
+    return failures
+
+
+def unchecked(results: Dict, baseline: Dict) -> List[str]:
+    """Benchmarks of this run that the baseline has no numbers for"""
+    return sorted(set(results["benchmarks"]) - set(baseline.get("benchmarks", {})))
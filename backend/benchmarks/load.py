@@ -0,0 +1,80 @@
+"""End-to-end load generator against the FastAPI app, in-process
+
+Requests go through ``httpx.ASGITransport`` straight into the app, and the
+app's Spotify client is pointed at :mod:`backend.benchmarks.fake_spotify`, so
+the numbers include routing, validation, serialization, the services and the
+Spotify I/O paths, but no real network.
+"""
+import logging
+import random
+from typing import Dict, Iterable
+
+import httpx
+
+from backend.benchmarks import corpus
+from backend.benchmarks.fake_spotify import FakeSpotify, create_app
+from backend.benchmarks.harness import run_load
+
+logger = logging.getLogger(__name__)
+
+SCENARIOS = ["text", "history", "batch", "recommendations", "user_history"]
+FAKE_SPOTIFY_URL = "http://spotify.fake"
+
+
+def _attach_fake_spotify(spotify_service, fake: FakeSpotify):
+    spotify_service.accounts_url = FAKE_SPOTIFY_URL
+    spotify_service.api_url = f"{FAKE_SPOTIFY_URL}/v1"
+    spotify_service.access_token = None
+    spotify_service._client = httpx.AsyncClient(transport=httpx.ASGITransport(app=create_app(fake)))
+
+
+def _requests(scenario: str, text_pool: int, users: int, seed: int):
+    """Build ``call(client, n)`` for a scenario; returns True on success"""
+    rng = random.Random(seed)
+    moods = corpus.moods()
+
+    if scenario == "text":
+        texts = corpus.texts(text_pool, seed=seed)
+        return lambda client, n: client.post("/detect-emotion", json={"text": texts[n % len(texts)]})
+    if scenario == "history":
+        histories = corpus.histories(64, 50, seed=seed)
+        return lambda client, n: client.post("/detect-emotion", json={"history": histories[n % len(histories)]})
+    if scenario == "batch":
+        texts = corpus.texts(text_pool, seed=seed)
+        histories = corpus.histories(16, 20, seed=seed)
+
+        def batch(client, n):
+            items = [{"text": texts[(n * 64 + i) % len(texts)]} for i in range(48)]
+            items += [{"history": histories[(n + i) % len(histories)]} for i in range(16)]
+            return client.post("/detect-emotion/batch", json={"items": items})
+        return batch
+    if scenario == "recommendations":
+        return lambda client, n: client.get("/recommendations", params={"emotion": rng.choice(moods), "limit": 20})
+    if scenario == "user_history":
+        return lambda client, n: client.get("/user-history", params={"token": f"bench-user-{n % users}", "limit": 50})
+    raise ValueError(f"Unknown scenario: {scenario}")
+
+
+async def run(scenarios: Iterable[str], concurrency: int, requests: int, fake: FakeSpotify,
+              text_pool: int = 1000, users: int = 50, seed: int = 0) -> Dict[str, Dict]:
+    from backend.app import main
+
+    _attach_fake_spotify(main.spotify_service, fake)
+    await main.app.router.startup()
+    results = {}
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench") as client:
+            for scenario in scenarios:
+                request = _requests(scenario, text_pool, users, seed)
+
+                async def call(n):
+                    response = await request(client, n)
+                    return response.status_code == 200
+
+                # One untimed request per scenario pays for lazy loads and first connections
+                await call(0)
+                logger.info(f"Load scenario '{scenario}': {requests} requests, concurrency {concurrency}")
+                results[f"load/{scenario}/c={concurrency}"] = await run_load(call, concurrency, requests)
+    finally:
+        await main.app.router.shutdown()
+    return results
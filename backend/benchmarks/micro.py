@@ -0,0 +1,92 @@
+"""Micro-benchmarks for the hot service methods over synthetic corpora"""
+import logging
+import random
+from typing import Dict, Iterable, Optional
+
+from backend.benchmarks import corpus
+from backend.benchmarks.harness import measure
+
+logger = logging.getLogger(__name__)
+
+
+def bench_text(service, sizes: Iterable[int], min_time: float) -> Dict[str, Dict]:
+    """``detect_emotion_from_text`` one message at a time, cold and cache-warm"""
+    results = {}
+    for size in sizes:
+        texts = corpus.texts(size, seed=size)
+
+        def cold():
+            service.text_cache.clear()
+            for text in texts:
+                service.detect_emotion_from_text(text)
+
+        def warm():
+            for text in texts:
+                service.detect_emotion_from_text(text)
+
+        results[f"detect_emotion_from_text/cold/n={size}"] = measure(cold, min_time, ops_per_call=size)
+        results[f"detect_emotion_from_text/warm/n={size}"] = measure(warm, min_time, ops_per_call=size)
+
+        def batch():
+            service.text_cache.clear()
+            service.detect_emotions_from_texts(texts)
+
+        results[f"detect_emotions_from_texts/cold/n={size}"] = measure(batch, min_time, ops_per_call=size)
+    return results
+
+
+def bench_history(service, lengths: Iterable[int], min_time: float) -> Dict[str, Dict]:
+    """``predict_emotion_from_history`` for histories of increasing length"""
+    results = {}
+    for length in lengths:
+        histories = corpus.histories(16, length, seed=length)
+        position = iter(range(1 << 62))
+
+        def predict():
+            service.predict_emotion_from_history(histories[next(position) % len(histories)])
+
+        results[f"predict_emotion_from_history/len={length}"] = measure(predict, min_time)
+    return results
+
+
+def bench_recommendations(catalog_sizes: Iterable[int], min_time: float) -> Dict[str, Dict]:
+    """``get_recommendations`` against in-memory catalogs of increasing size"""
+    from backend.app.services.catalog import TrackCatalog
+    from backend.app.services.spotify_service import SpotifyService
+
+    results = {}
+    moods = corpus.moods()
+    for size in catalog_sizes:
+        catalog = TrackCatalog.from_records(corpus.catalog_records(size, seed=size), version=f"bench-{size}")
+        spotify = SpotifyService("bench", "bench", "http://localhost/callback", catalog=catalog)
+        rng = random.Random(size)
+
+        def unfiltered():
+            spotify.get_recommendations(rng.choice(moods), limit=20)
+
+        def filtered():
+            spotify.get_recommendations(rng.choice(moods), language="en", genre="pop", limit=20)
+
+        results[f"get_recommendations/n={size}"] = measure(unfiltered, min_time)
+        results[f"get_recommendations/filtered/n={size}"] = measure(filtered, min_time)
+    return results
+
+
+def run(text_sizes, history_lengths, catalog_sizes, min_time: float = 1.0,
+        sentiment_analyzer: Optional[object] = None) -> Dict[str, Dict]:
+    from backend.app.models.registry import registry
+    from backend.app.services.emotion_service import EmotionService, cascade_status
+
+    # Outside the app lifespan nothing loads the cascade's first stage; without this the
+    # text benchmarks would silently measure the sentiment model alone
+    registry.get("text_model")
+    service = EmotionService(sentiment_analyzer=sentiment_analyzer)
+    logger.info(f"Text cascade: {cascade_status()}")
+    results = {}
+    logger.info("Text benchmarks...")
+    results.update(bench_text(service, text_sizes, min_time))
+    logger.info("History benchmarks...")
+    results.update(bench_history(service, history_lengths, min_time))
+    logger.info("Recommendation benchmarks...")
+    results.update(bench_recommendations(catalog_sizes, min_time))
+    return results
@@ -0,0 +1,153 @@
+"""Run the benchmark suite, write JSON results and check them against a baseline
+
+    python -m backend.benchmarks.run                      # micro + load, compare to baseline.json
+    python -m backend.benchmarks.run --suite micro --no-model
+    python -m backend.benchmarks.run --update-baseline    # accept the current numbers
+
+Exits with status 1 when any benchmark's throughput or p99 latency regresses
+past the tolerances, and 2 when the run could not be checked: there is no
+baseline, or it was recorded with different settings or on a machine with a
+different core count. Baselines are machine-specific: record one per CI
+runner. The committed baseline.json is a ``--no-model`` run.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+DEFAULT_BASELINE = BENCHMARK_DIR / "baseline.json"
+DEFAULT_OUTPUT = BENCHMARK_DIR / "results" / "latest.json"
+
+logger = logging.getLogger("benchmarks")
+
+
+def _ints(value: str):
+    return [int(v) for v in value.split(",") if v]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="MoBRec benchmark and load-test suite")
+    parser.add_argument("--suite", choices=["all", "micro", "load"], default="all")
+    parser.add_argument("--no-model", action="store_true",
+                        help="Replace the sentiment transformer with a constant backend")
+    parser.add_argument("--text-sizes", type=_ints, default=[10, 100, 1000])
+    parser.add_argument("--history-lengths", type=_ints, default=[10, 100, 1000])
+    parser.add_argument("--catalog-sizes", type=_ints, default=[1000, 10000, 100000])
+    parser.add_argument("--min-time", type=float, default=1.0, help="Seconds spent on each micro-benchmark")
+    parser.add_argument("--scenarios", default="text,history,batch,recommendations,user_history")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per load scenario")
+    parser.add_argument("--load-catalog-size", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--spotify-latency-ms", type=float, default=20.0)
+    parser.add_argument("--spotify-jitter-ms", type=float, default=5.0)
+    parser.add_argument("--spotify-throttle-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--throughput-tolerance", type=float, default=0.10)
+    parser.add_argument("--latency-tolerance", type=float, default=0.20)
+    return parser.parse_args(argv)
+
+
+def _configure_environment(data_dir: str):
+    # Settings are read at import time, so this has to run before any backend.app import
+    os.environ["DATA_DIR"] = data_dir
+    os.environ.setdefault("MODEL_LOAD_MODE", "eager")
+    os.environ.setdefault("HISTORY_BACKGROUND_SYNC_SECONDS", "0")
+    os.environ.setdefault("SPOTIFY_CLIENT_ID", "bench")
+    os.environ.setdefault("SPOTIFY_CLIENT_SECRET", "bench")
+    os.environ.setdefault("SPOTIFY_REDIRECT_URI", "http://localhost/callback")
+
+
+def _register_models(args):
+    from backend.app.models.registry import registry
+    from backend.app.models.sentiment_analysis import SentimentAnalyzer
+    from backend.app.services.catalog import TrackCatalog
+    from backend.benchmarks import corpus
+    from backend.benchmarks.harness import NeutralSentimentBackend
+
+    if args.no_model:
+        registry.register("sentiment", lambda: SentimentAnalyzer(backend=NeutralSentimentBackend()))
+    registry.register(
+        "catalog",
+        lambda: TrackCatalog.from_records(
+            corpus.catalog_records(args.load_catalog_size, seed=args.seed), version=f"bench-{args.load_catalog_size}"
+        ),
+    )
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    with tempfile.TemporaryDirectory(prefix="mobrec-bench-") as data_dir:
+        _configure_environment(data_dir)
+        from backend.benchmarks import harness, load, micro
+        from backend.benchmarks.fake_spotify import FakeSpotify
+
+        _register_models(args)
+        results = {"meta": {**harness.environment(), "no_model": args.no_model, "args": {
+            k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()
+        }}, "benchmarks": {}}
+
+        if args.suite in ("all", "micro"):
+            from backend.app.models.registry import registry
+            results["benchmarks"].update(micro.run(
+                args.text_sizes, args.history_lengths, args.catalog_sizes, args.min_time,
+                sentiment_analyzer=registry.get("sentiment"),
+            ))
+            # Whether the text numbers include the fast first stage (needs a trained text model)
+            from backend.app.services.emotion_service import cascade_status
+            results["meta"]["cascade"] = cascade_status()
+
+        if args.suite in ("all", "load"):
+            fake = FakeSpotify(
+                latency_ms=args.spotify_latency_ms,
+                jitter_ms=args.spotify_jitter_ms,
+                throttle_rate=args.spotify_throttle_rate,
+                seed=args.seed,
+            )
+            scenarios = [s for s in args.scenarios.split(",") if s]
+            results["benchmarks"].update(asyncio.run(load.run(
+                scenarios, args.concurrency, args.requests, fake, users=args.users, seed=args.seed,
+            )))
+            results["meta"]["fake_spotify"] = fake.stats()
+
+    harness.write_results(results, args.output)
+    for name, result in sorted(results["benchmarks"].items()):
+        print(f"{name:<50} {result['ops_per_sec']:>12.1f} ops/s  p50 {result['p50_ms']:>9.3f} ms  "
+              f"p99 {result['p99_ms']:>9.3f} ms  errors {result['errors']}")
+    print(f"Results written to {args.output}")
+
+    if args.update_baseline:
+        harness.write_results(results, args.baseline)
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        print(f"SKIPPED: no baseline at {args.baseline}; run with --update-baseline to record one")
+        return 2
+
+    import json
+    baseline = json.loads(args.baseline.read_text())
+    try:
+        failures = harness.compare(results, baseline, args.throughput_tolerance, args.latency_tolerance)
+    except ValueError as e:
+        print(f"SKIPPED: not compared with {args.baseline}: {e}")
+        return 2
+    for name in harness.unchecked(results, baseline):
+        print(f"UNCHECKED {name}: not in the baseline")
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    if not failures:
+        print(f"OK: no regressions against {args.baseline}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
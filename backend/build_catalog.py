@@ -0,0 +1,28 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# Allow running as `python backend/build_catalog.py` from the project root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backend.app.services.catalog import iter_records, write_columnar
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert a JSON / JSON lines / CSV track dump into the memory-mapped catalog format"
+    )
+    parser.add_argument("source", help="track dump (.json, .jsonl/.ndjson or .csv)")
+    parser.add_argument("output", help="directory to write; point CATALOG_PATH at it")
+    parser.add_argument("--version", help="catalog version (defaults to a timestamp)")
+    args = parser.parse_args()
+
+    version = args.version or time.strftime("%Y%m%d%H%M%S")
+    started = time.perf_counter()
+    count = write_columnar(iter_records(Path(args.source)), Path(args.output), version)
+    print(f"Wrote {count} tracks to {args.output} (version {version}) in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
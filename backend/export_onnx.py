@@ -0,0 +1,100 @@
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# Allow running as `python backend/export_onnx.py` from the project root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backend.app.models.sentiment_backends import (
+    MAX_LENGTH,
+    OnnxSentimentBackend,
+    TorchSentimentBackend,
+    check_parity,
+    export_onnx,
+)
+from backend.app.utils.config import settings
+
+# Small built-in reference corpus; pass --corpus for a real one (one text per line)
+REFERENCE_CORPUS = [
+    "I'm feeling so happy today!",
+    "This makes me really sad",
+    "I'm so angry about this situation",
+    "I feel calm and peaceful",
+    "I have so much energy right now",
+    "I'm in love with this song",
+    "What a wonderful day",
+    "I'm devastated by the news",
+    "This is so frustrating",
+    "I'm completely relaxed",
+    "Let's party all night",
+    "You're the love of my life",
+    "meh",
+    "not bad at all, honestly",
+    "I can't say I enjoyed that",
+    "so tired",
+]
+
+# Texts past the 512-token window, scored window by window in serving; the mood
+# shifts partway through so the windows disagree
+LONG_REFERENCE_CORPUS = [
+    " ".join(REFERENCE_CORPUS[:6] * 40) + " " + " ".join(REFERENCE_CORPUS[7:10] * 40),
+    " ".join(["The first half of the album was a joy to listen to, bright and full of hope."] * 60
+             + ["Then it fell apart into dull, lifeless filler that made me want to turn it off."] * 60),
+    " ".join(REFERENCE_CORPUS * 120),
+]
+
+
+def load_corpus(path):
+    if not path:
+        return REFERENCE_CORPUS + LONG_REFERENCE_CORPUS
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def run_export(args):
+    path = export_onnx(Path(args.output), model_name=args.model, quantize=args.quantize, opset=args.opset)
+    print(f"Wrote {path}")
+
+
+def run_parity(args):
+    reference = TorchSentimentBackend(args.model)
+    candidate = OnnxSentimentBackend(Path(args.output), quantized=args.quantize)
+    report = check_parity(
+        reference, candidate, load_corpus(args.corpus),
+        window=min(settings.SENTIMENT_WINDOW_TOKENS, MAX_LENGTH),
+        overlap=settings.SENTIMENT_WINDOW_OVERLAP,
+        max_tokens=settings.SENTIMENT_MAX_TOKENS,
+    )
+    print(json.dumps(report, indent=2))
+
+    if (report["label_agreement"] < args.min_agreement or report["max_score_diff"] > args.max_score_diff
+            or not report["tokenizer_match"]):
+        print("Parity check FAILED")
+        sys.exit(1)
+    print("Parity check passed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the sentiment model to ONNX and check it against PyTorch")
+    parser.add_argument("--model", default=settings.SENTIMENT_MODEL_NAME)
+    parser.add_argument("--output", default=str(settings.ONNX_MODEL_DIR))
+    parser.add_argument("--quantize", action="store_true", help="also write / check the dynamic int8 model")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="export (and optionally quantize) the model")
+    export_parser.add_argument("--opset", type=int, default=14)
+    export_parser.set_defaults(func=run_export)
+
+    parity_parser = subparsers.add_parser("parity", help="compare ONNX labels/scores with PyTorch")
+    parity_parser.add_argument("--corpus", help="text file with one sample per line; long lines are also checked window by window")
+    parity_parser.add_argument("--min-agreement", type=float, default=0.99)
+    parity_parser.add_argument("--max-score-diff", type=float, default=0.05)
+    parity_parser.set_defaults(func=run_parity)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""Precompute every known user's mood and recommendation list
+
+    python backend/precompute.py --jobs 8
+
+Walks the users in the history store (HISTORY_DB_PATH) in id order with a
+process pool. Each worker scores a chunk of stored histories with
+``EmotionService`` and takes the closest catalog tracks for the resulting
+mood; the parent writes each chunk's snapshots to SNAPSHOT_DB_PATH in the
+same transaction as a checkpoint, so an interrupted run resumes after the
+last written chunk and retries the users of chunks that failed
+(``--restart`` starts over). Audio features come from the
+feature cache, and missing ones from Spotify at background priority under a
+share of SPOTIFY_RATE_LIMIT (``--offline`` uses the cache only).
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Allow running as `python backend/precompute.py` from the project root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backend.app.models.registry import registry
+from backend.app.services.emotion_service import EmotionService
+from backend.app.services.feature_cache import FeatureCache
+from backend.app.services.history_store import HistoryStore
+from backend.app.services.snapshot_service import history_digest, snapshot_version
+from backend.app.services.snapshot_store import SnapshotStore
+from backend.app.services.spotify_scheduler import BACKGROUND, SpotifyScheduler, spotify_priority
+from backend.app.services.spotify_service import SpotifyService, recommend_tracks
+from backend.app.utils.config import settings
+
+logger = logging.getLogger("precompute")
+
+# Per-process state, set up once by _init_worker
+_worker: Dict = {}
+
+
+def _init_worker(offline: bool, spotify_rate: float, recommendations: int):
+    features = FeatureCache(settings.FEATURE_CACHE_PATH)
+    _worker.update(
+        history=HistoryStore(settings.HISTORY_DB_PATH),
+        features=features,
+        emotions=EmotionService(),
+        recommendations=recommendations,
+        tracks={},  # mood -> recommendation list, the same for every user in that mood
+        # One loop, client and token bucket for all of this worker's chunks
+        loop=asyncio.new_event_loop(),
+        spotify=None if offline else _spotify_service(features, spotify_rate),
+    )
+
+
+def _close_worker():
+    loop = _worker.pop("loop", None)
+    if loop is None:
+        return
+    if _worker.get("spotify") is not None:
+        loop.run_until_complete(_worker["spotify"].aclose())
+    loop.close()
+
+
+def _track_id(item: Dict) -> Optional[str]:
+    return (item.get("track") or {}).get("id") or item.get("id")
+
+
+def _cached_features(history: List[Dict]) -> List[Dict]:
+    features = _worker["features"].get_many([_track_id(item) for item in history if "valence" not in item])
+    resolved = []
+    for item in history:
+        f = features.get(_track_id(item)) if "valence" not in item else None
+        resolved.append({**item, **f.dict(exclude_none=True)} if f is not None else item)
+    return resolved
+
+
+def _spotify_service(features: FeatureCache, rate: float) -> Optional[SpotifyService]:
+    try:
+        return SpotifyService(
+            feature_cache=features,
+            scheduler=SpotifyScheduler(
+                rate=rate,
+                burst=max(1, int(rate)),
+                max_retries=settings.SPOTIFY_MAX_RETRIES,
+                backoff_base=settings.SPOTIFY_BACKOFF_SECONDS,
+            ),
+        )
+    except ValueError:
+        logger.warning("No Spotify credentials; using cached audio features only")
+        return None
+
+
+def _resolve_features(histories: List[List[Dict]]) -> List[List[Dict]]:
+    spotify_service = _worker["spotify"]
+    if spotify_service is None:
+        return [_cached_features(history) for history in histories]
+
+    async def resolve():
+        # Yield to interactive requests sharing the Spotify quota
+        with spotify_priority(BACKGROUND):
+            return await spotify_service.resolve_history_features([t for h in histories for t in h])
+
+    flat = _worker["loop"].run_until_complete(resolve())
+    resolved, offset = [], 0
+    for history in histories:
+        resolved.append(flat[offset:offset + len(history)])
+        offset += len(history)
+    return resolved
+
+
+def _recommendations(mood: str) -> List[Dict]:
+    tracks = _worker["tracks"].get(mood)
+    if tracks is None:
+        tracks = recommend_tracks(registry.get("catalog"), mood, limit=_worker["recommendations"])
+        _worker["tracks"][mood] = tracks
+    return tracks
+
+
+def process_chunk(user_ids: List[str]) -> Dict:
+    """Snapshots for a chunk of users: {"snapshots": [(user_id, history_after, payload)], "failed": [user_id]}"""
+    try:
+        store = _worker["history"]
+        # Cursors first: a sync landing in between then leaves the snapshot looking older than its
+        # history (recomputed later) rather than newer (served stale)
+        cursors = [store.get_sync_state(user_id)["after"] for user_id in user_ids]
+        histories = [store.get_history(user_id, settings.HISTORY_MAX_ITEMS) for user_id in user_ids]
+        results = _worker["emotions"].predict_emotions_from_histories(
+            _resolve_features(histories), include_scores=True
+        )
+        snapshots = []
+        for user_id, after, history, result in zip(user_ids, cursors, histories, results):
+            payload = {
+                "emotion": result["emotion"],
+                "scores": result.get("scores"),
+                "history_size": len(history),
+                "history_digest": history_digest(history),
+                "tracks": _recommendations(result["emotion"]),
+            }
+            snapshots.append((user_id, after, payload))
+        return {"snapshots": snapshots, "failed": []}
+    except Exception as e:
+        logger.error(f"Chunk starting at user {user_ids[0]} failed: {e}")
+        return {"snapshots": [], "failed": list(user_ids)}
+
+
+def precompute(args):
+    snapshots = SnapshotStore(settings.SNAPSHOT_DB_PATH)
+    users = sorted(args.users or HistoryStore(settings.HISTORY_DB_PATH).users())
+    # Loaded before the pool starts, so forked workers share the (memory-mapped) catalog
+    version = snapshot_version(registry.get("catalog"))
+    run = snapshots.start_run(version, restart=args.restart)
+    if run["last_user"] is not None:
+        # Users of failed chunks are retried along with the ones not reached yet
+        retry = set(run["failed_users"])
+        users = [user for user in users if user > run["last_user"] or user in retry]
+        logger.info(f"Resuming run {run['run_id']} after user {run['last_user']} "
+                    f"({run['done']} done, retrying {len(retry)} failed)")
+    chunks = [users[i:i + args.chunk_size] for i in range(0, len(users), args.chunk_size)]
+    logger.info(f"Precomputing {len(users)} users in {len(chunks)} chunks for version {version}")
+
+    jobs = max(1, args.jobs)
+    initargs = (args.offline, args.spotify_rate / jobs, args.recommendations)
+    started = time.perf_counter()
+    done = failed = 0
+
+    def write(chunk, result):
+        nonlocal done, failed
+        snapshots.checkpoint(run["run_id"], version, result["snapshots"], chunk[-1], result["failed"])
+        done += len(result["snapshots"])
+        failed += len(result["failed"])
+        logger.info(f"{done + failed}/{len(users)} users ({done / (time.perf_counter() - started):.0f} users/s)")
+
+    if jobs == 1:
+        _init_worker(*initargs)
+        try:
+            for chunk in chunks:
+                write(chunk, process_chunk(chunk))
+        finally:
+            _close_worker()
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=initargs) as pool:
+            # map yields in submission order, so the checkpoint always covers a prefix of the users
+            for chunk, result in zip(chunks, pool.map(process_chunk, chunks)):
+                write(chunk, result)
+
+    snapshots.finish_run(run["run_id"])
+    if not args.keep_old:
+        pruned = snapshots.prune(version)
+        if pruned:
+            logger.info(f"Removed {pruned} snapshots of older versions")
+    print(f"Wrote {done} snapshots ({failed} users failed) in {time.perf_counter() - started:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute per-user moods and recommendation lists")
+    parser.add_argument("users", nargs="*", help="user ids (default: every user in the history store)")
+    parser.add_argument("--jobs", type=int, default=1, help="worker processes")
+    parser.add_argument("--chunk-size", type=int, default=200, help="users per task and per checkpoint")
+    parser.add_argument("--recommendations", type=int, default=settings.PRECOMPUTE_RECOMMENDATIONS,
+                        help="tracks stored per user")
+    parser.add_argument("--spotify-rate", type=float, default=settings.SPOTIFY_RATE_LIMIT,
+                        help="Spotify calls per second for the whole job, split across workers")
+    parser.add_argument("--offline", action="store_true", help="only use cached audio features")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint of an unfinished run")
+    parser.add_argument("--keep-old", action="store_true", help="keep snapshots of older versions")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    precompute(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,68 +1,324 @@
+"""Train the text emotion model on corpora that don't fit in memory
+
+    python backend/train_model.py text data/messages-*.parquet data/extra.csv --epochs 3 --jobs 8
+
+Rows are streamed in chunks from CSV/TSV, JSON lines or Parquet files,
+featurized with a stateless HashingVectorizer in parallel worker processes
+and fed to an SGD logistic-regression classifier with ``partial_fit``. A
+stable hash of each text sends a fixed share of rows to a holdout set that
+is never trained on and is evaluated, also in parallel, after every epoch,
+and another share to a calibration set: SGD's ``predict_proba`` is not a
+calibrated probability, so after training a sigmoid calibration is fitted on
+those rows and the cascade thresholds (CASCADE_THRESHOLD) compare against
+calibrated confidences.
+The model and vectorizer are written to ``TEXT_MODEL_PATH`` and
+``VECTORIZER_PATH``, where ``EmotionService`` picks them up at startup.
+"""
+import argparse
+import logging
+import sys
+import time
+import zlib
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+import joblib
+import numpy as np
 import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.svm import SVC
-from sklearn.model_selection import train_test_split
+import scipy.sparse as sp
+from joblib import Parallel, delayed
+from sklearn.calibration import CalibratedClassifierCV
+from sklearn.linear_model import SGDClassifier
 from sklearn.metrics import classification_report
-import joblib
 
-# This is a placeholder for actual model training
-# In a real application, you would have a dataset of text labeled with emotions
-
-def train_text_emotion_model():
-    # Sample data - replace with real dataset
-    data = {
-        'text': [
-            "I'm feeling so happy today!",
-            "This makes me really sad",
-            "I'm so angry about this situation",
-            "I feel calm and peaceful",
-            "I have so much energy right now",
-            "I'm in love with this song",
-            "What a wonderful day",
-            "I'm devastated by the news",
-            "This is so frustrating",
-            "I'm completely relaxed",
-            "Let's party all night",
-            "You're the love of my life"
-        ],
-        'emotion': [
-            'happy', 'sad', 'angry', 'calm', 'energetic', 'romantic',
-            'happy', 'sad', 'angry', 'calm', 'energetic', 'romantic'
-        ]
-    }
-    
-    df = pd.DataFrame(data)
-    
-    # Vectorize text
-    vectorizer = TfidfVectorizer()
-    X = vectorizer.fit_transform(df['text'])
-    y = df['emotion']
-    
-    # Split data
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-    
-    # Train model
-    model = SVC(kernel='linear', probability=True)
-    model.fit(X_train, y_train)
-    
-    # Evaluate
-    y_pred = model.predict(X_test)
-    print(classification_report(y_test, y_pred))
-    
-    # Save model and vectorizer
-    joblib.dump(model, 'models/text_emotion_model.joblib')
-    joblib.dump(vectorizer, 'models/tfidf_vectorizer.joblib')
-
-def train_history_emotion_model():
-    # Sample data - replace with real dataset of audio features labeled with emotions
-    # This would require a dataset of tracks with audio features and associated emotions
-    
-    # Placeholder implementation
+# Allow running as `python backend/train_model.py` from the project root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backend.app.models.emotion_models import EMOTIONS
+from backend.app.models.text_model import TextEmotionModel, create_vectorizer
+from backend.app.utils.config import settings
+
+logger = logging.getLogger("train_model")
+
+# Used when no corpus is given, so the pipeline can be tried end to end
+SAMPLE_DATA = {
+    'text': [
+        "I'm feeling so happy today!",
+        "This makes me really sad",
+        "I'm so angry about this situation",
+        "I feel calm and peaceful",
+        "I have so much energy right now",
+        "I'm in love with this song",
+        "What a wonderful day",
+        "I'm devastated by the news",
+        "This is so frustrating",
+        "I'm completely relaxed",
+        "Let's party all night",
+        "You're the love of my life"
+    ],
+    'emotion': [
+        'happy', 'sad', 'angry', 'calm', 'energetic', 'romantic',
+        'happy', 'sad', 'angry', 'calm', 'energetic', 'romantic'
+    ]
+}
+
+
+def read_chunks(path: Path, text_column: str, label_column: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """Yield (text, label) frames of at most ``chunk_size`` rows without loading the whole file"""
+    columns = [text_column, label_column]
+    suffix = path.suffix.lower()
+    if suffix in (".csv", ".tsv"):
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunk_size, sep="\t" if suffix == ".tsv" else ",")
+    elif suffix in (".jsonl", ".ndjson", ".json"):
+        for chunk in pd.read_json(path, lines=True, chunksize=chunk_size):
+            yield chunk[columns]
+    elif suffix == ".parquet":
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Reading Parquet needs pyarrow: pip install pyarrow") from e
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+    else:
+        raise ValueError(f"Unsupported corpus format: {path}")
+
+
+def iter_corpus(paths: List[Path], text_column: str, label_column: str, chunk_size: int) -> Iterator[Tuple[List[str], np.ndarray]]:
+    """Clean (texts, labels) chunks across every input; rows with unknown labels are dropped"""
+    if not paths:
+        yield list(SAMPLE_DATA["text"]), np.array(SAMPLE_DATA["emotion"])
+        return
+    known = set(EMOTIONS)
+    for path in paths:
+        for chunk in read_chunks(path, text_column, label_column, chunk_size):
+            texts = chunk[text_column].astype(str)
+            labels = chunk[label_column].astype(str).str.strip().str.lower()
+            keep = labels.isin(known) & (texts.str.strip() != "")
+            if keep.any():
+                yield texts[keep].tolist(), labels[keep].to_numpy()
+
+
+def _buckets(texts: List[str]) -> np.ndarray:
+    return np.fromiter((zlib.crc32(t.encode("utf-8")) % 10000 for t in texts), dtype=np.int64, count=len(texts))
+
+
+def holdout_mask(texts: List[str], holdout_percent: float) -> np.ndarray:
+    """Stable split: the same text always lands on the same side, across runs and epochs"""
+    return _buckets(texts) < holdout_percent * 100
+
+
+def calibration_mask(texts: List[str], holdout_percent: float, calibration_percent: float) -> np.ndarray:
+    """The next stable share of rows after the holdout, kept out of training for calibration"""
+    buckets = _buckets(texts)
+    return (buckets >= holdout_percent * 100) & (buckets < (holdout_percent + calibration_percent) * 100)
+
+
+def _frozen(classifier):
+    """An already fitted classifier, for CalibratedClassifierCV to calibrate without refitting"""
+    try:
+        from sklearn.frozen import FrozenEstimator
+    except ImportError:  # scikit-learn < 1.6
+        return {"estimator": classifier, "cv": "prefit"}
+    return {"estimator": FrozenEstimator(classifier)}
+
+
+def _vectorize(vectorizer, texts: List[str]) -> sp.csr_matrix:
+    return vectorizer.transform(texts)
+
+
+def _confusion(classifier, vectorizer, texts: List[str], labels: np.ndarray) -> np.ndarray:
+    predicted = classifier.predict(vectorizer.transform(texts))
+    index = {e: i for i, e in enumerate(EMOTIONS)}
+    matrix = np.zeros((len(EMOTIONS), len(EMOTIONS)), dtype=np.int64)
+    np.add.at(matrix, ([index[l] for l in labels], [index[p] for p in predicted]), 1)
+    return matrix
+
+
+def _split(items, parts: int):
+    size = max(1, -(-len(items) // parts))
+    return [(start, start + size) for start in range(0, len(items), size)]
+
+
+class Trainer:
+    def __init__(self, paths: List[Path], text_column: str = "text", label_column: str = "emotion",
+                 chunk_size: int = 100_000, jobs: int = -1, holdout_percent: float = 5.0,
+                 calibration_percent: float = 2.0, calibration_rows: int = 200_000,
+                 n_features: int = 2 ** 20, ngram_max: int = 2, alpha: float = 1e-6, seed: int = 42):
+        self.paths = paths
+        self.text_column = text_column
+        self.label_column = label_column
+        self.chunk_size = chunk_size
+        self.jobs = joblib.effective_n_jobs(jobs)
+        self.holdout_percent = holdout_percent
+        self.calibration_percent = calibration_percent
+        self.calibration_rows = calibration_rows
+        self.vectorizer = create_vectorizer(n_features, ngram_max)
+        self.classifier = SGDClassifier(loss="log_loss", alpha=alpha, random_state=seed, average=True)
+        self.calibrated = None
+
+    def chunks(self):
+        return iter_corpus(self.paths, self.text_column, self.label_column, self.chunk_size)
+
+    def _vectorize_parallel(self, parallel, texts: List[str]) -> sp.csr_matrix:
+        if self.jobs == 1 or len(texts) < 1000:
+            return self.vectorizer.transform(texts)
+        parts = parallel(delayed(_vectorize)(self.vectorizer, texts[a:b]) for a, b in _split(texts, self.jobs))
+        return sp.vstack(parts, format="csr")
+
+    def train_epoch(self, parallel, epoch: int) -> int:
+        rows = 0
+        started = time.perf_counter()
+        for texts, labels in self.chunks():
+            train = ~holdout_mask(texts, self.holdout_percent) & ~calibration_mask(
+                texts, self.holdout_percent, self.calibration_percent
+            )
+            if not train.any():
+                continue
+            train_texts = [t for t, keep in zip(texts, train) if keep]
+            # SGD is order-sensitive; shuffle within the chunk so sorted corpora still train well
+            order = np.random.permutation(len(train_texts))
+            features = self._vectorize_parallel(parallel, train_texts)[order]
+            self.classifier.partial_fit(features, labels[train][order], classes=EMOTIONS)
+            rows += len(train_texts)
+            logger.info(f"epoch {epoch}: {rows} rows ({rows / (time.perf_counter() - started):.0f} rows/s)")
+        return rows
+
+    def evaluate(self, parallel) -> Optional[np.ndarray]:
+        matrix = np.zeros((len(EMOTIONS), len(EMOTIONS)), dtype=np.int64)
+        for texts, labels in self.chunks():
+            held = holdout_mask(texts, self.holdout_percent)
+            if not held.any():
+                continue
+            held_texts = [t for t, keep in zip(texts, held) if keep]
+            held_labels = labels[held]
+            for part in parallel(
+                delayed(_confusion)(self.classifier, self.vectorizer, held_texts[a:b], held_labels[a:b])
+                for a, b in _split(held_texts, self.jobs)
+            ):
+                matrix += part
+        return matrix if matrix.sum() else None
+
+    def calibrate(self, parallel):
+        """Sigmoid-calibrated classifier fitted on the calibration rows, or None if there are too few"""
+        texts, labels = [], []
+        for chunk_texts, chunk_labels in self.chunks():
+            keep = calibration_mask(chunk_texts, self.holdout_percent, self.calibration_percent)
+            texts += [t for t, k in zip(chunk_texts, keep) if k]
+            labels += chunk_labels[keep].tolist()
+            if len(texts) >= self.calibration_rows:
+                break
+        texts, labels = texts[:self.calibration_rows], labels[:self.calibration_rows]
+        counts = {e: labels.count(e) for e in EMOTIONS}
+        if min(counts.values()) < 2:
+            logger.warning(f"Not calibrating: too few calibration rows per emotion ({counts})")
+            return None
+        calibrated = CalibratedClassifierCV(method="sigmoid", **_frozen(self.classifier))
+        calibrated.fit(self._vectorize_parallel(parallel, texts), np.array(labels))
+        logger.info(f"Calibrated probabilities on {len(texts)} rows")
+        return calibrated
+
+    def run(self, epochs: int) -> dict:
+        metrics = {}
+        with Parallel(n_jobs=self.jobs) as parallel:
+            for epoch in range(1, epochs + 1):
+                rows = self.train_epoch(parallel, epoch)
+                if not rows:
+                    raise ValueError("No training rows: check the input files and column names")
+                matrix = self.evaluate(parallel)
+                if matrix is None:
+                    logger.info(f"epoch {epoch}: no holdout rows")
+                    continue
+                accuracy = float(np.trace(matrix) / matrix.sum())
+                logger.info(f"epoch {epoch}: holdout accuracy {accuracy:.4f} over {int(matrix.sum())} rows")
+                metrics = {"epoch": epoch, "train_rows": rows, "holdout_rows": int(matrix.sum()),
+                           "holdout_accuracy": accuracy, "confusion": matrix.tolist()}
+            self.calibrated = self.calibrate(parallel)
+        metrics["calibrated"] = self.calibrated is not None
+        return metrics
+
+
+def report(confusion: List[List[int]]):
+    # Expand the confusion matrix back into label pairs for sklearn's report
+    y_true, y_pred = [], []
+    for i, row in enumerate(confusion):
+        for j, count in enumerate(row):
+            y_true += [EMOTIONS[i]] * count
+            y_pred += [EMOTIONS[j]] * count
+    print(classification_report(y_true, y_pred, labels=EMOTIONS, zero_division=0))
+
+
+def train_text_emotion_model(args):
+    if not args.inputs and (args.model_path is None or args.vectorizer_path is None):
+        # The sample is a smoke test; it must never replace the model the app serves
+        raise SystemExit(
+            "No corpus given: training on the built-in sample needs explicit --model-path and --vectorizer-path"
+        )
+    model_path = args.model_path or settings.TEXT_MODEL_PATH
+    vectorizer_path = args.vectorizer_path or settings.VECTORIZER_PATH
+    trainer = Trainer(
+        [Path(p) for p in args.inputs],
+        text_column=args.text_column,
+        label_column=args.label_column,
+        chunk_size=args.chunk_size,
+        jobs=args.jobs,
+        holdout_percent=args.holdout_percent,
+        calibration_percent=args.calibration_percent,
+        calibration_rows=args.calibration_rows,
+        n_features=2 ** args.hash_bits,
+        ngram_max=args.ngram_max,
+        alpha=args.alpha,
+    )
+    started = time.perf_counter()
+    metrics = trainer.run(args.epochs)
+    metrics["seconds"] = round(time.perf_counter() - started, 1)
+    if metrics.get("confusion"):
+        report(metrics["confusion"])
+
+    version = args.version or time.strftime("%Y%m%d%H%M%S")
+    model = TextEmotionModel(trainer.vectorizer, trainer.calibrated or trainer.classifier, version, metrics)
+    model.save(model_path, vectorizer_path)
+    print(f"Saved text emotion model {version} to {model_path} and {vectorizer_path}")
+
+
+def train_history_emotion_model(args):
+    # Placeholder until there is a dataset of audio features labelled with emotions;
+    # history predictions use the feature profiles in emotion_models.py meanwhile
     print("This would train a model to predict emotion from audio features")
-    
-    # Save placeholder model
-    joblib.dump("placeholder", 'models/history_emotion_model.joblib')
+    joblib.dump("placeholder", settings.HISTORY_MODEL_PATH)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the emotion models")
+    commands = parser.add_subparsers(dest="command")
+
+    text = commands.add_parser("text", help="streaming training of the text emotion model")
+    text.add_argument("inputs", nargs="*", help=".csv/.tsv, .jsonl/.ndjson or .parquet files (default: built-in sample)")
+    text.add_argument("--text-column", default="text")
+    text.add_argument("--label-column", default="emotion")
+    text.add_argument("--chunk-size", type=int, default=100_000, help="rows read and trained per step")
+    text.add_argument("--epochs", type=int, default=1)
+    text.add_argument("--jobs", type=int, default=-1, help="worker processes for vectorizing/evaluation")
+    text.add_argument("--holdout-percent", type=float, default=5.0)
+    text.add_argument("--calibration-percent", type=float, default=2.0,
+                      help="share of rows kept out of training to calibrate probabilities")
+    text.add_argument("--calibration-rows", type=int, default=200_000, help="most calibration rows used")
+    text.add_argument("--hash-bits", type=int, default=20, help="log2 of the hashed feature space")
+    text.add_argument("--ngram-max", type=int, default=2)
+    text.add_argument("--alpha", type=float, default=1e-6, help="L2 regularization strength")
+    text.add_argument("--version", help="model version (defaults to a timestamp)")
+    text.add_argument("--model-path", type=Path, help="default: TEXT_MODEL_PATH (required without inputs)")
+    text.add_argument("--vectorizer-path", type=Path, help="default: VECTORIZER_PATH (required without inputs)")
+    text.set_defaults(func=train_text_emotion_model)
+
+    history = commands.add_parser("history", help="placeholder history model")
+    history.set_defaults(func=train_history_emotion_model)
+
+    args = parser.parse_args()
+    if args.command is None:
+        args = parser.parse_args(["text"])
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    args.func(args)
+
 
 if __name__ == "__main__":
-    train_text_emotion_model()
-    train_history_emotion_model()
\ No newline at end of file
+    main()
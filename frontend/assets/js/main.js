@@ -24,8 +24,9 @@ document.addEventListener('DOMContentLoaded', function () {
     let isPlaying = false;
     let progressInterval = null;
 
-    // Spotify OAuth
-    let spotifyAccessToken = localStorage.getItem('spotify_access_token');
+    // Spotify OAuth: tokens stay on the server behind an HttpOnly session cookie
+    let spotifyConnected = false;
+    localStorage.removeItem('spotify_access_token');
 
     // Check for Spotify callback on page load
     checkForSpotifyCallback();
@@ -49,7 +50,7 @@ document.addEventListener('DOMContentLoaded', function () {
     });
 
     useHistoryBtn.addEventListener('click', function () {
-        if (spotifyAccessToken) {
+        if (spotifyConnected) {
             predictEmotionFromHistory();
         } else {
             showAlert('Please connect your Spotify account first');
@@ -57,7 +58,7 @@ document.addEventListener('DOMContentLoaded', function () {
     });
 
     spotifyAuthBtn.addEventListener('click', function () {
-        if (spotifyAccessToken) {
+        if (spotifyConnected) {
             disconnectSpotify();
         } else {
             initiateSpotifyAuth();
@@ -74,7 +75,6 @@ document.addEventListener('DOMContentLoaded', function () {
 
     function checkForSpotifyCallback() {
         const urlParams = new URLSearchParams(window.location.search);
-        const code = urlParams.get('code');
         const error = urlParams.get('error');
 
         if (error) {
@@ -83,27 +83,34 @@ document.addEventListener('DOMContentLoaded', function () {
             return;
         }
 
-        if (code && !spotifyAccessToken) {
-            fetch(`/spotify-callback?code=${code}`)
-                .then(handleResponse)
-                .then(data => {
-                    if (data.access_token) {
-                        spotifyAccessToken = data.access_token;
-                        localStorage.setItem('spotify_access_token', spotifyAccessToken);
-                        window.history.replaceState({}, document.title, window.location.pathname);
-                        updateAuthUI();
-                        showAlert('Successfully connected to Spotify!', 'success');
-                    }
-                })
-                .catch(error => {
-                    console.error('Spotify callback error:', error);
-                    showAlert('Failed to connect with Spotify');
-                });
+        const justConnected = urlParams.get('spotify') === 'connected';
+        if (justConnected) {
+            window.history.replaceState({}, document.title, window.location.pathname);
         }
+
+        fetch('/session', { credentials: 'same-origin' })
+            .then(handleResponse)
+            .then(data => {
+                spotifyConnected = data.connected;
+                updateAuthUI();
+                if (justConnected && spotifyConnected) {
+                    showAlert('Successfully connected to Spotify!', 'success');
+                }
+            })
+            .catch(error => console.error('Session check error:', error));
+    }
+
+    function disconnectSpotify() {
+        fetch('/spotify-logout', { method: 'POST', credentials: 'same-origin' })
+            .catch(error => console.error('Spotify logout error:', error))
+            .finally(() => {
+                spotifyConnected = false;
+                updateAuthUI();
+            });
     }
 
     function updateAuthUI() {
-        if (spotifyAccessToken) {
+        if (spotifyConnected) {
             spotifyAuthBtn.innerHTML = '<i class="fab fa-spotify"></i> Disconnect Spotify';
             spotifyAuthBtn.classList.add('connected');
             useHistoryBtn.style.display = 'flex';
@@ -152,11 +159,7 @@ document.addEventListener('DOMContentLoaded', function () {
 
     function predictEmotionFromHistory() {
         showLoading(true);
-        fetch('/user-history', {
-            headers: {
-                'Authorization': `Bearer ${spotifyAccessToken}`
-            }
-        })
+        fetch('/user-history', { credentials: 'same-origin' })
             .then(handleResponse)
             .then(data => {
                 if (data.history) {
@@ -1,15 +1,16 @@
-from setuptools import setup, find_packages
+from setuptools import setup, find_namespace_packages
 
 setup(
     name="mood-music-recommender",
     version="0.1",
-    packages=find_packages(where="backend"),
-    package_dir={"": "backend"},
+    packages=find_namespace_packages(include=["backend.app", "backend.app.*"]),
+    package_data={"backend.app": ["data/*.json"]},
     install_requires=[
         "fastapi>=0.68.0",
-        "uvicorn>=0.15.0",
+        "uvicorn>=0.22.0",
         "python-dotenv>=0.19.0",
         "requests>=2.26.0",
+        "httpx>=0.23.0",
         "numpy>=1.21.0",
         "scikit-learn>=1.0.0",
         "joblib>=1.0.0",
@@ -18,6 +19,21 @@ setup(
         "pydantic>=1.8.0",
     ],
     extras_require={
+        "onnx": [
+            "onnx>=1.14.0",
+            "onnxruntime>=1.15.0",
+        ],
+        "redis": [
+            "redis>=4.5.0",
+        ],
+        "http": [
+            "orjson>=3.8.0",
+            "brotli>=1.0.9",
+        ],
+        "train": [
+            "pandas>=1.3.0",
+            "pyarrow>=10.0.0",
+        ],
         "dev": [
             "pytest>=6.0.0",
             "black>=21.0",
@@ -26,7 +42,7 @@ setup(
     },
     entry_points={
         "console_scripts": [
-            "mood-music=app.main:main",
+            "mood-music=backend.app.launcher:main",
         ],
     },
 )
\ No newline at end of file